@@ -0,0 +1,6 @@
+"""
+Benchmarks for the Coach Joe FFmpeg Processor
+
+Run from the repository root, e.g.:
+    python -m benchmarks.encoder_profiles --duration 20
+"""
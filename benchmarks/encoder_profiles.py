@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Encoder profile benchmark
+
+Renders the standard Coach Joe graph (scaled B-roll + overlay + ducked
+audio) from synthetic fixtures once per encoding profile and reports
+throughput, CPU cost, output size and quality against a lossless reference.
+
+Usage:
+    python -m benchmarks.encoder_profiles [--profiles draft standard] [--duration 15]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coach_joe_ffmpeg_processor import CoachJoeVideoProcessor, ENCODING_PROFILES
+from benchmarks.fixtures import generate_fixtures
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Visually lossless render used as the quality reference
+REFERENCE_PROFILE = {
+    'preset': 'ultrafast',
+    'crf': 0,
+    'tune': None,
+    'x264_params': None,
+    'audio_bitrate': '192k',
+}
+
+
+def children_cpu_seconds():
+    """User + system CPU time consumed by finished child processes"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def available_filters():
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-filters'], capture_output=True, text=True)
+    return result.stdout
+
+
+def render(processor, fixtures, output_file, duration, profile, threads):
+    """Render one output and return wall time and CPU seconds"""
+    cmd = processor.build_ffmpeg_command(
+        audio_file=fixtures['audio'],
+        video_files=[fixtures['video']],
+        image_files=[fixtures['image']],
+        output_file=output_file,
+        total_duration=duration,
+        video_volume_reduction=90,
+        video_infos=[processor.probe_media(fixtures['video'])],
+        encoding_profile=profile,
+        threads=threads
+    )
+    cpu_before = children_cpu_seconds()
+    start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise Exception(f"Render failed: {result.stderr[-2000:]}")
+    return wall, children_cpu_seconds() - cpu_before
+
+
+def measure_quality(distorted, reference, filters):
+    """SSIM (and VMAF when ffmpeg has libvmaf) of distorted vs reference"""
+    scores = {'ssim': None, 'vmaf': None}
+    
+    result = subprocess.run([
+        'ffmpeg', '-hide_banner', '-i', distorted, '-i', reference,
+        '-lavfi', '[0:v][1:v]ssim', '-f', 'null', '-'
+    ], capture_output=True, text=True)
+    match = re.search(r'SSIM .*All:([0-9.]+)', result.stderr)
+    if match:
+        scores['ssim'] = float(match.group(1))
+    
+    if 'libvmaf' in filters:
+        result = subprocess.run([
+            'ffmpeg', '-hide_banner', '-i', distorted, '-i', reference,
+            '-lavfi', '[0:v][1:v]libvmaf', '-f', 'null', '-'
+        ], capture_output=True, text=True)
+        match = re.search(r'VMAF score: ([0-9.]+)', result.stderr)
+        if match:
+            scores['vmaf'] = float(match.group(1))
+    
+    return scores
+
+
+def run_benchmark(profiles, duration, work_dir, threads=0):
+    """Benchmark each profile and return a list of result dicts"""
+    fixtures = generate_fixtures(os.path.join(work_dir, 'fixtures'), duration)
+    processor = CoachJoeVideoProcessor()
+    filters = available_filters()
+    total_duration = duration + 1
+    frames = int(total_duration * 30)
+    
+    reference = os.path.join(work_dir, 'reference.mp4')
+    logger.info("Rendering lossless reference")
+    render(processor, fixtures, reference, total_duration, REFERENCE_PROFILE, threads)
+    
+    results = []
+    for name in profiles:
+        output_file = os.path.join(work_dir, f'{name}.mp4')
+        logger.info(f"Benchmarking profile '{name}'")
+        wall, cpu = render(processor, fixtures, output_file, total_duration, name, threads)
+        quality = measure_quality(output_file, reference, filters)
+        results.append({
+            'profile': name,
+            'settings': ENCODING_PROFILES[name],
+            'wall_seconds': round(wall, 3),
+            'cpu_seconds': round(cpu, 3),
+            'fps': round(frames / wall, 2),
+            'realtime_factor': round(total_duration / wall, 2),
+            'output_bytes': os.path.getsize(output_file),
+            'ssim': quality['ssim'],
+            'vmaf': quality['vmaf'],
+        })
+    return results
+
+
+def print_table(results):
+    header = f"{'profile':<10} {'wall s':>8} {'cpu s':>8} {'fps':>8} {'x rt':>6} {'bytes':>11} {'ssim':>8} {'vmaf':>7}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        ssim = f"{r['ssim']:.4f}" if r['ssim'] is not None else 'n/a'
+        vmaf = f"{r['vmaf']:.2f}" if r['vmaf'] is not None else 'n/a'
+        print(f"{r['profile']:<10} {r['wall_seconds']:>8.2f} {r['cpu_seconds']:>8.2f} {r['fps']:>8.1f} "
+              f"{r['realtime_factor']:>6.2f} {r['output_bytes']:>11} {ssim:>8} {vmaf:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Coach Joe encoding profiles")
+    parser.add_argument('--profiles', nargs='+', default=list(ENCODING_PROFILES),
+                        choices=list(ENCODING_PROFILES))
+    parser.add_argument('--duration', type=int, default=15, help="Voiceover length in seconds")
+    parser.add_argument('--threads', type=int, default=0, help="Encoder threads (0 = auto)")
+    parser.add_argument('--work-dir', default='bench_work')
+    parser.add_argument('--output', default='bench_output.json', help="Where to write JSON results")
+    args = parser.parse_args()
+    
+    results = run_benchmark(args.profiles, args.duration, args.work_dir, args.threads)
+    
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration': args.duration,
+            'threads': args.threads,
+            'cpu_count': os.cpu_count(),
+            'results': results
+        }, f, indent=2)
+    
+    print_table(results)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
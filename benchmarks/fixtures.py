@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Synthetic media fixtures generated with FFmpeg's lavfi sources
+"""
+
+import os
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def run_ffmpeg(args):
+    """Run an ffmpeg command quietly, raising on failure"""
+    cmd = ['ffmpeg', '-y', '-v', 'error'] + args
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Fixture generation failed: {result.stderr}")
+
+
+def generate_fixtures(output_dir, duration=15):
+    """
+    Generate a voiceover, a landscape B-roll clip and an overlay image
+    
+    Args:
+        output_dir (str): Directory to write fixtures into
+        duration (int): Voiceover length in seconds
+    
+    Returns:
+        dict: audio, video and image file paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    fixtures = {
+        'audio': os.path.join(output_dir, 'voice.mp3'),
+        'video': os.path.join(output_dir, 'broll.mp4'),
+        'image': os.path.join(output_dir, 'overlay.png'),
+    }
+    
+    if not os.path.exists(fixtures['audio']):
+        logger.info(f"Generating {duration}s voiceover fixture")
+        run_ffmpeg([
+            '-f', 'lavfi', '-i', f'sine=frequency=220:beep_factor=4:duration={duration}',
+            '-c:a', 'libmp3lame', '-b:a', '128k', fixtures['audio']
+        ])
+    
+    if not os.path.exists(fixtures['video']):
+        # Landscape 1080p with motion and audio, like typical phone B-roll
+        logger.info(f"Generating {duration + 2}s B-roll fixture")
+        run_ffmpeg([
+            '-f', 'lavfi', '-i', f'testsrc2=size=1920x1080:rate=30:duration={duration + 2}',
+            '-f', 'lavfi', '-i', f'anoisesrc=color=pink:amplitude=0.3:duration={duration + 2}',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', '128k', '-shortest', '-movflags', '+faststart',
+            fixtures['video']
+        ])
+    
+    if not os.path.exists(fixtures['image']):
+        # Large RGBA still, like the marketing PNGs used for overlays
+        logger.info("Generating overlay image fixture")
+        run_ffmpeg([
+            '-f', 'lavfi', '-i', 'mandelbrot=size=1600x1600',
+            '-vf', 'format=rgba', '-frames:v', '1', fixtures['image']
+        ])
+    
+    return fixtures
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test and regression benchmark
+
+Generates synthetic fixtures, serves them from a local HTTP stand-in
+(benchmarks.server) and submits whole jobs through the cloud-function
+handler, process_video or the Flask /process route at one or more
+concurrency levels. Each run records p50/p95/p99 latency, throughput, peak
+RSS (this process plus its FFmpeg children) and output size, and is compared
+with a JSON baseline from an earlier run; a regression beyond --tolerance
+makes the command exit with status 1.
+
+Usage:
+    python -m benchmarks.load_test [--targets handler process_video flask]
+        [--scenarios voice_only broll full] [--concurrency 1 2] [--requests 6]
+        [--baseline bench_load_baseline.json] [--update-baseline]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+import subprocess
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import coach_joe_ffmpeg_processor
+from coach_joe_ffmpeg_processor import get_processor, handler as cloud_handler
+from benchmarks.fixtures import generate_fixtures
+from benchmarks.server import FixtureServer
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+TARGETS = ('handler', 'process_video', 'flask')
+
+# Fixtures each scenario puts on the timeline
+SCENARIOS = {
+    'voice_only': ('audio',),
+    'broll': ('audio', 'video'),
+    'full': ('audio', 'video', 'image'),
+}
+
+# Result fields compared with the baseline and whether a higher value is worse
+BASELINE_METRICS = {
+    'p50_seconds': True,
+    'p95_seconds': True,
+    'p99_seconds': True,
+    'throughput_per_minute': False,
+    'peak_rss_mb': True,
+}
+
+
+def percentile(values, pct):
+    """Linearly interpolated percentile (0-100) of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def rss_bytes(pid):
+    """Resident set size of a process from /proc (0 if it is gone)"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def child_pids(pid):
+    """Direct children of pid (the FFmpeg processes of running jobs)"""
+    children = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # The command name may contain spaces, the ppid follows it
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(name))
+    return children
+
+
+class RssSampler:
+    """
+    Track the peak combined RSS of this process and its children
+
+    Falls back to this process's own ru_maxrss where /proc is not available.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        pid = os.getpid()
+        total = rss_bytes(pid) + sum(rss_bytes(child) for child in child_pids(pid))
+        self.peak = max(self.peak, total)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.isdir('/proc/self'):
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        else:
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return False
+
+
+class FlaskTarget:
+    """The Flask app from runpod_handler served on a local port"""
+
+    def __init__(self):
+        # Imported here: runpod_handler needs the runpod SDK installed
+        import requests
+        from werkzeug.serving import make_server
+        from runpod_handler import create_app
+
+        self.server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/process"
+        self.session = requests.Session()
+
+    def __call__(self, config):
+        response = self.session.post(self.url, json=config, timeout=config.get('timeout', 600) + 60)
+        return response.json()
+
+    def close(self):
+        self.session.close()
+        self.server.shutdown()
+
+
+def make_target(name):
+    """Return (submit(config) -> result dict, close()) for a target"""
+    if name == 'process_video':
+        return get_processor().process_video, lambda: None
+    if name == 'handler':
+        return lambda config: json.loads(cloud_handler(config)['body']), lambda: None
+    if name == 'flask':
+        target = FlaskTarget()
+        return target, target.close
+    raise ValueError(f"Unknown target '{name}' (expected one of: {', '.join(TARGETS)})")
+
+
+def scenario_config(scenario, urls, profile, render_cache, upload):
+    """Job config for a scenario from the served fixture URLs"""
+    parts = SCENARIOS[scenario]
+    config = {
+        'audio_url': urls['audio'],
+        'video_urls': [urls['video']] if 'video' in parts else [],
+        'image_urls': [urls['image']] if 'image' in parts else [],
+        'encoding_profile': profile,
+        'upload_mode': 'stream' if upload else 'none',
+        # Identical jobs would otherwise be served from the render cache
+        'bypass_render_cache': not render_cache,
+    }
+    return config
+
+
+def run_load(submit, config, requests, concurrency):
+    """Submit requests copies of config, concurrency at a time"""
+    latencies = []
+    outcomes = []
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            result = submit(dict(config))
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        latencies.append(time.perf_counter() - start)
+        outcomes.append(result)
+
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(requests)))
+        wall = time.perf_counter() - start
+
+    succeeded = [r for r in outcomes if r.get('success')]
+    for result in outcomes:
+        if not result.get('success'):
+            logger.warning(f"Job failed: {result.get('error')}")
+    render_paths = {}
+    for result in succeeded:
+        path = result.get('render_path', 'unknown')
+        render_paths[path] = render_paths.get(path, 0) + 1
+    sizes = [r['file_size'] for r in succeeded if r.get('file_size')]
+    # Largest FFmpeg footprint any one job reported (metrics.memory)
+    job_peaks = [((r.get('metrics') or {}).get('memory') or {}).get('peak_rss_mb') for r in succeeded]
+    job_peaks = [peak for peak in job_peaks if peak]
+
+    return {
+        'requests': requests,
+        'failures': requests - len(succeeded),
+        'wall_seconds': round(wall, 3),
+        'p50_seconds': round(percentile(latencies, 50), 3),
+        'p95_seconds': round(percentile(latencies, 95), 3),
+        'p99_seconds': round(percentile(latencies, 99), 3),
+        'mean_seconds': round(sum(latencies) / len(latencies), 3),
+        'throughput_per_minute': round(len(succeeded) / wall * 60, 2),
+        'peak_rss_mb': round(sampler.peak / 1024 ** 2, 1),
+        'job_peak_rss_mb': max(job_peaks) if job_peaks else None,
+        'output_bytes': round(sum(sizes) / len(sizes)) if sizes else None,
+        'render_paths': render_paths,
+    }
+
+
+def run_benchmark(targets, scenarios, concurrency_levels, requests, duration, work_dir,
+                  profile='draft', warmup=1, render_cache=False, upload=False):
+    """Run every target x scenario x concurrency combination and return result dicts"""
+    fixtures = generate_fixtures(os.path.join(work_dir, 'fixtures'), duration)
+    server = FixtureServer(os.path.join(work_dir, 'fixtures')).start()
+    urls = {name: server.url(path) for name, path in fixtures.items()}
+    if upload:
+        # stream_upload reads the storage URL at call time
+        coach_joe_ffmpeg_processor.SUPABASE_STORAGE_URL = f"{server.base_url}/storage/v1"
+
+    results = []
+    try:
+        for target in targets:
+            submit, close = make_target(target)
+            try:
+                for scenario in scenarios:
+                    config = scenario_config(scenario, urls, profile, render_cache, upload)
+                    # Warm the asset, probe and derived-media caches as a live worker would be
+                    for _ in range(warmup):
+                        submit(dict(config))
+                    for concurrency in concurrency_levels:
+                        print(f"{target} / {scenario} / concurrency {concurrency}: {requests} jobs", flush=True)
+                        results.append({
+                            'target': target,
+                            'scenario': scenario,
+                            'concurrency': concurrency,
+                            **run_load(submit, config, requests, concurrency),
+                        })
+            finally:
+                close()
+    finally:
+        server.stop()
+    return results
+
+
+def result_key(result):
+    return f"{result['target']}/{result['scenario']}/c{result['concurrency']}"
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline run
+
+    Returns:
+        list: (key, metric, baseline value, current value, change) for each
+            metric that got worse by more than tolerance (a fraction)
+    """
+    previous = {result_key(r): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if not before:
+            continue
+        for metric, higher_is_worse in BASELINE_METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append((result_key(result), metric, old, new, change))
+        if result['failures'] > before.get('failures', 0):
+            regressions.append((result_key(result), 'failures', before.get('failures', 0),
+                                result['failures'], None))
+    return regressions
+
+
+def ffmpeg_version():
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+        return result.stdout.split('\n', 1)[0]
+    except OSError:
+        return None
+
+
+def print_table(results):
+    header = (f"{'target/scenario/concurrency':<32} {'ok':>5} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+              f"{'jobs/min':>9} {'rss MB':>8} {'job MB':>8} {'bytes':>10}  paths")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        paths = ','.join(f"{path}:{count}" for path, count in r['render_paths'].items())
+        print(f"{result_key(r):<32} {r['requests'] - r['failures']:>2}/{r['requests']:<2} "
+              f"{r['p50_seconds']:>7.2f} {r['p95_seconds']:>7.2f} {r['p99_seconds']:>7.2f} "
+              f"{r['throughput_per_minute']:>9.2f} {r['peak_rss_mb']:>8.1f} {r['job_peak_rss_mb'] or 0:>8.1f} {r['output_bytes'] or 0:>10}  {paths}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Coach Joe processor end to end")
+    parser.add_argument('--targets', nargs='+', default=['handler'], choices=TARGETS)
+    parser.add_argument('--scenarios', nargs='+', default=['voice_only', 'full'], choices=list(SCENARIOS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2],
+                        help="Jobs in flight at once (one run per value)")
+    parser.add_argument('--requests', type=int, default=6, help="Jobs per run")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed jobs per target and scenario")
+    parser.add_argument('--duration', type=int, default=10, help="Voiceover length in seconds")
+    parser.add_argument('--profile', default='draft', help="Encoding profile of every job")
+    parser.add_argument('--render-cache', action='store_true',
+                        help="Let repeated jobs hit the render cache instead of re-rendering")
+    parser.add_argument('--upload', action='store_true',
+                        help="Stream outputs to the stand-in's storage endpoint")
+    parser.add_argument('--log-level', default='WARNING', help="Processor log level during the runs")
+    parser.add_argument('--work-dir', default='bench_work')
+    parser.add_argument('--output', default='bench_load.json', help="Where to write JSON results")
+    parser.add_argument('--baseline', default='bench_load_baseline.json',
+                        help="Earlier results to compare against (written if missing)")
+    parser.add_argument('--update-baseline', action='store_true', help="Replace the baseline with this run")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Allowed fractional slowdown before a metric counts as a regression")
+    args = parser.parse_args()
+
+    # The processor logs every job at INFO
+    logging.getLogger().setLevel(args.log_level.upper())
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = run_benchmark(args.targets, args.scenarios, sorted(set(args.concurrency)), args.requests,
+                            args.duration, args.work_dir, args.profile, args.warmup,
+                            args.render_cache, args.upload)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'duration': args.duration,
+        'profile': args.profile,
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version(),
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print_table(results)
+    print(f"\nResults written to {args.output}")
+
+    regressions = []
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    else:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nRegressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for key, metric, old, new, change in regressions:
+                delta = f" ({change:+.0%})" if change is not None else ''
+                print(f"  {key} {metric}: {old} -> {new}{delta}")
+        else:
+            print(f"No regressions against {args.baseline}")
+
+    get_processor().cleanup()
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
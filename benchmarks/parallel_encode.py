@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Segment-parallel encoding benchmark
+
+Renders the same timeline from synthetic fixtures once with a single FFmpeg
+process and once per worker count with encode_parallel, and reports the
+wall-clock speedup of each parallel run over the single-process encode.
+
+Usage:
+    python -m benchmarks.parallel_encode [--workers 2 4] [--duration 90]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coach_joe_ffmpeg_processor import (
+    CoachJoeVideoProcessor, JobMetrics, ENCODING_PROFILES, DEFAULT_ENCODING_PROFILE
+)
+from benchmarks.fixtures import generate_fixtures
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def run_benchmark(worker_counts, duration, work_dir, profile=DEFAULT_ENCODING_PROFILE):
+    """Time a single-process render and one parallel render per worker count"""
+    fixtures = generate_fixtures(os.path.join(work_dir, 'fixtures'), duration)
+    processor = CoachJoeVideoProcessor()
+    total_duration = duration + 1
+    video_infos = [processor.probe_media(fixtures['video'])]
+    image_infos = [processor.probe_media(fixtures['image'])]
+
+    serial_output = os.path.join(work_dir, 'serial.mp4')
+    logger.info("Rendering with a single FFmpeg process")
+    cmd = processor.build_ffmpeg_command(
+        audio_file=fixtures['audio'],
+        video_files=[fixtures['video']],
+        image_files=[fixtures['image']],
+        image_infos=image_infos,
+        output_file=serial_output,
+        total_duration=total_duration,
+        video_volume_reduction=90,
+        video_infos=video_infos,
+        encoding_profile=profile
+    )
+    start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    serial_wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise Exception(f"Render failed: {result.stderr[-2000:]}")
+
+    results = [{
+        'workers': 1,
+        'segments': 1,
+        'wall_seconds': round(serial_wall, 3),
+        'speedup': 1.0,
+        'output_bytes': os.path.getsize(serial_output),
+    }]
+    for workers in worker_counts:
+        output_file = os.path.join(work_dir, f'parallel_{workers}.mp4')
+        logger.info(f"Rendering with {workers} parallel FFmpeg processes")
+        metrics = JobMetrics()
+        start = time.perf_counter()
+        processor.encode_parallel(
+            audio_file=fixtures['audio'],
+            video_files=[fixtures['video']],
+            video_infos=video_infos,
+            image_files=[fixtures['image']],
+            image_infos=image_infos,
+            output_file=output_file,
+            total_duration=total_duration,
+            video_volume_reduction=90,
+            normalized_video=False,
+            encoding_profile=profile,
+            workspace=work_dir,
+            metrics=metrics,
+            workers=workers
+        )
+        wall = time.perf_counter() - start
+        results.append({
+            'workers': workers,
+            'segments': metrics.encode['parallel']['segments'],
+            'wall_seconds': round(wall, 3),
+            'speedup': round(serial_wall / wall, 2),
+            'output_bytes': os.path.getsize(output_file),
+        })
+
+    processor.session.close()
+    return results
+
+
+def print_table(results):
+    header = f"{'workers':>7} {'segments':>8} {'wall s':>8} {'speedup':>8} {'bytes':>11}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['workers']:>7} {r['segments']:>8} {r['wall_seconds']:>8.2f} "
+              f"{r['speedup']:>8.2f} {r['output_bytes']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark segment-parallel encoding")
+    parser.add_argument('--workers', nargs='+', type=int, default=[2, os.cpu_count() or 1],
+                        help="Parallel FFmpeg process counts to compare")
+    parser.add_argument('--duration', type=int, default=90, help="Voiceover length in seconds")
+    parser.add_argument('--profile', default=DEFAULT_ENCODING_PROFILE, choices=list(ENCODING_PROFILES))
+    parser.add_argument('--work-dir', default='bench_work')
+    parser.add_argument('--output', default='bench_parallel.json', help="Where to write JSON results")
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = run_benchmark(sorted(set(args.workers)), args.duration, args.work_dir, args.profile)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration': args.duration,
+            'profile': args.profile,
+            'cpu_count': os.cpu_count(),
+            'results': results
+        }, f, indent=2)
+
+    print_table(results)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stand-in for asset and output storage
+
+Serves a fixture directory with HTTP Range and If-Range support (so resumed
+downloads and ffmpeg's own HTTP reads behave as they do against Supabase
+storage) and accepts POST/PUT uploads, counting and discarding the bytes.
+
+Usage:
+    python -m benchmarks.server bench_work/fixtures [--port 8767]
+"""
+
+import os
+import re
+import argparse
+import threading
+import logging
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class FixtureRequestHandler(SimpleHTTPRequestHandler):
+    """Static files with single-range GETs (and If-Range) plus a discarding upload endpoint"""
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        byte_range = self.headers.get('Range')
+        self.remaining = None
+        if not byte_range or not os.path.isfile(path):
+            return super().send_head()
+        # A range guarded by a stale validator gets the whole, current file
+        last_modified = self.date_time_string(int(os.path.getmtime(path)))
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range != last_modified:
+            return super().send_head()
+
+        match = re.match(r'bytes=(\d*)-(\d*)$', byte_range.strip())
+        size = os.path.getsize(path)
+        if not match or not (match.group(1) or match.group(2)):
+            self.send_error(416)
+            return None
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, size - int(match.group(2)))
+            end = size - 1
+        if start >= size or end < start:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.end_headers()
+            return None
+
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        self.remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        if self.remaining is None:
+            return super().copyfile(source, outputfile)
+        while self.remaining > 0:
+            chunk = source.read(min(64 * 1024, self.remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            self.remaining -= len(chunk)
+
+    def end_headers(self):
+        if self.command in ('GET', 'HEAD'):
+            self.send_header('Accept-Ranges', 'bytes')
+        super().end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        received = 0
+        while received < length:
+            chunk = self.rfile.read(min(64 * 1024, length - received))
+            if not chunk:
+                break
+            received += len(chunk)
+        self.server.record_upload(received)
+
+        body = b'{"Key": "uploaded"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_PUT = do_POST
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class FixtureServer:
+    """
+    Threaded HTTP server for a fixture directory, run in the background
+
+    Args:
+        directory (str): Directory to serve
+        host (str): Interface to bind
+        port (int): Port to bind (0 picks a free one)
+    """
+
+    def __init__(self, directory, host='127.0.0.1', port=0):
+        self.directory = os.path.abspath(directory)
+
+        def handler(*args, **kwargs):
+            return FixtureRequestHandler(*args, directory=self.directory, **kwargs)
+
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.uploads = 0
+        self.httpd.bytes_uploaded = 0
+        self.httpd.lock = threading.Lock()
+        self.httpd.record_upload = self._record_upload
+        self.thread = None
+
+    def _record_upload(self, size):
+        with self.httpd.lock:
+            self.httpd.uploads += 1
+            self.httpd.bytes_uploaded += size
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        """URL of a file inside the served directory (path relative to it)"""
+        return f"{self.base_url}/{os.path.relpath(os.path.abspath(path), self.directory)}"
+
+    def stats(self):
+        with self.httpd.lock:
+            return {'uploads': self.httpd.uploads, 'bytes_uploaded': self.httpd.bytes_uploaded}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Serving {self.directory} at {self.base_url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve benchmark fixtures over HTTP")
+    parser.add_argument('directory', help="Directory to serve")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8767)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FixtureServer(args.directory, args.host, args.port).start()
+    print(f"Serving {server.directory} at {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,185 +6,3134 @@ Handles video processing with audio, video, and image integration
 
 import os
 import json
+import math
+import signal
+import asyncio
 import subprocess
 import tempfile
+import hashlib
+import shutil
+import socket
+import threading
+import time
 import requests
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
 import base64
+import uuid
+from contextlib import contextmanager, nullcontext
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Maximum number of assets fetched in parallel for a single job
+MAX_DOWNLOAD_WORKERS = int(os.getenv('MAX_DOWNLOAD_WORKERS', '6'))
+
+# Download resilience: a stalled connection fails after the read timeout and
+# is retried with exponential backoff, resuming from the last byte received
+DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv('DOWNLOAD_CONNECT_TIMEOUT', '5'))
+DOWNLOAD_READ_TIMEOUT = float(os.getenv('DOWNLOAD_READ_TIMEOUT', '30'))
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', '4'))
+DOWNLOAD_BACKOFF = float(os.getenv('DOWNLOAD_BACKOFF', '0.5'))  # seconds, doubled per retry
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', str(1024 * 1024)))
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# Persistent asset cache shared by all jobs on this worker
+ASSET_CACHE_ENABLED = os.getenv('ASSET_CACHE_ENABLED', 'true').lower() == 'true'
+ASSET_CACHE_DIR = os.getenv('ASSET_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'coach_joe_asset_cache'))
+ASSET_CACHE_MAX_BYTES = int(os.getenv('ASSET_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))  # 5 GB
+# In-memory probe results, loudness measurements and file hashes kept per worker
+MEMO_CACHE_ENTRIES = int(os.getenv('MEMO_CACHE_ENTRIES', '1024'))
+
+# Pre-normalized (720x1280/30fps/yuv420p) B-roll intermediates; the same
+# cache holds the fast-path black segment and pre-scaled overlay images
+NORMALIZE_BROLL = os.getenv('NORMALIZE_BROLL', 'false').lower() == 'true'
+NORMALIZED_CACHE_DIR = os.getenv('NORMALIZED_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'coach_joe_normalized_cache'))
+NORMALIZED_CACHE_MAX_BYTES = int(os.getenv('NORMALIZED_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))  # 5 GB
+
+# Finished renders, so re-submitted identical jobs return the earlier output
+RENDER_CACHE_ENABLED = os.getenv('RENDER_CACHE_ENABLED', 'true').lower() == 'true'
+RENDER_CACHE_DIR = os.getenv('RENDER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'coach_joe_render_cache'))
+RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))  # 2 GB
+RENDER_CACHE_TTL = int(os.getenv('RENDER_CACHE_TTL', str(24 * 3600)))  # seconds
+
+# Supabase storage upload settings (SUPABASE_STORAGE_URL can point at a local stand-in)
+SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://wbrlglamhecvkcbifzls.supabase.co')
+SUPABASE_STORAGE_URL = os.getenv('SUPABASE_STORAGE_URL', f"{SUPABASE_URL}/storage/v1").rstrip('/')
+SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
+SUPABASE_VIDEO_BUCKET = os.getenv('SUPABASE_VIDEO_BUCKET', 'coach-joe-videos')
+# 'stream' uploads the output to storage, 'none' only reports the target URL
+UPLOAD_MODE = os.getenv('UPLOAD_MODE', 'stream' if SUPABASE_SERVICE_KEY else 'none')
+UPLOAD_TIMEOUT = int(os.getenv('UPLOAD_TIMEOUT', '300'))
+
+# 'mp4' uploads one file after the encode; 'hls' writes CMAF (fMP4) segments
+# that are uploaded while FFmpeg is still encoding
+OUTPUT_FORMATS = ('mp4', 'hls')
+HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', '2'))
+HLS_POLL_INTERVAL = 0.25
+
+# Named libx264/AAC settings, selectable per job with 'encoding_profile'
+ENCODING_PROFILES = {
+    'draft': {
+        'preset': 'veryfast',
+        'crf': 28,
+        'tune': 'fastdecode',
+        'x264_params': 'rc-lookahead=10:ref=1',
+        'audio_bitrate': '96k',
+    },
+    'standard': {
+        'preset': 'fast',
+        'crf': 23,
+        'tune': None,
+        'x264_params': None,
+        'audio_bitrate': '128k',
+    },
+    'archive': {
+        'preset': 'slow',
+        'crf': 18,
+        'tune': 'film',
+        'x264_params': 'aq-mode=3',
+        'audio_bitrate': '192k',
+    },
+}
+DEFAULT_ENCODING_PROFILE = os.getenv('ENCODING_PROFILE', 'standard')
+# Encoder threads per job (0 lets the encode scheduler assign a share of the cores)
+ENCODER_THREADS = int(os.getenv('ENCODER_THREADS', '0'))
+
+
+def detect_memory_mb():
+    """Memory available to this container in MB (cgroup limit, else physical RAM)"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value) // (1024 * 1024)
+        except OSError:
+            pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return 4096
+
+
+# Encode admission control: concurrent FFmpeg encodes share ENCODE_CPU_BUDGET
+# threads and ENCODE_MEMORY_BUDGET_MB; each encode gets at least
+# ENCODE_MIN_THREADS, so at most CPU_BUDGET / MIN_THREADS run at once and the
+# rest queue (raise ENCODE_MIN_THREADS for lower per-job latency)
+ENCODE_CPU_BUDGET = int(os.getenv('ENCODE_CPU_BUDGET', str(os.cpu_count() or 1)))
+ENCODE_MEMORY_BUDGET_MB = int(os.getenv('ENCODE_MEMORY_BUDGET_MB', str(int(detect_memory_mb() * 0.8))))
+ENCODE_MEMORY_PER_JOB_MB = int(os.getenv('ENCODE_MEMORY_PER_JOB_MB', '600'))
+ENCODE_MIN_THREADS = int(os.getenv('ENCODE_MIN_THREADS', '2'))
+
+
+def get_encoding_profile(name):
+    """Look up an encoding profile by name"""
+    if name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding_profile '{name}', expected one of: {', '.join(ENCODING_PROFILES)}")
+    return ENCODING_PROFILES[name]
+
+
+# Timeline: clips get at least MIN_CLIP_SECONDS each; overlay j is shown from
+# OVERLAY_START + j * OVERLAY_INTERVAL for OVERLAY_DURATION seconds
+MIN_CLIP_SECONDS = float(os.getenv('MIN_CLIP_SECONDS', '2'))
+OVERLAY_START = 3.0
+OVERLAY_DURATION = 3.0
+OVERLAY_INTERVAL = 6.0
+OVERLAY_SIZE = 200  # overlays are scaled to OVERLAY_SIZE x OVERLAY_SIZE
+ANIMATED_IMAGE_CODECS = ('gif', 'apng', 'webp')
+
+# Audio pre-mix: the voiceover is normalized with two-pass EBU R128 loudnorm
+# (first-pass measurements are cached per audio hash), the clip audio is
+# ducked under it and the mix is encoded to AAC once; the video encode then
+# stream-copies the track
+NORMALIZE_LOUDNESS = os.getenv('NORMALIZE_LOUDNESS', 'true').lower() == 'true'
+DUCK_BACKGROUND = os.getenv('DUCK_BACKGROUND', 'true').lower() == 'true'
+LOUDNESS_TARGET = float(os.getenv('LOUDNESS_TARGET', '-16'))  # integrated LUFS
+LOUDNESS_TRUE_PEAK = float(os.getenv('LOUDNESS_TRUE_PEAK', '-1.5'))  # dBTP
+LOUDNESS_RANGE = float(os.getenv('LOUDNESS_RANGE', '11'))  # LU
+DUCKING_FILTER = 'sidechaincompress=threshold=0.02:ratio=6:attack=20:release=400'
+
+# Fast paths: when the video track needs no filtering it is stream-copied next
+# to the premixed audio instead of re-encoded. Voice-only outputs loop a cached
+# BLACK_SEGMENT_SECONDS black H.264 segment and a lone 720x1280/30fps/yuv420p
+# H.264 clip without overlays is copied (and looped) as is
+FAST_PATH = os.getenv('FAST_PATH', 'true').lower() == 'true'
+BLACK_SEGMENT_SECONDS = 10
+
+# Segment-parallel encoding: outputs at least PARALLEL_ENCODE_MIN_DURATION
+# seconds long are cut into GOP-aligned slices encoded by up to
+# PARALLEL_ENCODE_WORKERS FFmpeg processes and joined without re-encoding
+PARALLEL_ENCODE_MIN_DURATION = float(os.getenv('PARALLEL_ENCODE_MIN_DURATION', '60'))
+PARALLEL_ENCODE_WORKERS = int(os.getenv('PARALLEL_ENCODE_WORKERS', str(os.cpu_count() or 1)))
+SEGMENT_GOP_SECONDS = 2
+
+# Per-job limits: wall-clock seconds for the whole job (0 = none, override
+# with 'timeout') and CPU seconds per FFmpeg process (0 = none, 'cpu_limit')
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', '600'))
+FFMPEG_CPU_LIMIT = int(os.getenv('FFMPEG_CPU_LIMIT', '0'))
+# Lines of FFmpeg stderr kept for error messages
+FFMPEG_STDERR_LINES = int(os.getenv('FFMPEG_STDERR_LINES', '200'))
+
+# Job scratch space: each worker keeps its workspaces under TEMP_DIR (the
+# Dockerfile points it at /tmp/ffmpeg_processing). Intermediates and outputs
+# of jobs estimated below TMPFS_JOB_MAX_BYTES go to RAM-backed TMPFS_DIR while
+# it has room. Running jobs share SCRATCH_BUDGET_BYTES of disk and
+# TMPFS_BUDGET_BYTES of tmpfs; a job estimated above SCRATCH_JOB_MAX_BYTES is
+# rejected and jobs that do not fit yet wait
+TEMP_DIR = os.getenv('TEMP_DIR', tempfile.gettempdir())
+TMPFS_DIR = os.getenv('TMPFS_DIR', '/dev/shm')
+TMPFS_JOB_MAX_BYTES = int(os.getenv('TMPFS_JOB_MAX_BYTES', str(256 * 1024 ** 2)))  # 256 MB
+TMPFS_BUDGET_BYTES = int(os.getenv('TMPFS_BUDGET_BYTES', str(1024 ** 3)))  # 1 GB
+SCRATCH_BUDGET_BYTES = int(os.getenv('SCRATCH_BUDGET_BYTES', str(20 * 1024 ** 3)))  # 20 GB
+SCRATCH_JOB_MAX_BYTES = int(os.getenv('SCRATCH_JOB_MAX_BYTES', str(5 * 1024 ** 3)))  # 5 GB
+# Scratch estimate per output second (worst-case 720x1280 video plus audio)
+SCRATCH_BYTES_PER_SECOND = int(os.getenv('SCRATCH_BYTES_PER_SECOND', str(1024 ** 2)))
+# Worker directories not owned by a live process on this host are removed at
+# startup; ones from other hosts (shared volumes) once they are this old
+ORPHAN_MAX_AGE = int(os.getenv('ORPHAN_MAX_AGE', str(24 * 3600)))  # seconds
+WORKER_DIR_PREFIX = 'coach_joe_worker_'
+
+# Large responses: response_mode 'file' keeps the rendered MP4 under the
+# worker directory for RESPONSE_FILE_TTL seconds and returns its path as
+# video_file instead of inline base64; iter_response_json() streams such a file
+# into a JSON body. Logged payloads shorten strings over LOG_PAYLOAD_LIMIT
+RESPONSE_MODES = ('inline', 'file')
+RESPONSE_FILE_TTL = int(os.getenv('RESPONSE_FILE_TTL', '3600'))  # seconds
+LOG_PAYLOAD_LIMIT = int(os.getenv('LOG_PAYLOAD_LIMIT', '2048'))  # characters
+# How often the RSS of each running FFmpeg process is sampled
+MEMORY_SAMPLE_INTERVAL = 0.25  # seconds
+
+# Parallel FFmpeg processes for process_batch
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '2'))
+
+# Pass audio/video URLs straight to ffmpeg instead of downloading them first
+STREAM_INPUTS = os.getenv('STREAM_INPUTS', 'false').lower() == 'true'
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source, destination):
+    """Hardlink source to destination, falling back to a symlink and then a copy"""
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        try:
+            os.symlink(source, destination)
+        except OSError:
+            shutil.copyfile(source, destination)
+    return destination
+
+
+def process_memory(pid):
+    """
+    Current and peak resident bytes of a process from /proc
+    
+    Returns:
+        tuple: (rss, peak rss), or None where /proc is not available
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['VmRSS'].split()[0]) * 1024, int(fields['VmHWM'].split()[0]) * 1024
+    except (OSError, KeyError, ValueError, IndexError):
+        return None
+
+
+def run_coroutine(coroutine):
+    """
+    Run a coroutine to completion from synchronous code
+    
+    Callers that are themselves inside a running event loop (RunPod's SDK
+    calls handler() from one) cannot use asyncio.run(), so the coroutine
+    then gets a private loop on a worker thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='coach-joe-loop') as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def redact_payloads(value, limit=LOG_PAYLOAD_LIMIT):
+    """Copy of a JSON-like value with strings over limit characters replaced, for logging"""
+    if isinstance(value, dict):
+        return {key: redact_payloads(item, limit) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact_payloads(item, limit) for item in value]
+    if isinstance(value, str) and len(value) > limit:
+        return f"<{len(value)} characters redacted>"
+    return value
+
+
+def prepare_streamed_response(payload):
+    """
+    Switch jobs that want inline video_data to response_mode 'file'
+    
+    Jobs (or batch configs) with include_video_data and no response_mode of
+    their own render to a kept file instead, so the response body can stream
+    the video with iter_response_json() rather than hold it as a string.
+    
+    Returns:
+        tuple: (payload to process, callable returning the responses of a
+            result whose video_file should be embedded)
+    """
+    def wants_data(config):
+        return bool(config.get('include_video_data')) and 'response_mode' not in config
+    
+    if 'configs' in payload:
+        switched = [i for i, config in enumerate(payload['configs'] or []) if wants_data(config)]
+        if not switched:
+            return payload, lambda result: []
+        configs = [
+            {**config, 'response_mode': 'file'} if i in switched else config
+            for i, config in enumerate(payload['configs'])
+        ]
+        
+        def batch_responses(result):
+            results = result.get('results') or []
+            return [results[i] for i in switched if i < len(results) and results[i].get('video_file')]
+        return {**payload, 'configs': configs}, batch_responses
+    
+    if not wants_data(payload):
+        return payload, lambda result: []
+    return {**payload, 'response_mode': 'file'}, lambda result: [result] if result.get('video_file') else []
+
+
+def iter_response_json(result, embed=(), chunk_size=3 * 256 * 1024):
+    """
+    Yield result as JSON text piece by piece
+    
+    Each response in embed (result itself, entries of a batch's results, or
+    the result inside a /jobs status) gets its video_file as base64
+    video_data, read and encoded one chunk at a time, so the encoded video
+    never exists as a single string.
+    """
+    files = {}
+    
+    def swap(response):
+        if not isinstance(response, dict):
+            return response
+        if any(response is item for item in embed):
+            marker = json.dumps(f"video_data:{uuid.uuid4().hex}")
+            files[marker] = response['video_file']
+            return {**response, 'video_data': json.loads(marker), 'video_file': None}
+        if isinstance(response.get('result'), dict):
+            response = {**response, 'result': swap(response['result'])}
+        if isinstance(response.get('results'), list):
+            response = {**response, 'results': [swap(item) for item in response['results']]}
+        return response
+    
+    text = json.dumps(swap(result))
+    
+    position = 0
+    for marker in sorted(files, key=text.index):
+        start = text.index(marker)
+        yield text[position:start] + '"'
+        # chunk_size is a multiple of 3 so encoded chunks concatenate without padding
+        with open(files[marker], 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield base64.b64encode(chunk).decode('ascii')
+        yield '"'
+        position = start + len(marker)
+    yield text[position:]
+
+
+def stream_response_json(result, embed):
+    """iter_response_json(), deleting the embedded video files once the body has been sent"""
+    try:
+        yield from iter_response_json(result, embed)
+    finally:
+        release_response_files(embed)
+
+
+def release_response_files(responses):
+    """Delete the kept video_file of each response once it has been sent"""
+    for response in responses:
+        try:
+            os.remove(response['video_file'])
+        except (OSError, KeyError, TypeError):
+            pass
+
+
+class IncompleteDownload(Exception):
+    """The connection closed before Content-Length bytes arrived"""
+
+
+def download_stream(session, url, f, headers=None, chunk_size=DOWNLOAD_CHUNK_SIZE, stats=None):
+    """
+    Stream url into the open binary file f
+    
+    Connection errors, timeouts, short reads and 5xx/429 responses are
+    retried up to DOWNLOAD_RETRIES times with exponential backoff. A retry
+    asks for the rest of the file with a Range request (guarded by If-Range
+    so a changed object is not spliced); if the server ignores the range the
+    transfer starts over. The received size is checked against the length
+    the server announced.
+    
+    Args:
+        headers (dict): Extra headers for the first request (e.g. conditional GET)
+        stats (dict): Receives 'retries' and 'resumed_bytes'
+    
+    Returns:
+        tuple: (final response, sha256 hex digest, bytes written); a 304
+            response means nothing was written
+    """
+    if stats is None:
+        stats = {}
+    digest = hashlib.sha256()
+    size = 0
+    expected_size = None
+    validator = None
+    attempt = 0
+    stats.update({'retries': 0, 'resumed_bytes': 0})
+    while True:
+        request_headers = dict(headers or {})
+        if size:
+            request_headers = {'Range': f'bytes={size}-'}
+            if validator:
+                request_headers['If-Range'] = validator
+        try:
+            response = session.get(url, stream=True, headers=request_headers,
+                                   timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT))
+            with response:
+                if response.status_code == 304 and not size:
+                    return response, None, 0
+                if size and response.status_code == 206:
+                    stats['resumed_bytes'] += size
+                elif size and response.status_code == 200:
+                    # Range not honoured or the object changed: start over
+                    logger.info(f"Server ignored the range request, restarting {url}")
+                    f.seek(0)
+                    f.truncate()
+                    digest = hashlib.sha256()
+                    size = 0
+                response.raise_for_status()
+                
+                if response.status_code == 200:
+                    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                    expected_size = None
+                    if 'Content-Encoding' not in response.headers and response.headers.get('Content-Length'):
+                        expected_size = int(response.headers['Content-Length'])
+                
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            
+            if expected_size is not None and size < expected_size:
+                raise IncompleteDownload(f"received {size} of {expected_size} bytes")
+            if expected_size is not None and size > expected_size:
+                raise ValueError(f"Downloaded {size} bytes from {url}, expected {expected_size}")
+            return response, digest.hexdigest(), size
+            
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                requests.HTTPError, IncompleteDownload) as e:
+            status = e.response.status_code if isinstance(e, requests.HTTPError) else None
+            if (status and status not in RETRYABLE_STATUS_CODES) or attempt >= DOWNLOAD_RETRIES:
+                raise
+            attempt += 1
+            stats['retries'] = attempt
+            delay = DOWNLOAD_BACKOFF * 2 ** (attempt - 1)
+            logger.warning(f"Download of {url} failed ({str(e)}), retry {attempt}/{DOWNLOAD_RETRIES} "
+                           f"in {delay:.1f}s from byte {size}")
+            time.sleep(delay)
+
+
+def verify_checksum(url, sha256, expected):
+    """Raise if a downloaded file's SHA-256 does not match the expected digest"""
+    if expected and sha256 != expected.lower():
+        raise ValueError(f"Checksum mismatch for {url}: expected sha256 {expected}, got {sha256}")
+
+
+def directory_size(path):
+    """Total size of the regular files under path"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                stat = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            if not os.path.islink(os.path.join(dirpath, name)):
+                total += stat.st_size
+    return total
+
+
+# Worker directories of this process are all created after import
+_process_started = time.time()
+
+
+def create_worker_dir(root):
+    """Create this process's scratch root under root, recording its owner"""
+    os.makedirs(root, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix=f'{WORKER_DIR_PREFIX}{os.getpid()}_', dir=root)
+    with open(os.path.join(directory, '.owner'), 'w') as f:
+        json.dump({'pid': os.getpid(), 'host': socket.gethostname(), 'created': time.time()}, f)
+    return directory
+
+
+def clean_orphaned_worker_dirs(root):
+    """
+    Remove worker scratch roots under root left behind by crashed workers
+    
+    A root created on this host is orphaned when its process no longer
+    exists; one with this pid only when it predates this process (an earlier
+    process after a container restart), so live roots are never removed.
+    Roots of other hosts (or without an owner file) are orphaned when older
+    than ORPHAN_MAX_AGE.
+    
+    Returns:
+        int: Bytes freed
+    """
+    try:
+        names = [name for name in os.listdir(root) if name.startswith(WORKER_DIR_PREFIX)]
+    except OSError:
+        return 0
+    
+    freed = 0
+    for name in names:
+        directory = os.path.join(root, name)
+        try:
+            with open(os.path.join(directory, '.owner')) as f:
+                owner = json.load(f)
+        except (OSError, ValueError):
+            owner = {}
+        
+        created = owner.get('created', os.path.getmtime(directory))
+        pid = owner.get('pid')
+        if owner.get('host') != socket.gethostname() or not isinstance(pid, int):
+            orphaned = time.time() - created > ORPHAN_MAX_AGE
+        elif pid == os.getpid():
+            orphaned = created < _process_started
+        else:
+            try:
+                os.kill(pid, 0)
+                orphaned = False
+            except ProcessLookupError:
+                orphaned = True
+            except PermissionError:
+                orphaned = False
+        
+        if orphaned:
+            size = directory_size(directory)
+            shutil.rmtree(directory, ignore_errors=True)
+            freed += size
+            logger.info(f"Removed orphaned worker directory {directory} ({size} bytes)")
+    return freed
+
+
+class AssetCache:
+    """
+    Content-addressed on-disk cache for downloaded assets
+    
+    Files are stored once under objects/<sha256>. The index maps each URL to
+    its content hash plus the ETag/Last-Modified validators used for
+    conditional GETs. Total size is bounded by max_bytes with LRU eviction.
+    """
+    
+    def __init__(self, cache_dir=ASSET_CACHE_DIR, max_bytes=ASSET_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load_index()
+    
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Drop entries whose object has been removed outside the cache
+        return {url: entry for url, entry in index.items()
+                if os.path.exists(self._object_path(entry['sha256']))}
+    
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+    
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256)
+    
+    def lookup(self, url):
+        """Return the index entry for a URL, if cached"""
+        with self.lock:
+            entry = self.index.get(url)
+            return dict(entry) if entry else None
+    
+    def fetch(self, session, url, destination, chunk_size=DOWNLOAD_CHUNK_SIZE, stats=None, sha256=None):
+        """
+        Place the asset for url at destination, downloading only when the
+        cached copy is missing or the server reports it has changed.
+        stats, if given, receives 'bytes' transferred, 'cache_hit' and the
+        download retry counts. sha256, if given, is verified before the
+        asset is cached.
+        """
+        if stats is None:
+            stats = {}
+        entry = self.lookup(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        
+        # Stream into the cache while hashing, then move into place
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                response, digest, size = download_stream(session, url, f, headers, chunk_size, stats)
+            if response.status_code != 304:
+                verify_checksum(url, digest, sha256)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self._object_path(digest))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        if response.status_code == 304:
+            try:
+                verify_checksum(url, entry['sha256'], sha256)
+                self._link(url, entry, destination)
+                logger.info(f"Asset cache hit (not modified): {url}")
+                stats.update({'bytes': 0, 'cache_hit': True})
+                return destination
+            except FileNotFoundError:
+                # Evicted by a concurrent job since the lookup
+                logger.info(f"Asset cache object evicted, refetching: {url}")
+                self.forget(url)
+                return self.fetch(session, url, destination, chunk_size, stats, sha256)
+        
+        entry = {
+            'sha256': digest,
+            'size': size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        logger.info(f"Asset cache stored {url} ({size} bytes)")
+        stats.update({'bytes': size, 'cache_hit': False})
+        return self._link(url, entry, destination)
+    
+    def forget(self, url):
+        """Drop a URL from the index"""
+        with self.lock:
+            self.index.pop(url, None)
+    
+    def _link(self, url, entry, destination):
+        with self.lock:
+            object_path = self._object_path(entry['sha256'])
+            if not os.path.exists(object_path):
+                self.index.pop(url, None)
+                raise FileNotFoundError(object_path)
+            entry['last_access'] = time.time()
+            self.index[url] = entry
+            link_or_copy(object_path, destination)
+            self._evict()
+            self._save_index()
+        return destination
+    
+    def _evict(self):
+        """Remove least recently used objects until the cache fits its budget"""
+        objects = {}
+        for url, entry in self.index.items():
+            obj = objects.setdefault(entry['sha256'], {'size': entry['size'], 'last_access': 0, 'urls': []})
+            obj['last_access'] = max(obj['last_access'], entry['last_access'])
+            obj['urls'].append(url)
+        
+        total = sum(obj['size'] for obj in objects.values())
+        for sha256, obj in sorted(objects.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._object_path(sha256))
+            except OSError:
+                pass
+            for url in obj['urls']:
+                del self.index[url]
+            total -= obj['size']
+            logger.info(f"Asset cache evicted {sha256} ({obj['size']} bytes)")
+
+
+class MemoCache:
+    """Thread-safe dict that keeps only the max_entries most recently used items"""
+    
+    def __init__(self, max_entries=MEMO_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+    
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+    
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+
+class DerivedCache:
+    """
+    On-disk cache for files derived from source assets (e.g. transcodes)
+    
+    Entries are named <key><suffix>, where key is normally the source content
+    hash. File mtimes track recency and the directory is bounded by max_bytes
+    with LRU eviction.
+    """
+    
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def path(self, key, suffix=''):
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+    
+    def get(self, key, suffix=''):
+        """Return the cached path for key and mark it recently used, or None"""
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+    
+    def get_or_create(self, key, suffix, build):
+        """
+        Return the cached path for key, calling build(tmp_path) to produce it
+        on a miss. Concurrent callers for the same key wait for one build.
+        """
+        with self.key_lock(key):
+            path = self.get(key, suffix)
+            if path:
+                return path
+            
+            tmp_path = self.path(key, f".{os.getpid()}.tmp{suffix}")
+            try:
+                build(tmp_path)
+                os.replace(tmp_path, self.path(key, suffix))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            
+            self.evict()
+            return self.path(key, suffix)
+    
+    def key_lock(self, key):
+        """Lock serializing writers of one key within this process"""
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+    
+    def evict(self):
+        """Remove least recently used entries until the cache fits its budget"""
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if '.tmp' in name or not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+            
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    logger.info(f"Evicted cached file {os.path.basename(path)} ({size} bytes)")
+                except OSError:
+                    pass
+
+
+class RenderCache(DerivedCache):
+    """
+    Finished renders keyed by a hash of everything that affects the output
+    
+    Each entry is <key>.json (the response the render produced) plus, for
+    MP4 outputs, <key>.mp4. Entries expire ttl seconds after they were
+    stored; within the size budget the least recently used go first.
+    """
+    
+    def __init__(self, cache_dir, max_bytes, ttl):
+        super().__init__(cache_dir, max_bytes)
+        self.ttl = ttl
+    
+    def lookup(self, key):
+        """
+        Return (response, output path or None) for a live entry, or None
+        """
+        record_path = self.get(key, '.json')
+        if not record_path:
+            return None
+        try:
+            with open(record_path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        if time.time() - record['created'] > self.ttl:
+            self.forget(key)
+            return None
+        return record['response'], self.get(key, '.mp4')
+    
+    def store(self, key, response, output_file=None):
+        """Record a successful render, keeping a hardlink (or copy) of its output"""
+        # Concurrent identical jobs would otherwise share the temp names
+        with self.key_lock(key):
+            if output_file:
+                tmp_path = self.path(key, f".{os.getpid()}.tmp.mp4")
+                try:
+                    os.link(output_file, tmp_path)
+                except OSError:
+                    shutil.copyfile(output_file, tmp_path)
+                os.replace(tmp_path, self.path(key, '.mp4'))
+            
+            tmp_path = self.path(key, f".{os.getpid()}.tmp.json")
+            with open(tmp_path, 'w') as f:
+                json.dump({'created': time.time(), 'response': response}, f)
+            os.replace(tmp_path, self.path(key, '.json'))
+        
+        self.expire()
+        self.evict()
+    
+    def forget(self, key):
+        for suffix in ('.json', '.mp4'):
+            try:
+                os.remove(self.path(key, suffix))
+            except OSError:
+                pass
+    
+    def expire(self):
+        """Drop entries older than the TTL"""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json') or '.tmp' in name:
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name)) as f:
+                    created = json.load(f)['created']
+            except (OSError, ValueError, KeyError):
+                continue
+            if created < cutoff:
+                self.forget(name[:-len('.json')])
+
+
+class JobCancelled(Exception):
+    """The job's cancel event was set"""
+
+
+class JobTimeout(Exception):
+    """The job ran past its wall-clock deadline or an FFmpeg process past its CPU limit"""
+
+
+class EncodeScheduler:
+    """
+    Admission control for FFmpeg encodes on this worker
+    
+    Every encode reserves CPU threads and an estimated amount of memory from
+    the worker's budget and is handed its thread count for -threads, so
+    running encodes never oversubscribe the cores. Encodes that do not fit
+    wait in FIFO order; queue depth and wait times are exposed by stats().
+    """
+    
+    def __init__(self, cpu_budget=ENCODE_CPU_BUDGET, memory_budget_mb=ENCODE_MEMORY_BUDGET_MB,
+                 memory_per_encode_mb=ENCODE_MEMORY_PER_JOB_MB, min_threads=ENCODE_MIN_THREADS):
+        self.cpu_budget = max(1, cpu_budget)
+        self.memory_budget_mb = memory_budget_mb
+        self.memory_per_encode_mb = memory_per_encode_mb
+        self.min_threads = max(1, min(min_threads, self.cpu_budget))
+        self.condition = threading.Condition()
+        self.waiting = deque()
+        self.running = 0
+        self.cpus_in_use = 0
+        self.memory_in_use_mb = 0
+        self.admitted = 0
+        self.wait_seconds_total = 0.0
+        self.recent_waits = deque(maxlen=200)
+    
+    @contextmanager
+    def reserve(self, metrics=None, cpus=None):
+        """
+        Wait for budget and hold it for the duration of the block
+        
+        Args:
+            metrics (JobMetrics): Job whose cancellation/deadline ends the wait
+                and which records queue_seconds and threads
+            cpus (int): Threads to reserve (default: ENCODER_THREADS, else a
+                fair share of the budget)
+        
+        Yields:
+            int: Threads reserved for the encode
+        """
+        ticket = object()
+        started = time.perf_counter()
+        with metrics.stage('queue') if metrics else nullcontext(), self.condition:
+            self.waiting.append(ticket)
+            try:
+                while True:
+                    threads = self.threads_for(cpus or ENCODER_THREADS)
+                    if self.waiting[0] is ticket and self.fits(threads):
+                        break
+                    if metrics:
+                        metrics.check()
+                    self.condition.wait(0.5)
+            except BaseException:
+                self.waiting.remove(ticket)
+                self.condition.notify_all()
+                raise
+            
+            self.waiting.popleft()
+            waited = time.perf_counter() - started
+            self.running += 1
+            self.cpus_in_use += threads
+            self.memory_in_use_mb += self.memory_per_encode_mb
+            self.admitted += 1
+            self.wait_seconds_total += waited
+            self.recent_waits.append(waited)
+            self.condition.notify_all()
+        
+        if metrics:
+            metrics.encode['queue_seconds'] = round(metrics.encode.get('queue_seconds', 0) + waited, 3)
+            metrics.encode['threads'] = threads
+        if waited > 0.1:
+            logger.info(f"Encode admitted after {waited:.1f}s in queue with {threads} threads")
+        try:
+            yield threads
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.cpus_in_use -= threads
+                self.memory_in_use_mb -= self.memory_per_encode_mb
+                self.condition.notify_all()
+    
+    def threads_for(self, cpus):
+        """Threads for the next encode: fixed, or the budget split over running and queued encodes"""
+        if cpus:
+            return min(cpus, self.cpu_budget)
+        share = self.cpu_budget // max(1, self.running + len(self.waiting))
+        return max(self.min_threads, min(share, self.cpu_budget - self.cpus_in_use))
+    
+    def fits(self, threads):
+        if not self.running:
+            return True  # Never starve a lone encode, whatever its estimate
+        return (self.cpus_in_use + threads <= self.cpu_budget
+                and self.memory_in_use_mb + self.memory_per_encode_mb <= self.memory_budget_mb)
+    
+    def stats(self):
+        with self.condition:
+            waits = sorted(self.recent_waits)
+            return {
+                'cpu_budget': self.cpu_budget,
+                'cpus_in_use': self.cpus_in_use,
+                'memory_budget_mb': self.memory_budget_mb,
+                'memory_in_use_mb': self.memory_in_use_mb,
+                'running': self.running,
+                'queued': len(self.waiting),
+                'admitted_total': self.admitted,
+                'wait_seconds_total': round(self.wait_seconds_total, 3),
+                'wait_seconds_p50': round(waits[len(waits) // 2], 3) if waits else 0.0,
+                'wait_seconds_p95': round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+            }
+
+
+class ScratchSpaceExceeded(Exception):
+    """A job's estimated scratch footprint can never fit this worker's budget"""
+
+
+class ScratchSpace:
+    """
+    Placement and byte-budget accounting for job intermediates and outputs
+    
+    Before downloading, a job reserves its estimated footprint and gets a
+    fresh directory: on RAM-backed tmpfs when the job is small and tmpfs has
+    room, otherwise on disk. Downloaded inputs always live on disk, so their
+    bytes are charged to the disk budget wherever the directory lands.
+    Reservations that would exceed a budget wait in FIFO order; a job over
+    the per-job limit is rejected. release() deletes the directories and
+    records the bytes actually used.
+    """
+    
+    def __init__(self, disk_root, tmpfs_parent=TMPFS_DIR, budget_bytes=SCRATCH_BUDGET_BYTES,
+                 tmpfs_budget_bytes=TMPFS_BUDGET_BYTES, job_max_bytes=SCRATCH_JOB_MAX_BYTES,
+                 tmpfs_job_max_bytes=TMPFS_JOB_MAX_BYTES):
+        self.disk_root = disk_root
+        self.tmpfs_parent = tmpfs_parent if tmpfs_parent and os.path.isdir(tmpfs_parent) else None
+        self.tmpfs_root = None
+        self.budget_bytes = budget_bytes
+        # A budget over the tmpfs size (e.g. Docker's 64 MB /dev/shm) could never be met
+        self.tmpfs_budget_bytes = tmpfs_budget_bytes
+        if self.tmpfs_parent:
+            try:
+                self.tmpfs_budget_bytes = min(tmpfs_budget_bytes, shutil.disk_usage(self.tmpfs_parent).total)
+            except OSError:
+                pass
+        self.job_max_bytes = job_max_bytes
+        self.tmpfs_job_max_bytes = tmpfs_job_max_bytes
+        self.condition = threading.Condition()
+        self.waiting = deque()
+        self.in_use = {'tmpfs': 0, 'disk': 0}
+        # Input bytes already downloaded: still charged to the disk budget,
+        # but no longer missing from the free space disk_usage reports
+        self.inputs_written = 0
+        self.reservations = {}
+        self.rejected = 0
+    
+    def allocate(self, owner, estimate, metrics=None, input_bytes=0):
+        """
+        Reserve estimate bytes for owner and return a new scratch directory
+        
+        Args:
+            owner: Key that release() frees the reservation by (e.g. the workspace)
+            estimate (int): Bytes of intermediates and outputs the directory will hold
+            metrics (JobMetrics): Job whose cancellation/deadline ends the wait
+            input_bytes (int): Bytes of inputs the job is about to download
+                (charged to disk; see settle_inputs)
+        
+        Raises:
+            ScratchSpaceExceeded: The estimate is over the per-job limit, or over
+                what the worker has even with no other job running
+        """
+        reservation = self.reserve(owner, estimate, input_bytes, metrics)
+        try:
+            root = self.tmpfs_dir() if reservation['location'] == 'tmpfs' else self.disk_root
+            reservation['directory'] = tempfile.mkdtemp(prefix='scratch_', dir=root)
+        except OSError:
+            self.release(owner)
+            raise
+        logger.info(f"Scratch space on {reservation['location']}: {reservation['directory']} "
+                    f"(~{estimate // 1024 ** 2} MB)")
+        return reservation['directory']
+    
+    def reserve_inputs(self, owner, input_bytes, metrics=None):
+        """Reserve disk for inputs owner is about to download, without a scratch directory"""
+        self.reserve(owner, 0, input_bytes, metrics)
+    
+    def settle_inputs(self, owner):
+        """Mark owner's reserved inputs as downloaded (they now show in the free space)"""
+        with self.condition:
+            for reservation in self.reservations.get(owner, []):
+                if not reservation['inputs_written']:
+                    reservation['inputs_written'] = True
+                    self.inputs_written += reservation['input_bytes']
+            self.condition.notify_all()
+    
+    def reserve(self, owner, estimate, input_bytes, metrics):
+        ticket = object()
+        started = time.perf_counter()
+        needed = estimate + input_bytes
+        with metrics.stage('scratch') if metrics else nullcontext(), self.condition:
+            if needed > self.job_max_bytes:
+                self.rejected += 1
+                raise ScratchSpaceExceeded(
+                    f"Job needs about {needed // 1024 ** 2} MB of scratch space, "
+                    f"over the {self.job_max_bytes // 1024 ** 2} MB per-job limit"
+                )
+            self.waiting.append(ticket)
+            try:
+                while True:
+                    location = self.place(estimate, input_bytes) if self.waiting[0] is ticket else None
+                    if location:
+                        break
+                    if self.waiting[0] is ticket and not any(self.in_use.values()):
+                        self.rejected += 1
+                        raise ScratchSpaceExceeded(
+                            f"Job needs about {needed // 1024 ** 2} MB of scratch space; the worker "
+                            f"budget is {self.budget_bytes // 1024 ** 2} MB with "
+                            f"{self.free_bytes(self.disk_root) // 1024 ** 2} MB of disk free"
+                        )
+                    if metrics:
+                        metrics.check()
+                    self.condition.wait(0.5)
+            except BaseException:
+                self.waiting.remove(ticket)
+                self.condition.notify_all()
+                raise
+            
+            self.waiting.popleft()
+            self.in_use[location] += estimate
+            self.in_use['disk'] += input_bytes
+            record = {
+                'location': location,
+                'estimated_bytes': estimate,
+                'input_bytes': input_bytes,
+                'wait_seconds': round(time.perf_counter() - started, 3),
+            }
+            reservation = {
+                'location': location,
+                'estimate': estimate,
+                'input_bytes': input_bytes,
+                'inputs_written': False,
+                'directory': None,
+                'record': record,
+            }
+            self.reservations.setdefault(owner, []).append(reservation)
+            self.condition.notify_all()
+        
+        if metrics:
+            with metrics.lock:
+                metrics.scratch.append(record)
+        return reservation
+    
+    def release(self, owner):
+        """Delete owner's scratch directories and free their reservations"""
+        with self.condition:
+            reservations = self.reservations.pop(owner, [])
+        for reservation in reservations:
+            if reservation['directory']:
+                reservation['record']['used_bytes'] = directory_size(reservation['directory'])
+                shutil.rmtree(reservation['directory'], ignore_errors=True)
+            with self.condition:
+                self.in_use[reservation['location']] -= reservation['estimate']
+                self.in_use['disk'] -= reservation['input_bytes']
+                if reservation['inputs_written']:
+                    self.inputs_written -= reservation['input_bytes']
+                self.condition.notify_all()
+    
+    def place(self, estimate, input_bytes=0):
+        """
+        'tmpfs' or 'disk' if estimate (plus input_bytes on disk) fits right now, else None
+        
+        Free space is counted net of the running reservations that may not
+        have written their files yet.
+        """
+        disk_room = min(self.budget_bytes - self.in_use['disk'],
+                        self.free_bytes(self.disk_root) - (self.in_use['disk'] - self.inputs_written))
+        if (self.tmpfs_parent and estimate and estimate <= self.tmpfs_job_max_bytes
+                and self.in_use['tmpfs'] + estimate <= self.tmpfs_budget_bytes
+                and self.free_bytes(self.tmpfs_parent) - self.in_use['tmpfs'] >= estimate
+                and disk_room >= input_bytes):
+            return 'tmpfs'
+        if disk_room >= estimate + input_bytes:
+            return 'disk'
+        return None
+    
+    def free_bytes(self, path):
+        try:
+            return shutil.disk_usage(path).free
+        except OSError:
+            return 0
+    
+    def tmpfs_dir(self):
+        """This worker's root on tmpfs, created on first use"""
+        with self.condition:
+            if self.tmpfs_root is None:
+                self.tmpfs_root = create_worker_dir(self.tmpfs_parent)
+            return self.tmpfs_root
+    
+    def stats(self):
+        with self.condition:
+            return {
+                'tmpfs': self.tmpfs_parent,
+                'tmpfs_in_use_bytes': self.in_use['tmpfs'],
+                'tmpfs_budget_bytes': self.tmpfs_budget_bytes if self.tmpfs_parent else 0,
+                'disk_in_use_bytes': self.in_use['disk'],
+                'disk_budget_bytes': self.budget_bytes,
+                'disk_free_bytes': self.free_bytes(self.disk_root),
+                'jobs': len(self.reservations),
+                'queued': len(self.waiting),
+                'rejected_total': self.rejected,
+            }
+    
+    def cleanup(self):
+        if self.tmpfs_root:
+            shutil.rmtree(self.tmpfs_root, ignore_errors=True)
+
+
+class JobMetrics:
+    """
+    Per-job stage timings, transfer sizes and FFmpeg progress
+    
+    Also carries the job's controls: on_progress is called with every FFmpeg
+    progress update, setting cancel_event aborts the job, and timeout /
+    cpu_limit bound its wall-clock time and each FFmpeg process's CPU time.
+    """
+    
+    def __init__(self, on_progress=None, cancel_event=None, timeout=None, cpu_limit=FFMPEG_CPU_LIMIT):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.assets = {}
+        self.encode = {}
+        self.scratch = []
+        self.bytes_uploaded = 0
+        self.lock = threading.Lock()
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event
+        self.timeout = timeout
+        self.deadline = self.started + timeout if timeout else None
+        self.cpu_limit = cpu_limit
+        self.expected_duration = None
+        self.ffmpeg_rss = {}
+        self.peak_rss = None
+        self.peak_worker_rss = None
+    
+    def check(self):
+        """Raise if the job was cancelled or is past its deadline"""
+        if self.cancel_event and self.cancel_event.is_set():
+            raise JobCancelled("Job was cancelled")
+        if self.deadline and time.perf_counter() >= self.deadline:
+            raise JobTimeout(f"Job exceeded its {self.timeout}s deadline")
+    
+    def remaining(self):
+        """Seconds left before the deadline (None without one)"""
+        if not self.deadline:
+            return None
+        return max(0.0, self.deadline - time.perf_counter())
+    
+    def progress(self, stats):
+        """Record FFmpeg progress and pass it to the on_progress callback"""
+        with self.lock:
+            self.encode.update(stats)
+            event = dict(self.encode)
+        if event.get('state') == 'end':
+            event['percent'] = 100.0
+        elif self.expected_duration and event.get('out_time_seconds') is not None:
+            event['percent'] = round(min(100.0, 100 * event['out_time_seconds'] / self.expected_duration), 1)
+        if self.on_progress:
+            try:
+                self.on_progress(event)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {str(e)}")
+    
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work; repeated stages accumulate"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stages[name] = round(self.stages.get(name, 0) + elapsed, 3)
+    
+    def sample_memory(self, pid, running=True):
+        """
+        Record the RSS of one of the job's FFmpeg processes (and of the worker)
+        
+        peak_rss is the most the job's concurrently running FFmpeg processes
+        held at once, and at least the peak of any one of them.
+        """
+        usage = process_memory(pid) if running else None
+        worker = process_memory(os.getpid())
+        with self.lock:
+            if not running:
+                self.ffmpeg_rss.pop(pid, None)
+                return
+            if usage:
+                self.ffmpeg_rss[pid] = usage[0]
+                self.peak_rss = max(self.peak_rss or 0, sum(self.ffmpeg_rss.values()), usage[1])
+            if worker:
+                self.peak_worker_rss = max(self.peak_worker_rss or 0, worker[0])
+    
+    def record_asset(self, name, **stats):
+        with self.lock:
+            self.assets.setdefault(name, {}).update(stats)
+    
+    def to_dict(self):
+        with self.lock:
+            return {
+                'total_seconds': round(time.perf_counter() - self.started, 3),
+                'stages': dict(self.stages),
+                'assets': {name: dict(stats) for name, stats in self.assets.items()},
+                'bytes_downloaded': sum(a.get('bytes', 0) for a in self.assets.values()),
+                'bytes_uploaded': self.bytes_uploaded,
+                'encode': dict(self.encode),
+                'scratch': [dict(record) for record in self.scratch],
+                'memory': {
+                    'peak_rss_mb': round(self.peak_rss / 1024 ** 2, 1) if self.peak_rss else None,
+                    'peak_worker_rss_mb': round(self.peak_worker_rss / 1024 ** 2, 1) if self.peak_worker_rss else None,
+                },
+            }
+
+
+class SegmentUploader:
+    """
+    Uploads HLS/CMAF output from a directory while FFmpeg is writing it
+    
+    FFmpeg writes each segment to a .tmp file and renames it when complete
+    (hls_flags temp_file), so every file with its final name can be
+    uploaded. The playlist is only uploaded once every segment it lists is
+    in storage, so consumers never see a reference to a missing segment.
+    """
+    
+    def __init__(self, upload, directory, object_prefix, enabled=True):
+        self.upload = upload
+        self.directory = directory
+        self.object_prefix = object_prefix
+        self.enabled = enabled
+        self.uploaded = {}
+        self.playlist_uploaded = None
+        self.first_segment_seconds = None
+        self.error = None
+        self.started = time.perf_counter()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+        return self
+    
+    def finish(self):
+        """Stop watching, upload whatever is left and return a summary"""
+        self.done.set()
+        self.thread.join()
+        self.poll()
+        return {
+            'segments': sum(1 for name in self.uploaded if name.endswith('.m4s')),
+            'bytes': sum(self.uploaded.values()),
+            'first_segment_seconds': self.first_segment_seconds,
+            'uploaded': self.enabled and self.error is None and self.playlist_uploaded is not None,
+            'error': self.error
+        }
+    
+    def _run(self):
+        while not self.done.wait(HLS_POLL_INTERVAL):
+            self.poll()
+    
+    def poll(self):
+        if self.error:
+            return
+        try:
+            names = sorted(os.listdir(self.directory))
+            segments = [name for name in names if name.endswith('.m4s')]
+            # The init segment is complete once the first media segment exists,
+            # and must be in storage before it
+            ready = (['init.mp4'] if segments and 'init.mp4' in names else []) + segments
+            for name in ready:
+                if name in self.uploaded:
+                    continue
+                path = os.path.join(self.directory, name)
+                if self.enabled:
+                    self.upload(path, f"{self.object_prefix}/{name}", content_type='video/mp4')
+                self.uploaded[name] = os.path.getsize(path)
+                if name.endswith('.m4s') and self.first_segment_seconds is None:
+                    self.first_segment_seconds = round(time.perf_counter() - self.started, 3)
+                    logger.info(f"First segment ready after {self.first_segment_seconds}s")
+            self.upload_playlist()
+        except Exception as e:
+            logger.error(f"Segment upload failed: {str(e)}")
+            self.error = str(e)
+    
+    def upload_playlist(self):
+        playlist = os.path.join(self.directory, 'playlist.m3u8')
+        if not os.path.exists(playlist):
+            return
+        with open(playlist) as f:
+            content = f.read()
+        if content == self.playlist_uploaded:
+            return
+        
+        referenced = [line for line in content.splitlines() if line and not line.startswith('#')]
+        if 'EXT-X-MAP' in content:
+            referenced.append('init.mp4')
+        if not all(name in self.uploaded for name in referenced):
+            return
+        
+        if self.enabled:
+            # Upload a snapshot; FFmpeg rewrites the playlist after every segment
+            snapshot = os.path.join(self.directory, 'playlist.upload')
+            with open(snapshot, 'w') as f:
+                f.write(content)
+            self.upload(snapshot, f"{self.object_prefix}/playlist.m3u8",
+                        content_type='application/vnd.apple.mpegurl')
+        self.playlist_uploaded = content
+
+
 class CoachJoeVideoProcessor:
     def __init__(self):
-        self.temp_dir = tempfile.mkdtemp()
+        self.temp_dir = create_worker_dir(TEMP_DIR)
+        self.scratch = ScratchSpace(self.temp_dir)
         self.supported_video_formats = ['.mp4', '.mov', '.avi', '.mkv']
         self.supported_image_formats = ['.jpg', '.jpeg', '.png', '.gif']
         self.supported_audio_formats = ['.mp3', '.wav', '.m4a', '.aac', '.mpga']
+        self.session = self.create_session()
+        self.asset_cache = AssetCache() if ASSET_CACHE_ENABLED else None
+        self.normalized_cache = None
+        self.render_cache = None
+        self.content_hashes = MemoCache()
+        self.probe_cache = MemoCache()
+        self.loudness_cache = MemoCache()
+        self.cache_lock = threading.Lock()
+        self.capabilities = None
+        self.scheduler = EncodeScheduler()
+    
+    def create_session(self):
+        """Create a pooled HTTP session shared by all downloads"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_DOWNLOAD_WORKERS,
+                              pool_maxsize=MAX_DOWNLOAD_WORKERS)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+        
+    def ffmpeg_capabilities(self):
+        """
+        Detect the FFmpeg version, encoders and filters once per worker
+        
+        Returns:
+            dict: version, encoders (set), filters (set)
+        """
+        with self.cache_lock:
+            if self.capabilities is not None:
+                return self.capabilities
+        
+        def listing(flag):
+            result = subprocess.run(['ffmpeg', '-hide_banner', flag], capture_output=True, text=True)
+            names = set()
+            for line in result.stdout.split('\n'):
+                parts = line.split()
+                # Entries look like " V....D libx264  ..." or " ... loudnorm  A->A  ..."
+                if len(parts) >= 2 and '=' not in parts[0] and parts[0] != '------':
+                    names.add(parts[1])
+            return names
+        
+        version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+        capabilities = {
+            'version': version.split()[2] if version.startswith('ffmpeg version') else None,
+            'encoders': listing('-encoders'),
+            'filters': listing('-filters'),
+        }
+        logger.info(f"Detected FFmpeg {capabilities['version']}")
+        
+        with self.cache_lock:
+            self.capabilities = capabilities
+        return capabilities
+    
+    def download_file(self, url, filename=None, stats=None, directory=None, sha256=None):
+        """
+        Download file from URL to directory (default: the temp directory)
+        
+        stats, if given, receives the bytes transferred, elapsed seconds,
+        throughput, retries and whether the asset cache answered the request.
+        sha256, if given, is the expected digest of the file.
+        """
+        if stats is None:
+            stats = {}
+        if not url:
+            raise ValueError("URL cannot be None or empty")
+        
+        if not filename:
+            filename = url.split('/')[-1]
+        
+        filepath = os.path.join(directory or self.temp_dir, filename)
+        
+        logger.info(f"Downloading {url} to {filepath}")
+        
+        start = time.perf_counter()
+        try:
+            if self.asset_cache:
+                self.asset_cache.fetch(self.session, url, filepath, stats=stats, sha256=sha256)
+            else:
+                with open(filepath, 'wb') as f:
+                    _, digest, size = download_stream(self.session, url, f, stats=stats)
+                verify_checksum(url, digest, sha256)
+                stats.update({'bytes': size, 'cache_hit': False})
+            
+            seconds = time.perf_counter() - start
+            stats['seconds'] = round(seconds, 3)
+            if stats['bytes'] and seconds:
+                stats['bytes_per_second'] = int(stats['bytes'] / seconds)
+            logger.info(f"Successfully downloaded {filename}")
+            return filepath
+            
+        except Exception as e:
+            logger.error(f"Failed to download {url}: {str(e)}")
+            raise
+    
+    def download_assets(self, assets, metrics=None, directory=None, checksums=None):
+        """
+        Download several assets concurrently
+        
+        Args:
+            assets (list): (name, url, filename) tuples
+            metrics (JobMetrics): Optional per-asset transfer stats sink
+            directory (str): Job workspace to download into
+            checksums (dict): Optional url -> expected SHA-256
+        
+        Returns:
+            dict: name -> local file path
+        """
+        if not assets:
+            return {}
+        
+        workers = min(MAX_DOWNLOAD_WORKERS, len(assets))
+        logger.info(f"Downloading {len(assets)} assets with {workers} workers")
+        
+        stats = {name: {} for name, _, _ in assets}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                name: executor.submit(self.download_file, url, filename, stats[name], directory,
+                                      (checksums or {}).get(url))
+                for name, url, filename in assets
+            }
+        
+        files = {}
+        errors = []
+        for name, url, _ in assets:
+            try:
+                files[name] = futures[name].result()
+            except Exception as e:
+                errors.append(f"{name} ({url}): {str(e)}")
+            if metrics:
+                metrics.record_asset(name, **stats[name])
+        
+        if errors:
+            raise Exception(f"Failed to download {len(errors)} asset(s): " + "; ".join(errors))
         
-    def download_file(self, url, filename=None):
-        """Download file from URL to temp directory"""
-        if not url:
-            raise ValueError("URL cannot be None or empty")
+        return files
+    
+    def content_hash(self, path):
+        """SHA-256 of a file, memoized per inode so cached hardlinks hash once"""
+        stat = os.stat(path)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        digest = self.content_hashes.get(key)
+        if digest is None:
+            digest = hash_file(path)
+            self.content_hashes[key] = digest
+        return digest
+    
+    def normalize_video(self, video_file):
+        """
+        Return a 720x1280/30fps/yuv420p H.264 intermediate of video_file,
+        transcoding it only the first time a given source is seen
+        """
+        source_hash = self.content_hash(video_file)
         
-        if not filename:
-            filename = url.split('/')[-1]
+        def build(output_path):
+            logger.info(f"Normalizing {video_file} to 720x1280")
+            # Normalizing is an encode too, so it takes its turn in the scheduler
+            with self.scheduler.reserve() as threads:
+                cmd = [
+                    'ffmpeg', '-y', '-i', video_file,
+                    '-map', '0:v:0', '-map', '0:a:0?',
+                    '-vf', 'scale=720:1280:force_original_aspect_ratio=increase,'
+                           'crop=720:1280,setsar=1,fps=30,format=yuv420p',
+                    '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18',
+                    '-threads', str(threads),
+                    '-c:a', 'aac', '-b:a', '192k',
+                    '-movflags', '+faststart',
+                    output_path
+                ]
+                result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise Exception(f"Normalization failed: {result.stderr}")
         
-        filepath = os.path.join(self.temp_dir, filename)
+        normalized_file = self.get_normalized_cache().get_or_create(source_hash, '.mp4', build)
+        logger.info(f"Using normalized B-roll {normalized_file}")
+        return normalized_file
+    
+    def prescale_overlays(self, image_files, image_infos):
+        """
+        Swap overlay images for cached copies already scaled to OVERLAY_SIZE
         
-        logger.info(f"Downloading {url} to {filepath}")
+        Stills become PNGs and animated images FFV1 Matroska (yuva420p, the
+        format overlay blends in), both keeping their alpha channel. Each
+        source is scaled once per content hash, so the encode graph only
+        loops small frames instead of scaling a full-size decode every frame.
+        Images that cannot be pre-scaled are left for the graph to scale.
+        
+        Returns:
+            tuple: (image_files, image_infos) with the scaled size in each info
+        """
+        files, infos = [], []
+        for image_file, info in zip(image_files, image_infos):
+            if info and not self.is_overlay_sized(info):
+                try:
+                    image_file = self.prescale_overlay(image_file, info)
+                    info = {**info, 'width': OVERLAY_SIZE, 'height': OVERLAY_SIZE}
+                except Exception as e:
+                    logger.warning(f"Could not pre-scale overlay {image_file}: {str(e)}")
+            files.append(image_file)
+            infos.append(info)
+        return files, infos
+    
+    def prescale_overlay(self, image_file, info):
+        """Return the cached OVERLAY_SIZE copy of one overlay image, building it on a miss"""
+        animated = info.get('video_codec') in ANIMATED_IMAGE_CODECS
+        
+        def build(output_path):
+            logger.info(f"Pre-scaling overlay {image_file}")
+            cmd = ['ffmpeg', '-y', '-i', image_file, '-vf', f'scale={OVERLAY_SIZE}:{OVERLAY_SIZE}']
+            if animated:
+                cmd.extend(['-c:v', 'ffv1', '-pix_fmt', 'yuva420p'])
+            else:
+                cmd.extend(['-frames:v', '1', '-update', '1'])
+            cmd.append(output_path)
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise Exception(f"Overlay pre-scale failed: {result.stderr}")
+        
+        return self.get_normalized_cache().get_or_create(
+            f'overlay_{self.content_hash(image_file)}_{OVERLAY_SIZE}', '.mkv' if animated else '.png', build
+        )
+    
+    def get_normalized_cache(self):
+        with self.cache_lock:
+            if self.normalized_cache is None:
+                self.normalized_cache = DerivedCache(NORMALIZED_CACHE_DIR, NORMALIZED_CACHE_MAX_BYTES)
+        return self.normalized_cache
+    
+    def black_segment(self):
+        """
+        Return a BLACK_SEGMENT_SECONDS 720x1280/30fps black H.264 segment
+        that voice-only outputs loop under their audio, encoding it once
+        """
+        def build(output_path):
+            logger.info("Encoding black background segment")
+            cmd = [
+                'ffmpeg', '-y',
+                '-f', 'lavfi', '-i', f'color=black:size=720x1280:rate=30:duration={BLACK_SEGMENT_SECONDS}',
+                '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+                '-pix_fmt', 'yuv420p',
+                '-g', str(BLACK_SEGMENT_SECONDS * 30),  # One keyframe, at the loop point
+                '-movflags', '+faststart',
+                output_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise Exception(f"Black segment encode failed: {result.stderr}")
+        
+        return self.get_normalized_cache().get_or_create(
+            f'black_720x1280_30fps_{BLACK_SEGMENT_SECONDS}s', '.mp4', build
+        )
+    
+    def probe_media(self, source):
+        """
+        Probe a local file or URL once with ffprobe
+        
+        Results of local files are memoized by content hash. Remote sources
+        are probed every time, since a URL can be re-pointed at new content.
+        
+        Returns:
+            dict: duration, has_video, has_audio, width, height, fps,
+                video_codec, pix_fmt, sample_aspect_ratio, audio_codec
+        """
+        is_remote = source.startswith(('http://', 'https://'))
+        key = None if is_remote else self.content_hash(source)
+        if key and key in self.probe_cache:
+            return self.probe_cache.get(key)
+        
+        cmd = [
+            'ffprobe', '-v', 'error', '-print_format', 'json',
+            '-show_format', '-show_streams', source
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"FFprobe failed for {source}: {result.stderr.strip()}")
+        
+        data = json.loads(result.stdout or '{}')
+        streams = data.get('streams', [])
+        video = next((st for st in streams if st.get('codec_type') == 'video'), None)
+        audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+        
+        duration = data.get('format', {}).get('duration')
+        info = {
+            'duration': float(duration) if duration not in (None, 'N/A') else None,
+            'has_video': video is not None,
+            'has_audio': audio is not None,
+            'width': None,
+            'height': None,
+            'fps': None,
+            'video_codec': None,
+            'pix_fmt': None,
+            'sample_aspect_ratio': None,
+            'audio_codec': audio.get('codec_name') if audio else None,
+        }
+        if video:
+            fps = None
+            rate = video.get('avg_frame_rate') or video.get('r_frame_rate') or '0/0'
+            num, _, den = rate.partition('/')
+            if den and float(den):
+                fps = round(float(num) / float(den), 3)
+            info.update({
+                'width': video.get('width'),
+                'height': video.get('height'),
+                'fps': fps,
+                'video_codec': video.get('codec_name'),
+                'pix_fmt': video.get('pix_fmt'),
+                'sample_aspect_ratio': video.get('sample_aspect_ratio'),
+            })
+        
+        if key:
+            self.probe_cache[key] = info
+        return info
+    
+    def probe_assets(self, files):
+        """
+        Probe several assets in parallel
+        
+        Args:
+            files (dict): name -> local path or URL
+        
+        Returns:
+            dict: name -> probe info (None if the asset could not be probed)
+        """
+        if not files:
+            return {}
+        
+        def probe(name):
+            try:
+                return self.probe_media(files[name])
+            except Exception as e:
+                logger.warning(f"Could not probe {name}: {str(e)}")
+                return None
+        
+        workers = min(MAX_DOWNLOAD_WORKERS, len(files))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(files, executor.map(probe, files)))
+    
+    def get_audio_duration(self, audio_file, audio_info=None):
+        """Get audio duration in seconds using FFprobe"""
+        try:
+            if audio_info is None:
+                audio_info = self.probe_media(audio_file)
+            duration = audio_info['duration']
+            if not duration:
+                raise ValueError("no duration reported")
+            logger.info(f"Audio duration: {duration} seconds")
+            return duration
+        except Exception as e:
+            logger.warning(f"Failed to get audio duration, falling back to 15s: {str(e)}")
+            return 15.0  # Default fallback
+    
+    def measure_loudness(self, audio_file):
+        """
+        First loudnorm pass over a voiceover
+        
+        Measurements of local files are memoized by content hash and kept in
+        the normalized cache, so other workers do not measure the same
+        voiceover again; remote sources are measured every time.
+        
+        Returns:
+            dict: input_i, input_tp, input_lra, input_thresh and target_offset,
+                or None when the audio is silent and cannot be normalized
+        """
+        if audio_file.startswith(('http://', 'https://')):
+            return self.run_loudness_pass(audio_file)
+        
+        key = self.content_hash(audio_file)
+        if key in self.loudness_cache:
+            return self.loudness_cache.get(key)
+        
+        def build(output_path):
+            with open(output_path, 'w') as f:
+                json.dump(self.run_loudness_pass(audio_file), f)
+        with open(self.get_normalized_cache().get_or_create(f'loudness_{key}', '.json', build)) as f:
+            measurements = json.load(f)
+        
+        self.loudness_cache[key] = measurements
+        return measurements
+    
+    def run_loudness_pass(self, audio_file):
+        """Measure a voiceover with loudnorm (see measure_loudness)"""
+        cmd = ['ffmpeg', '-hide_banner', '-nostats']
+        cmd.extend(self.input_args(audio_file))
+        cmd.extend([
+            '-map', '0:a:0',
+            '-af', f'loudnorm=I={LOUDNESS_TARGET:g}:TP={LOUDNESS_TRUE_PEAK:g}:LRA={LOUDNESS_RANGE:g}:print_format=json',
+            '-f', 'null', '-'
+        ])
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Loudness measurement failed: {result.stderr[-2000:]}")
+        
+        stats = json.loads(result.stderr[result.stderr.rindex('{'):result.stderr.rindex('}') + 1])
+        measurements = {
+            name: float(stats[name])
+            for name in ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset')
+        }
+        if not all(math.isfinite(value) for value in measurements.values()):
+            measurements = None
+        logger.info(f"Loudness of {os.path.basename(audio_file)}: {measurements}")
+        return measurements
+    
+    def premix_audio(self, audio_file, video_files, video_infos, output_file, total_duration,
+                     video_volume_reduction, profile, metrics=None,
+                     normalize_loudness=NORMALIZE_LOUDNESS, duck=DUCK_BACKGROUND):
+        """
+        Render the job's final AAC track (for the video encode to copy)
+        
+        Tracks of local inputs are kept in the normalized cache, keyed by the
+        content of the voiceover and clips plus the mix settings, so the same
+        voiceover over the same clips is mixed once. Remote inputs are read
+        once, with single-pass loudnorm instead of a measuring pass.
+        
+        Returns:
+            str: Path of the track (output_file, or its cached copy)
+        """
+        is_remote = any(source.startswith(('http://', 'https://')) for source in [audio_file] + list(video_files))
+        if not normalize_loudness:
+            loudness = None
+        elif is_remote:
+            loudness = 'dynamic'
+        else:
+            loudness = self.measure_loudness(audio_file)
+        
+        def build(output_path):
+            cmd = self.build_audio_mix_command(audio_file, video_files, video_infos, output_path,
+                                               total_duration, video_volume_reduction, profile,
+                                               loudness=loudness, duck=duck)
+            returncode, stderr = self.run_ffmpeg(cmd, metrics, report_progress=False)
+            if returncode != 0:
+                logger.error(f"FFmpeg failed: {stderr}")
+                raise Exception(f"FFmpeg processing failed: {stderr}")
+        
+        if is_remote:
+            build(output_file)
+            track = output_file
+        else:
+            key = hashlib.sha256(json.dumps({
+                'audio': self.content_hash(audio_file),
+                'videos': [self.content_hash(f) for f in video_files],
+                'duration': total_duration,
+                'video_volume_reduction': video_volume_reduction,
+                'audio_bitrate': profile['audio_bitrate'],
+                'loudness': [LOUDNESS_TARGET, LOUDNESS_TRUE_PEAK, LOUDNESS_RANGE] if loudness else None,
+                'duck': duck and DUCKING_FILTER,
+                'timeline': MIN_CLIP_SECONDS,
+            }, sort_keys=True).encode()).hexdigest()
+            track = self.get_normalized_cache().get_or_create(f'audio_{key}', '.m4a', build)
+        self.record_audio_mix(metrics, loudness, video_infos, duck)
+        return track
+    
+    def record_audio_mix(self, metrics, loudness, video_infos, duck):
+        """Add one track's mix settings to metrics.encode['audio']"""
+        if metrics:
+            metrics.encode.setdefault('audio', []).append({
+                'loudness_normalized': loudness is not None,
+                'input_lufs': loudness['input_i'] if isinstance(loudness, dict) else None,
+                'target_lufs': LOUDNESS_TARGET if loudness else None,
+                'ducked': duck and any(info is None or info.get('has_audio') for info in video_infos or []),
+            })
+    
+    def process_video(self, config, on_progress=None, cancel_event=None):
+        """
+        Main video processing function
         
+        Args:
+            config (dict): Processing configuration
+                - audio_url: URL to audio file
+                - video_urls: List of video URLs
+                - image_urls: List of image URLs  
+                - video_volume_reduction: Volume reduction percentage (default: 90)
+                - output_duration_extra: Extra seconds to add to audio duration (default: 1)
+                - timeout: Wall-clock seconds for the job (default: JOB_TIMEOUT)
+                - cpu_limit: CPU seconds per FFmpeg process (default: FFMPEG_CPU_LIMIT)
+                - normalize_loudness: Normalize the voiceover to LOUDNESS_TARGET
+                - duck_background: Duck the clip audio under the voiceover
+                - fast_path: Stream-copy the video when it needs no filtering (default: FAST_PATH)
+                - response_mode: 'inline' (default) or 'file' to return the kept output as video_file
+            on_progress (callable): Called with each FFmpeg progress update
+            cancel_event (threading.Event): Set to abort the job
+        """
+        metrics = JobMetrics(
+            on_progress=on_progress,
+            cancel_event=cancel_event,
+            timeout=config.get('timeout', JOB_TIMEOUT),
+            cpu_limit=config.get('cpu_limit', FFMPEG_CPU_LIMIT)
+        )
+        workspace = self.create_workspace()
+        try:
+            result = self.render_job(config, workspace, metrics)
+        finally:
+            with metrics.stage('cleanup'):
+                self.release_workspace(workspace)
+        result['metrics'] = metrics.to_dict()
+        return result
+    
+    def render_job(self, config, workspace, metrics):
+        """Download, probe, encode and deliver one job inside its workspace"""
         try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
+            # Extract configuration
+            audio_url = config.get('audio_url')
+            video_urls = config.get('video_urls', [])
+            image_urls = config.get('image_urls', [])
+            video_volume_reduction = config.get('video_volume_reduction', 90)
+            duration_extra = config.get('output_duration_extra', 1)
+            encoding_profile = config.get('encoding_profile', DEFAULT_ENCODING_PROFILE)
+            get_encoding_profile(encoding_profile)  # Fail fast on unknown profiles
+            normalize_loudness = config.get('normalize_loudness', NORMALIZE_LOUDNESS)
+            duck_background = config.get('duck_background', DUCK_BACKGROUND)
+            fast_path = config.get('fast_path', FAST_PATH)
+            response_mode = config.get('response_mode', 'inline')
+            if response_mode not in RESPONSE_MODES:
+                raise ValueError(f"Unknown response_mode '{response_mode}' (expected one of: {', '.join(RESPONSE_MODES)})")
+            output_format = config.get('output_format', 'mp4')
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError(f"Unknown output_format '{output_format}' (expected one of: {', '.join(OUTPUT_FORMATS)})")
             
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            logger.info("Starting Coach Joe video processing...")
+            logger.info(f"Audio URL: {audio_url}")
+            logger.info(f"Video URLs: {len(video_urls)} videos")
+            logger.info(f"Image URLs: {len(image_urls)} images")
             
-            logger.info(f"Successfully downloaded {filename}")
-            return filepath
+            # Validate required inputs
+            if not audio_url:
+                raise ValueError("audio_url is required and cannot be None or empty")
+            
+            # Ensure lists are not None
+            if video_urls is None:
+                video_urls = []
+            if image_urls is None:
+                image_urls = []
+            
+            # In stream mode ffmpeg reads audio/video over HTTP while encoding;
+            # images are small and are always downloaded
+            stream_inputs = config.get('stream_inputs', STREAM_INPUTS)
+            checksums = config.get('checksums')
+            video_urls = video_urls[:3]  # Limit to 3 videos
+            image_urls = image_urls[:2]  # Limit to 2 images
+            
+            # The voiceover length (read from its remote header) sets how many
+            # clips and overlays the timeline shows, so everything it needs is
+            # fetched in one concurrent round
+            with metrics.stage('probe'):
+                try:
+                    audio_header = self.probe_media(audio_url)
+                except Exception as e:
+                    logger.warning(f"Could not probe the audio header: {str(e)}")
+                    audio_header = None
+            estimated_duration = audio_header and audio_header['duration']
+            if estimated_duration:
+                clip_count = self.clips_needed(estimated_duration + duration_extra, len(video_urls))
+                overlay_count = len(self.schedule_overlays(estimated_duration + duration_extra, len(image_urls)))
+            else:
+                # Unknown length: fetch every input
+                clip_count = len(video_urls)
+                overlay_count = len(image_urls)
+            if not video_urls:
+                overlay_count = 0
+            sources = {'audio': audio_url}
+            sources.update({f'video_{i}': video_urls[i] for i in range(clip_count)})
+            sources.update({f'image_{i}': image_urls[i] for i in range(overlay_count)})
+            
+            # Scratch space and disk for the downloads are reserved before
+            # anything is fetched, so a job that cannot fit is turned away
+            # before it fills the disk (an MP4 is assumed to need its
+            # intermediates; without a header length the outputs are reserved
+            # once the inputs are probed)
+            input_bytes = self.estimate_input_bytes(
+                [url for name, url in sources.items() if not self.is_streamed(name, stream_inputs)]
+            )
+            scratch_dir = None
+            if estimated_duration:
+                scratch_dir = self.scratch.allocate(
+                    workspace,
+                    self.estimate_scratch_bytes([estimated_duration + duration_extra], output_format == 'mp4'),
+                    metrics, input_bytes
+                )
+            else:
+                self.scratch.reserve_inputs(workspace, input_bytes, metrics)
+            files, media_info = self.fetch_and_probe(sources, stream_inputs, workspace, metrics, checksums,
+                                                     probed={'audio': audio_header} if audio_header else None)
+            self.scratch.settle_inputs(workspace)
+            
+            audio_duration = self.get_audio_duration(files['audio'], media_info['audio'])
+            total_duration = audio_duration + duration_extra
+            metrics.expected_duration = total_duration
+            
+            unused = len(video_urls) - clip_count + len(image_urls) - overlay_count
+            if unused:
+                logger.info(f"Skipped {unused} asset(s) the timeline does not use")
+            
+            audio_file = files['audio']
+            video_files = [files[f'video_{i}'] for i in range(clip_count)]
+            video_infos = [media_info.get(f'video_{i}') for i in range(clip_count)]
+            image_files = [files[f'image_{i}'] for i in range(overlay_count)]
+            image_infos = [media_info.get(f'image_{i}') for i in range(overlay_count)]
+            video_files, video_infos, image_files, image_infos = self.drop_unplayable_clips(
+                video_files, video_infos, image_files, image_infos
+            )
+            
+            normalize_broll = config.get('normalize_broll', NORMALIZE_BROLL) and not stream_inputs
+            # A re-submitted identical job returns the earlier render (content
+            # hashes need local files, so streamed jobs are not cached);
+            # bypass_render_cache re-renders and refreshes the entry
+            cache_key = None
+            render_cache = 'disabled'
+            if RENDER_CACHE_ENABLED and not stream_inputs:
+                with metrics.stage('render_cache'):
+                    cache_key = self.render_cache_key(audio_file, video_files, image_files, {
+                        'video_volume_reduction': video_volume_reduction,
+                        'output_duration_extra': duration_extra,
+                        'encoding_profile': get_encoding_profile(encoding_profile),
+                        'output_format': output_format,
+                        'normalize_broll': normalize_broll,
+                        'loudness': [LOUDNESS_TARGET, LOUDNESS_TRUE_PEAK, LOUDNESS_RANGE] if normalize_loudness else None,
+                        'duck_background': duck_background and DUCKING_FILTER,
+                        'fast_path': fast_path,
+                    })
+                    if config.get('bypass_render_cache'):
+                        cached = None
+                        render_cache = 'bypass'
+                    else:
+                        cached = self.cached_render(cache_key, config, workspace, metrics)
+                        render_cache = 'miss'
+                if cached:
+                    return cached
+            
+            # Swap in cached 720x1280 intermediates so the encode can skip scale/crop
+            # (needs a local file, so not available when streaming inputs)
+            if normalize_broll and video_files:
+                with metrics.stage('normalize'):
+                    video_files = [self.normalize_video(f) for f in video_files]
+            
+            # Overlays are scaled once, outside the per-frame encode graph
+            if image_files:
+                with metrics.stage('overlays'):
+                    image_files, image_infos = self.prescale_overlays(image_files, image_infos)
+            
+            # Copy the video track when nothing in the graph touches it
+            render_path = 'encode'
+            if fast_path:
+                render_path = self.plan_render(video_files, video_infos, image_files, output_format,
+                                               normalize_broll)
+            
+            # Long outputs are encoded as parallel slices when every clip length is known
+            parallel_encode = (
+                render_path == 'encode'
+                and output_format == 'mp4' and config.get('parallel_encode', True) and video_files
+                and PARALLEL_ENCODE_WORKERS > 1
+                and total_duration >= PARALLEL_ENCODE_MIN_DURATION
+                and all(info and info.get('duration') for info in video_infos)
+            )
+            
+            # A single MP4 encode runs video-only while the audio track is
+            # premixed beside it, and the two are muxed without re-encoding
+            mux_audio = render_path == 'encode' and output_format == 'mp4' and not stream_inputs
+            
+            # Intermediates and the output go to tmpfs or disk by estimated size
+            # (freed with the workspace)
+            if scratch_dir is None:
+                scratch_dir = self.scratch.allocate(
+                    workspace, self.estimate_scratch_bytes([total_duration], parallel_encode or mux_audio), metrics
+                )
+            
+            # Generate output filename
+            output_file = self.output_path(scratch_dir, output_format)
+            
+            def premix():
+                # The final audio track is mixed and encoded once (cached for local inputs)
+                with metrics.stage('audio_mix'):
+                    return self.premix_audio(
+                        audio_file, video_files, video_infos,
+                        os.path.join(scratch_dir, 'audio_mix.m4a'), total_duration,
+                        video_volume_reduction, get_encoding_profile(encoding_profile), metrics,
+                        normalize_loudness, duck_background
+                    )
+            
+            # Streamed inputs are mixed in the FFmpeg run that writes the
+            # output, so each remote file is read once (single-pass loudnorm)
+            stream_loudness = 'dynamic' if normalize_loudness else None
+            
+            if render_path != 'encode':
+                audio_track = None if stream_inputs else premix()
+                # Stream copy is I/O bound, so it skips the encode scheduler
+                with metrics.stage('encode'):
+                    video_source = self.black_segment() if render_path == 'copy_black' else video_files[0]
+                    if stream_inputs:
+                        copy_cmd = self.build_audio_mix_command(
+                            audio_file, video_files, video_infos, output_file, total_duration,
+                            video_volume_reduction, get_encoding_profile(encoding_profile),
+                            loudness=stream_loudness, duck=duck_background, video_source=video_source
+                        )
+                        self.record_audio_mix(metrics, stream_loudness, video_infos, duck_background)
+                    else:
+                        copy_cmd = self.build_copy_command(video_source, audio_track, output_file, total_duration)
+                    logger.info(f"Render path {render_path}: {' '.join(copy_cmd)}")
+                    returncode, stderr = self.run_ffmpeg(copy_cmd, metrics)
+                if returncode != 0:
+                    logger.error(f"FFmpeg failed: {stderr}")
+                    raise Exception(f"FFmpeg processing failed: {stderr}")
+                result = self.deliver_output(output_file, config, total_duration, media_info,
+                                             metrics, encoding_profile)
+                result['render_path'] = render_path
+                return self.remember_render(cache_key, result, output_file, render_cache)
+            
+            if parallel_encode:
+                # Parallel slices reserve the whole CPU budget
+                with self.scheduler.reserve(metrics, cpus=self.scheduler.cpu_budget) as cpus:
+                    with metrics.stage('encode'):
+                        self.encode_parallel(
+                            audio_file=audio_file,
+                            video_files=video_files,
+                            video_infos=video_infos,
+                            image_files=image_files,
+                            image_infos=image_infos,
+                            output_file=output_file,
+                            total_duration=total_duration,
+                            video_volume_reduction=video_volume_reduction,
+                            normalized_video=normalize_broll,
+                            encoding_profile=encoding_profile,
+                            workspace=scratch_dir,
+                            metrics=metrics,
+                            cpus=cpus,
+                            premix=premix
+                        )
+                result = self.deliver_output(output_file, config, total_duration, media_info,
+                                             metrics, encoding_profile)
+                result['render_path'] = 'parallel_encode'
+                return self.remember_render(cache_key, result, output_file, render_cache)
+            
+            # HLS segments are uploaded as they are written, so their audio is
+            # premixed first; streamed inputs are mixed in the graph
+            encode_file = os.path.join(scratch_dir, 'video.mp4') if mux_audio else output_file
+            if stream_inputs:
+                self.record_audio_mix(metrics, stream_loudness, video_infos, duck_background)
+            
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                if mux_audio:
+                    audio_future = executor.submit(premix)
+                    audio_track = None
+                else:
+                    audio_track = None if stream_inputs else premix()
+                
+                # Wait for CPU/memory budget; the reservation sets -threads
+                with self.scheduler.reserve(metrics) as threads:
+                    # Build and execute FFmpeg command
+                    with metrics.stage('filter_build'):
+                        ffmpeg_cmd = self.build_ffmpeg_command(
+                            audio_file=None if mux_audio else audio_file,
+                            video_files=video_files,
+                            image_files=image_files,
+                            image_infos=image_infos,
+                            output_file=encode_file,
+                            total_duration=total_duration,
+                            video_volume_reduction=video_volume_reduction,
+                            normalized_video=normalize_broll,
+                            video_infos=video_infos,
+                            encoding_profile=encoding_profile,
+                            output_format=output_format,
+                            threads=threads,
+                            premixed_audio=audio_track,
+                            loudness=stream_loudness,
+                            duck=duck_background
+                        )
+                    
+                    logger.info("Executing FFmpeg command...")
+                    logger.info(f"Command: {' '.join(ffmpeg_cmd)}")
+                    
+                    # HLS segments are uploaded while FFmpeg is still encoding
+                    uploader = None
+                    if output_format == 'hls':
+                        directory = os.path.dirname(output_file)
+                        uploader = SegmentUploader(
+                            self.stream_upload, directory,
+                            f"{SUPABASE_VIDEO_BUCKET}/{os.path.basename(directory)}",
+                            enabled=config.get('upload_mode', UPLOAD_MODE) == 'stream'
+                        ).start()
+                    
+                    with metrics.stage('encode'):
+                        try:
+                            returncode, stderr = self.run_ffmpeg(ffmpeg_cmd, metrics)
+                        finally:
+                            streamed = uploader.finish() if uploader else None
+            
+            if returncode == 0 and mux_audio:
+                # Join the video with the premixed track (waited for above)
+                with metrics.stage('encode'):
+                    mux_cmd = self.build_copy_command(encode_file, audio_future.result(), output_file,
+                                                      total_duration, loop=False)
+                    returncode, stderr = self.run_ffmpeg(mux_cmd, metrics, report_progress=False)
+            
+            if returncode != 0:
+                logger.error(f"FFmpeg failed: {stderr}")
+                raise Exception(f"FFmpeg processing failed: {stderr}")
+            
+            logger.info("FFmpeg processing completed successfully")
+            
+            result = self.deliver_output(output_file, config, total_duration, media_info,
+                                         metrics, encoding_profile, streamed)
+            result['render_path'] = render_path
+            return self.remember_render(cache_key, result, output_file, render_cache)
             
         except Exception as e:
-            logger.error(f"Failed to download {url}: {str(e)}")
-            raise
+            logger.error(f"Video processing failed: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat(),
+                'metrics': metrics.to_dict()
+            }
+    
+    def plan_render(self, video_files, video_infos, image_files, output_format, normalized_video=False):
+        """
+        Pick the cheapest valid way to produce a job's video track
+        
+        Only the audio is ever re-encoded on the copy paths (by premix_audio).
+        
+        Returns:
+            str: 'copy_black' (loop the cached black_segment), 'copy_clip'
+                (stream-copy the only clip) or 'encode' (full filter graph)
+        """
+        if output_format != 'mp4':
+            # HLS segments need keyframes forced at their boundaries
+            return 'encode'
+        if not video_files:
+            return 'copy_black'
+        if len(video_files) == 1 and not image_files:
+            info = video_infos[0] if video_infos else None
+            if normalized_video or self.is_copyable(info):
+                return 'copy_clip'
+        return 'encode'
+    
+    def is_copyable(self, info):
+        """True when a probed clip can go into the output without re-encoding"""
+        return (
+            self.is_vertical(info) and info.get('video_codec') == 'h264'
+            and info.get('pix_fmt') == 'yuv420p' and info.get('fps') == 30
+        )
+    
+    def estimate_scratch_bytes(self, durations, parallel=False):
+        """
+        Scratch bytes needed for outputs of the given lengths (seconds)
+        
+        Parallel encodes and encodes muxed with a separate audio track
+        hold the video-only intermediates and the joined output at once.
+        """
+        estimate = int(sum(durations) * SCRATCH_BYTES_PER_SECOND)
+        if parallel:
+            estimate *= 2
+        return estimate
+    
+    def estimate_input_bytes(self, urls):
+        """
+        Disk bytes that downloading urls will add, read before downloading
+        
+        Assets already in the asset cache are hardlinked and add nothing;
+        the rest are sized by a HEAD request's Content-Length (0 when the
+        server does not say).
+        """
+        def size(url):
+            if self.asset_cache and self.asset_cache.lookup(url):
+                return 0
+            try:
+                response = self.session.head(url, allow_redirects=True,
+                                             timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT))
+                return int(response.headers.get('Content-Length', 0)) if response.ok else 0
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Could not size {url}: {str(e)}")
+                return 0
+        
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOAD_WORKERS, len(urls))) as executor:
+            return sum(executor.map(size, urls))
+    
+    def get_render_cache(self):
+        with self.cache_lock:
+            if self.render_cache is None:
+                self.render_cache = RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES, RENDER_CACHE_TTL)
+        return self.render_cache
+    
+    def render_cache_key(self, audio_file, video_files, image_files, settings):
+        """Hash of the input contents, render settings, timeline rules and FFmpeg version"""
+        payload = {
+            'audio': self.content_hash(audio_file),
+            'videos': [self.content_hash(f) for f in video_files],
+            'images': [self.content_hash(f) for f in image_files],
+            'settings': settings,
+            'timeline': [MIN_CLIP_SECONDS, OVERLAY_START, OVERLAY_DURATION, OVERLAY_INTERVAL],
+            'ffmpeg': self.ffmpeg_capabilities()['version'],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    
+    def cached_render(self, cache_key, config, workspace, metrics):
+        """
+        Response for a cached render, or None on a miss
+        
+        Uploaded outputs are returned as they are. Outputs that were never
+        uploaded (or jobs asking for video_data or a video_file) are delivered
+        again from the cached file without re-encoding.
+        """
+        entry = self.get_render_cache().lookup(cache_key)
+        if not entry:
+            return None
+        response, cached_file = entry
+        
+        wants_file = config.get('include_video_data', False) or config.get('response_mode') == 'file'
+        if response.get('uploaded') and not wants_file:
+            logger.info(f"Render cache hit {cache_key[:12]}: returning {response.get('video_url')}")
+            return {
+                **response,
+                'processing_time': datetime.now().isoformat(),
+                'render_cache': 'hit',
+                'metrics': metrics.to_dict()
+            }
+        if not cached_file:
+            return None
+        
+        logger.info(f"Render cache hit {cache_key[:12]}: delivering cached file")
+        output_file = self.output_path(workspace)
+        link_or_copy(cached_file, output_file)
+        result = self.deliver_output(output_file, config, response['duration'], response.get('inputs'),
+                                     metrics, response['specs']['encoding_profile'])
+        if result.get('uploaded') and not response.get('uploaded'):
+            # Later hits can return the uploaded URL directly
+            self.remember_render(cache_key, result, None, 'hit')
+        result['render_cache'] = 'hit'
+        return result
+    
+    def remember_render(self, cache_key, result, output_file, render_cache):
+        """Store a successful render under cache_key and tag the response"""
+        result['render_cache'] = render_cache
+        if cache_key and result.get('success'):
+            streamed = result['specs']['format'] == 'hls'
+            if streamed and not result.get('uploaded'):
+                # Local segments are deleted with the workspace
+                return result
+            response = {
+                k: v for k, v in result.items() if k not in ('video_data', 'video_file', 'metrics', 'render_cache')
+            }
+            try:
+                self.get_render_cache().store(cache_key, response, None if streamed else output_file)
+            except OSError as e:
+                logger.warning(f"Could not cache render: {str(e)}")
+        return result
+    
+    def fetch_and_probe(self, sources, stream_inputs, workspace, metrics, checksums=None, probed=None):
+        """
+        Download (unless streamed) and probe a set of named job inputs
+        
+        Args:
+            sources (dict): name ('audio', 'video_N', 'image_N') -> URL
+            checksums (dict): Optional url -> expected SHA-256 of downloaded inputs
+            probed (dict): name -> probe info this job already took of the
+                remote source, reused for inputs that stay streamed
+        
+        Returns:
+            tuple: (name -> local path or URL, name -> probe info)
+        """
+        metrics.check()
+        filenames = {'audio': 'coach_joe_audio.mp3', 'video': '{}.mp4', 'image': '{}.jpg'}
+        assets = []
+        files = {}
+        for name, url in sources.items():
+            if self.is_streamed(name, stream_inputs):
+                files[name] = url
+            else:
+                assets.append((name, url, filenames[name.split('_')[0]].format(name)))
+        
+        with metrics.stage('download'):
+            files.update(self.download_assets(assets, metrics, workspace, checksums))
+        
+        # Probe every input once, in parallel (ffprobe reads only the
+        # container header of a remote source)
+        probed = {name: info for name, info in (probed or {}).items() if files.get(name) == sources.get(name)}
+        with metrics.stage('probe'):
+            media_info = self.probe_assets({name: path for name, path in files.items() if name not in probed})
+        media_info.update(probed)
+        return files, media_info
+    
+    def is_streamed(self, name, stream_inputs):
+        """Whether job input name is read by FFmpeg over HTTP instead of downloaded"""
+        return stream_inputs and not name.startswith('image_')
+    
+    def clips_needed(self, total_duration, available):
+        """How many clips fit the timeline with at least MIN_CLIP_SECONDS each"""
+        if not available:
+            return 0
+        return max(1, min(available, int(total_duration // MIN_CLIP_SECONDS)))
+    
+    def sequence_clips(self, total_duration, clip_durations):
+        """
+        Lay clips end to end across total_duration
+        
+        The first pass gives each clip an even share of the remaining time
+        (capped at its own length); if the clips are too short to fill the
+        timeline the sequence repeats. Every segment lasts at least
+        MIN_CLIP_SECONDS (except the last), and a segment continues its clip
+        where the previous one stopped: source_start is a position in the
+        clip looped end to end, so each clip is read as one looped input.
+        Clips shorter than a frame are skipped.
+        
+        Args:
+            clip_durations (list): Probed clip lengths (None if unknown)
+        
+        Returns:
+            list: {'clip', 'source_start', 'duration'} segments in play order
+        """
+        usable = [i for i, clip_duration in enumerate(clip_durations) if self.is_playable_clip(clip_duration)]
+        if len(usable) <= 1:
+            return [{'clip': i, 'source_start': 0, 'duration': total_duration} for i in usable]
+        
+        segments = []
+        played = dict.fromkeys(usable, 0)
+        remaining = total_duration
+        first_pass = True
+        while remaining > 0.01:
+            for n, i in enumerate(usable):
+                if remaining <= 0.01:
+                    break
+                available = clip_durations[i] or float('inf')
+                share = remaining / (len(usable) - n) if first_pass else remaining
+                duration = round(min(max(min(share, available), MIN_CLIP_SECONDS), remaining), 3)
+                segments.append({'clip': i, 'source_start': played[i], 'duration': duration})
+                played[i] = round(played[i] + duration, 3)
+                remaining -= duration
+            first_pass = False
+        return segments
+    
+    def drop_unplayable_clips(self, video_files, video_infos, image_files, image_infos):
+        """
+        Remove clips shorter than one frame (without clips, overlays go too)
+        
+        Returns:
+            tuple: (video_files, video_infos, image_files, image_infos)
+        """
+        playable = [i for i, info in enumerate(video_infos) if self.is_playable_clip((info or {}).get('duration'))]
+        if len(playable) == len(video_files):
+            return video_files, video_infos, image_files, image_infos
+        
+        logger.warning(f"Skipping {len(video_files) - len(playable)} clip(s) shorter than one frame")
+        video_files = [video_files[i] for i in playable]
+        video_infos = [video_infos[i] for i in playable]
+        if not video_files:
+            return [], [], [], []
+        return video_files, video_infos, image_files, image_infos
+    
+    def is_playable_clip(self, clip_duration):
+        """Whether a clip of the probed length (None if unknown) lasts at least one frame"""
+        return clip_duration is None or clip_duration >= 1 / 30
+    
+    def clip_layout(self, total_duration, clip_durations):
+        """
+        The sequence_clips layout to the second, for grouping batch jobs
+        
+        A lone clip is shown from its start at any length, so outputs of
+        different lengths share it; otherwise every segment has to match.
+        """
+        segments = self.sequence_clips(total_duration, clip_durations)
+        if len(segments) <= 1:
+            return tuple(segment['clip'] for segment in segments)
+        return tuple((segment['clip'], round(segment['duration'])) for segment in segments)
+    
+    def schedule_overlays(self, total_duration, image_count):
+        """
+        Overlay windows for up to image_count images within the timeline
+        
+        Returns:
+            list: (start, end) seconds, one per image that gets shown
+        """
+        windows = []
+        for i in range(image_count):
+            start = OVERLAY_START + i * OVERLAY_INTERVAL
+            if start + 1 > total_duration:
+                # Not worth a sub-second flash at the very end
+                break
+            windows.append((start, min(start + OVERLAY_DURATION, total_duration)))
+        return windows
+    
+    def run_ffmpeg(self, cmd, metrics=None, report_progress=True):
+        """
+        Run an FFmpeg command, parsing its -progress output as it encodes
+        
+        The process runs under asyncio so progress, a bounded stderr tail,
+        the job deadline and cancellation are all handled without blocking
+        on any one pipe. With metrics, progress is reported through
+        metrics.progress() (unless report_progress is False), the process's
+        memory is sampled into metrics.sample_memory() and the job's cancel
+        event, deadline and CPU limit are enforced.
+        
+        Returns:
+            tuple: (returncode, stderr tail)
+        
+        Raises:
+            JobCancelled: The job was cancelled while FFmpeg was running
+            JobTimeout: FFmpeg ran past the job deadline or its CPU limit
+        """
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+        timeout = None
+        cancel_event = None
+        cpu_limit = FFMPEG_CPU_LIMIT
+        on_memory = None
+        if metrics:
+            on_memory = metrics.sample_memory
+            metrics.check()
+            timeout = metrics.remaining()
+            cancel_event = metrics.cancel_event
+            cpu_limit = metrics.cpu_limit
+        
+        def on_progress(progress):
+            if metrics and report_progress:
+                metrics.progress(self.parse_progress(progress))
+        
+        returncode, stderr, stopped = run_coroutine(
+            self.run_ffmpeg_async(cmd, on_progress, timeout, cancel_event, cpu_limit, on_memory)
+        )
+        if stopped == 'cancelled':
+            raise JobCancelled("Job was cancelled")
+        if stopped == 'timeout':
+            raise JobTimeout(f"FFmpeg exceeded the job's {metrics.timeout}s deadline")
+        # FFmpeg traps SIGXCPU and exits on its own; the hard limit kills it outright
+        if cpu_limit and returncode != 0 and (
+            returncode in (-signal.SIGXCPU, -signal.SIGKILL)
+            or f"received signal {int(signal.SIGXCPU)}" in stderr
+        ):
+            raise JobTimeout(f"FFmpeg exceeded its {cpu_limit}s CPU limit")
+        return returncode, stderr
+    
+    async def run_ffmpeg_async(self, cmd, on_progress, timeout=None, cancel_event=None, cpu_limit=None,
+                               on_memory=None):
+        """
+        Run FFmpeg as an asyncio subprocess
+        
+        on_memory(pid, running) is called every MEMORY_SAMPLE_INTERVAL while
+        the process runs and once with running=False after it exits.
+        
+        Returns:
+            tuple: (returncode, stderr tail, None or 'cancelled'/'timeout' when stopped)
+        """
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        if cpu_limit:
+            # Set on the running child: preexec_fn is not safe in a threaded
+            # worker, and RLIMIT_CPU counts the CPU time it used before this
+            import resource
+            try:
+                resource.prlimit(process.pid, resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 5))
+            except ProcessLookupError:
+                pass
+        stderr_tail = deque(maxlen=FFMPEG_STDERR_LINES)
+        
+        async def read_progress():
+            progress = {}
+            async for line in process.stdout:
+                key, _, value = line.decode(errors='replace').strip().partition('=')
+                if key:
+                    progress[key] = value
+                if key == 'progress':
+                    on_progress(progress)
+        
+        async def read_stderr():
+            async for line in process.stderr:
+                stderr_tail.append(line.decode(errors='replace'))
+        
+        async def cancelled():
+            while not cancel_event.is_set():
+                await asyncio.sleep(0.2)
+        
+        async def sample_memory():
+            while process.returncode is None:
+                on_memory(process.pid)
+                await asyncio.sleep(MEMORY_SAMPLE_INTERVAL)
+        
+        finished = asyncio.ensure_future(asyncio.gather(read_progress(), read_stderr(), process.wait()))
+        waiters = [finished]
+        if cancel_event:
+            waiters.append(asyncio.ensure_future(cancelled()))
+        sampler = asyncio.ensure_future(sample_memory()) if on_memory else None
+        
+        done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        stopped = None
+        if finished not in done:
+            stopped = 'cancelled' if cancel_event and cancel_event.is_set() else 'timeout'
+            logger.warning(f"Stopping FFmpeg ({stopped})")
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), 5)
+            except asyncio.TimeoutError:
+                process.kill()
+            await finished
+        for waiter in waiters[1:]:
+            waiter.cancel()
+        if sampler:
+            sampler.cancel()
+            on_memory(process.pid, running=False)
+        
+        return process.returncode, ''.join(stderr_tail), stopped
+    
+    def encode_parallel(self, audio_file, video_files, video_infos, image_files, image_infos,
+                        output_file, total_duration, video_volume_reduction, normalized_video,
+                        encoding_profile, workspace, metrics, workers=PARALLEL_ENCODE_WORKERS, cpus=None,
+                        premix=None):
+        """
+        Encode the timeline as GOP-aligned slices in parallel FFmpeg processes
+        
+        Every slice is a video-only encode of its part of the timeline; the
+        audio is mixed once into its own stream alongside them (by premix,
+        a callable returning the final track, when given). The slices are
+        joined with the concat demuxer and muxed with the audio without
+        re-encoding.
+        metrics.encode['parallel'] reports the slicing and wall time; the
+        speedup over one process is measured by benchmarks/parallel_encode.py
+        (summed process times only show how much ran concurrently). The
+        slices share `cpus` encoder threads (default: all cores).
+        """
+        if isinstance(encoding_profile, dict):
+            profile = encoding_profile
+        else:
+            profile = get_encoding_profile(encoding_profile)
+        
+        windows = self.segment_windows(total_duration, workers)
+        threads = ENCODER_THREADS or max(1, (cpus or os.cpu_count() or 1) // min(workers, len(windows)))
+        segment_dir = tempfile.mkdtemp(prefix='segments_', dir=workspace)
+        
+        segment_files = [os.path.join(segment_dir, f'segment_{i:03d}.mp4') for i in range(len(windows))]
+        commands = []
+        for window, segment_file in zip(windows, segment_files):
+            commands.append(self.build_segment_command(
+                video_files, video_infos, image_files, image_infos, segment_file,
+                total_duration, window, normalized_video, profile, threads
+            ))
+        
+        logger.info(f"Encoding {len(windows)} slices with {workers} parallel FFmpeg processes")
+        
+        def run(cmd):
+            returncode, stderr = self.run_ffmpeg(cmd, metrics, report_progress=False)
+            if returncode != 0:
+                logger.error(f"FFmpeg failed: {stderr}")
+                raise Exception(f"FFmpeg processing failed: {stderr}")
+        
+        if not premix:
+            audio_command = self.build_audio_mix_command(
+                audio_file, video_files, video_infos, os.path.join(segment_dir, 'audio.m4a'),
+                total_duration, video_volume_reduction, profile
+            )
+            
+            def premix():
+                run(audio_command)
+                return audio_command[-1]
+        
+        started = time.perf_counter()
+        # One thread per slice plus one for the premix, so the audio never
+        # waits for a free slice slot (slices are already capped by workers)
+        with ThreadPoolExecutor(max_workers=len(commands) + 1) as executor:
+            audio_future = executor.submit(premix)
+            list(executor.map(run, commands))
+            audio_output = audio_future.result()
+        
+        concat_list = os.path.join(segment_dir, 'segments.txt')
+        with open(concat_list, 'w') as f:
+            # The demuxer resolves relative entries against the list's directory
+            f.writelines(f"file '{os.path.abspath(segment_file)}'\n" for segment_file in segment_files)
+        run([
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0', '-i', concat_list,
+            '-i', audio_output,
+            '-map', '0:v', '-map', '1:a',
+            '-c', 'copy',
+            '-t', str(total_duration),
+            '-movflags', '+faststart',
+            output_file
+        ])
+        wall_seconds = time.perf_counter() - started
+        
+        metrics.encode['parallel'] = {
+            'segments': len(windows),
+            'workers': len(commands),
+            'threads_per_segment': threads,
+            'wall_seconds': round(wall_seconds, 3)
+        }
+        logger.info(f"Parallel encode: {metrics.encode['parallel']}")
+    
+    def segment_windows(self, total_duration, workers):
+        """Split the timeline into about `workers` slices on SEGMENT_GOP_SECONDS boundaries"""
+        length = max(1, math.ceil(total_duration / workers / SEGMENT_GOP_SECONDS)) * SEGMENT_GOP_SECONDS
+        windows = []
+        start = 0
+        while start < total_duration - 0.001:
+            windows.append((start, min(start + length, total_duration)))
+            start += length
+        return windows
     
-    def get_audio_duration(self, audio_file):
-        """Get audio duration in seconds using FFprobe"""
-        try:
-            cmd = [
-                'ffprobe', '-v', 'quiet', '-show_entries', 'format=duration',
-                '-of', 'csv=p=0', audio_file
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            duration = float(result.stdout.strip())
-            logger.info(f"Audio duration: {duration} seconds")
-            return duration
-        except Exception as e:
-            logger.error(f"Failed to get audio duration: {str(e)}")
-            return 15.0  # Default fallback
+    def parse_progress(self, progress):
+        """Convert a block of ffmpeg -progress key=value pairs to metrics"""
+        def number(key, cast=float):
+            try:
+                return cast(progress.get(key, '').rstrip('x'))
+            except ValueError:
+                return None
+        
+        out_time_us = number('out_time_us', int)
+        return {
+            'frames': number('frame', int),
+            'fps': number('fps'),
+            'speed': number('speed'),
+            'out_time_seconds': round(out_time_us / 1e6, 3) if out_time_us else None,
+            'total_size': number('total_size', int),
+            'dup_frames': number('dup_frames', int),
+            'drop_frames': number('drop_frames', int),
+            'state': progress.get('progress'),
+        }
     
-    def process_video(self, config):
+    def process_batch(self, configs, max_concurrency=None, on_progress=None, cancel_event=None, timeout=JOB_TIMEOUT):
         """
-        Main video processing function
+        Render several videos, sharing downloads and probes between them
+        
+        Configs that use the same background clip, overlay, volume and
+        encoding profile are rendered by one FFmpeg process with one output
+        per voiceover; everything else is rendered individually. Up to
+        max_concurrency FFmpeg processes run at once.
         
         Args:
-            config (dict): Processing configuration
-                - audio_url: URL to audio file
-                - video_urls: List of video URLs
-                - image_urls: List of image URLs  
-                - video_volume_reduction: Volume reduction percentage (default: 90)
-                - output_duration_extra: Extra seconds to add to audio duration (default: 1)
+            configs (list): process_video configs
+            max_concurrency (int): Parallel FFmpeg processes (default: BATCH_CONCURRENCY)
+            on_progress (callable): Called with each FFmpeg progress update
+            cancel_event (threading.Event): Set to abort the batch
+            timeout (int): Wall-clock seconds for the whole batch
+        
+        Returns:
+            dict: success, results (in config order), groups, metrics
         """
+        metrics = JobMetrics(on_progress=on_progress, cancel_event=cancel_event, timeout=timeout)
+        max_concurrency = max_concurrency or BATCH_CONCURRENCY
+        workspace = self.create_workspace()
         try:
-            # Extract configuration
-            audio_url = config.get('audio_url')
-            video_urls = config.get('video_urls', [])
-            image_urls = config.get('image_urls', [])
-            video_volume_reduction = config.get('video_volume_reduction', 90)
-            duration_extra = config.get('output_duration_extra', 1)
-            
-            logger.info("Starting Coach Joe video processing...")
-            logger.info(f"Audio URL: {audio_url}")
-            logger.info(f"Video URLs: {len(video_urls)} videos")
-            logger.info(f"Image URLs: {len(image_urls)} images")
-            
-            # Validate required inputs
-            if not audio_url:
-                raise ValueError("audio_url is required and cannot be None or empty")
-            
-            # Ensure lists are not None
-            if video_urls is None:
-                video_urls = []
-            if image_urls is None:
-                image_urls = []
+            result = self.render_batch(configs, max_concurrency, workspace, metrics)
+        finally:
+            with metrics.stage('cleanup'):
+                self.release_workspace(workspace)
+        result['metrics'] = metrics.to_dict()
+        return result
+    
+    def render_batch(self, configs, max_concurrency, workspace, metrics):
+        """Download, group and render a batch inside its workspace"""
+        try:
+            if not configs:
+                raise ValueError("configs must be a non-empty list")
             
-            # Download audio file
-            audio_file = self.download_file(audio_url, 'coach_joe_audio.mp3')
-            audio_duration = self.get_audio_duration(audio_file)
-            total_duration = audio_duration + duration_extra
+            # Validate and normalize every config up front
+            jobs = []
+            for index, config in enumerate(configs):
+                if not config.get('audio_url'):
+                    raise ValueError(f"configs[{index}]: audio_url is required and cannot be None or empty")
+                encoding_profile = config.get('encoding_profile', DEFAULT_ENCODING_PROFILE)
+                get_encoding_profile(encoding_profile)
+                if config.get('response_mode', 'inline') not in RESPONSE_MODES:
+                    raise ValueError(f"configs[{index}]: unknown response_mode '{config['response_mode']}'")
+                # Batch members share downloads, FFmpeg runs and the batch's
+                # deadline, so these per-job options cannot be honored
+                if config.get('output_format', 'mp4') != 'mp4':
+                    raise ValueError(f"configs[{index}]: output_format '{config['output_format']}' is not "
+                                     f"supported in a batch (batches render mp4)")
+                if config.get('stream_inputs'):
+                    raise ValueError(f"configs[{index}]: stream_inputs is not supported in a batch "
+                                     f"(batch inputs are downloaded once and shared)")
+                for key in ('timeout', 'cpu_limit'):
+                    if key in config:
+                        raise ValueError(f"configs[{index}]: {key} is not supported per config in a batch")
+                jobs.append({
+                    'index': index,
+                    'config': config,
+                    'audio_url': config['audio_url'],
+                    'video_urls': (config.get('video_urls') or [])[:3],
+                    'image_urls': (config.get('image_urls') or [])[:2],
+                    'video_volume_reduction': config.get('video_volume_reduction', 90),
+                    'duration_extra': config.get('output_duration_extra', 1),
+                    'encoding_profile': encoding_profile,
+                    'normalize_broll': config.get('normalize_broll', NORMALIZE_BROLL),
+                    'normalize_loudness': config.get('normalize_loudness', NORMALIZE_LOUDNESS),
+                    'duck_background': config.get('duck_background', DUCK_BACKGROUND),
+                    'fast_path': config.get('fast_path', FAST_PATH),
+                })
             
-            # Download video files
-            video_files = []
-            for i, url in enumerate(video_urls[:3]):  # Limit to 3 videos
-                video_file = self.download_file(url, f'video_{i}.mp4')
-                video_files.append(video_file)
+            logger.info(f"Starting Coach Joe batch of {len(jobs)} videos...")
             
-            # Download image files
-            image_files = []
-            for i, url in enumerate(image_urls[:2]):  # Limit to 2 images
-                image_file = self.download_file(url, f'image_{i}.jpg')
-                image_files.append(image_file)
+            # Download and probe each unique asset once
+            urls = []
+            for job in jobs:
+                for url in [job['audio_url']] + job['video_urls'] + job['image_urls']:
+                    if url not in urls:
+                        urls.append(url)
+            assets = [
+                (f'asset_{i}', url, f"asset_{i}{os.path.splitext(url.split('?')[0])[1]}")
+                for i, url in enumerate(urls)
+            ]
+            checksums = {}
+            for job in jobs:
+                checksums.update(job['config'].get('checksums') or {})
+            # Disk for the shared downloads is reserved up front; each FFmpeg
+            # run reserves its own outputs
+            self.scratch.reserve_inputs(workspace, self.estimate_input_bytes(urls), metrics)
+            with metrics.stage('download'):
+                files = self.download_assets(assets, metrics, workspace, checksums)
+            self.scratch.settle_inputs(workspace)
+            local = {url: files[f'asset_{i}'] for i, url in enumerate(urls)}
             
-            # Generate output filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_file = os.path.join(self.temp_dir, f'coach_joe_video_{timestamp}.mp4')
-            
-            # Build and execute FFmpeg command
-            ffmpeg_cmd = self.build_ffmpeg_command(
-                audio_file=audio_file,
-                video_files=video_files,
-                image_files=image_files,
-                output_file=output_file,
-                total_duration=total_duration,
-                video_volume_reduction=video_volume_reduction
-            )
+            with metrics.stage('probe'):
+                probed = self.probe_assets(local)
             
-            logger.info("Executing FFmpeg command...")
-            logger.info(f"Command: {' '.join(ffmpeg_cmd)}")
+            # Group configs whose clips, overlays and clip layout are identical
+            # (the shared timeline is laid out for the longest member)
+            groups = {}
+            for job in jobs:
+                duration = self.get_audio_duration(local[job['audio_url']], probed.get(job['audio_url']))
+                duration += job['duration_extra']
+                video_urls = job['video_urls'][:self.clips_needed(duration, len(job['video_urls']))]
+                key = (
+                    tuple(job['video_urls']) or None,
+                    tuple(job['image_urls']) if job['video_urls'] else (),
+                    self.clip_layout(duration, [(probed.get(url) or {}).get('duration') for url in video_urls]),
+                    job['video_volume_reduction'],
+                    job['encoding_profile'],
+                    job['normalize_broll'],
+                    job['fast_path'],
+                )
+                groups.setdefault(key, []).append(job)
             
-            result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
+            units = []
+            for key, members in groups.items():
+                if key[0] is None:
+                    # Voice-only graphs have nothing worth sharing
+                    units.extend([job] for job in members)
+                else:
+                    units.append(members)
             
-            if result.returncode != 0:
-                logger.error(f"FFmpeg failed: {result.stderr}")
-                raise Exception(f"FFmpeg processing failed: {result.stderr}")
+            logger.info(f"Batch grouped into {len(units)} FFmpeg runs")
             
-            logger.info("FFmpeg processing completed successfully")
+            results = [None] * len(jobs)
             
-            # Upload to Supabase (or return file path for upload)
-            include_video_data = config.get('include_video_data', True)
-            upload_result = self.upload_to_supabase(output_file, include_video_data)
+            def render_unit(members):
+                try:
+                    unit_results = self.render_batch_unit(members, local, probed, workspace, metrics)
+                    for job, result in zip(members, unit_results):
+                        results[job['index']] = result
+                except Exception as e:
+                    logger.error(f"Batch render failed: {str(e)}")
+                    for job in members:
+                        results[job['index']] = {
+                            'success': False,
+                            'error': str(e),
+                            'timestamp': datetime.now().isoformat()
+                        }
+                finally:
+                    self.scratch.release((workspace, members[0]['index']))
             
-            if isinstance(upload_result, dict):
-                final_url = upload_result.get('video_url')
-                video_data = upload_result.get('video_data')
-                upload_ready = upload_result.get('upload_ready', False)
-            else:
-                final_url = upload_result
-                video_data = None
-                upload_ready = False
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(units))) as executor:
+                list(executor.map(render_unit, units))
             
             return {
-                'success': True,
-                'video_url': final_url,
-                'video_data': video_data,
-                'upload_ready': upload_ready,
-                'duration': total_duration,
-                'processing_time': datetime.now().isoformat(),
-                'file_size': os.path.getsize(output_file),
-                'specs': {
-                    'resolution': '720x1280',
-                    'fps': 30,
-                    'format': 'mp4',
-                    'audio_codec': 'aac',
-                    'video_codec': 'libx264'
-                }
+                'success': all(result['success'] for result in results),
+                'results': results,
+                'groups': len(units),
+                'metrics': metrics.to_dict()
             }
             
         except Exception as e:
-            logger.error(f"Video processing failed: {str(e)}")
+            logger.error(f"Batch processing failed: {str(e)}")
             return {
                 'success': False,
                 'error': str(e),
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now().isoformat(),
+                'metrics': metrics.to_dict()
+            }
+    
+    def render_batch_unit(self, members, local, probed, workspace, metrics):
+        """Render one group of batch jobs and return their results in order"""
+        first = members[0]
+        
+        durations = []
+        for job in members:
+            audio_duration = self.get_audio_duration(local[job['audio_url']], probed.get(job['audio_url']))
+            durations.append(audio_duration + job['duration_extra'])
+        
+        # Released by render_batch once the unit is delivered
+        scratch_dir = self.scratch.allocate((workspace, first['index']), self.estimate_scratch_bytes(durations), metrics)
+        output_files = [self.output_path(scratch_dir) for _ in members]
+        
+        # Lay the shared timeline out for the longest output
+        clip_count = self.clips_needed(max(durations), len(first['video_urls']))
+        video_urls = first['video_urls'][:clip_count]
+        image_urls = first['image_urls'] if video_urls else []
+        image_urls = image_urls[:len(self.schedule_overlays(max(durations), len(image_urls)))]
+        video_infos = [probed.get(url) for url in video_urls]
+        
+        video_files = [local[url] for url in video_urls]
+        image_files = [local[url] for url in image_urls]
+        image_infos = [probed.get(url) for url in image_urls]
+        video_files, video_infos, image_files, image_infos = self.drop_unplayable_clips(
+            video_files, video_infos, image_files, image_infos
+        )
+        if video_files and first['normalize_broll']:
+            with metrics.stage('normalize'):
+                video_files = [self.normalize_video(f) for f in video_files]
+        if image_files:
+            with metrics.stage('overlays'):
+                image_files, image_infos = self.prescale_overlays(image_files, image_infos)
+        
+        # Each voiceover gets its own final audio track, mixed with the shared clips
+        audio_tracks = []
+        with metrics.stage('audio_mix'):
+            for job, output_file, duration in zip(members, output_files, durations):
+                audio_tracks.append(self.premix_audio(
+                    local[job['audio_url']], video_files, video_infos,
+                    f"{os.path.splitext(output_file)[0]}.m4a", duration,
+                    job['video_volume_reduction'], get_encoding_profile(job['encoding_profile']), metrics,
+                    job['normalize_loudness'], job['duck_background']
+                ))
+        
+        render_path = 'encode'
+        if first['fast_path']:
+            render_path = self.plan_render(video_files, video_infos, image_files, 'mp4',
+                                           first['normalize_broll'])
+        
+        if render_path != 'encode':
+            # Each output muxes the shared video track with its own audio
+            video_source = self.black_segment() if render_path == 'copy_black' else video_files[0]
+            with metrics.stage('encode'):
+                for audio_track, output_file, duration in zip(audio_tracks, output_files, durations):
+                    ffmpeg_cmd = self.build_copy_command(video_source, audio_track, output_file, duration)
+                    logger.info(f"Render path {render_path}: {' '.join(ffmpeg_cmd)}")
+                    returncode, stderr = self.run_ffmpeg(ffmpeg_cmd, metrics)
+                    if returncode != 0:
+                        break
+        else:
+            if len(members) > 1:
+                render_path = 'batch_encode'
+            with self.scheduler.reserve(metrics) as threads:
+                with metrics.stage('filter_build'):
+                    if len(members) > 1:
+                        ffmpeg_cmd = self.build_batch_ffmpeg_command(
+                            audio_files=audio_tracks,
+                            video_files=video_files,
+                            image_files=image_files,
+                            image_infos=image_infos,
+                            output_files=output_files,
+                            durations=durations,
+                            video_volume_reduction=first['video_volume_reduction'],
+                            normalized_video=first['normalize_broll'],
+                            video_infos=video_infos,
+                            encoding_profile=first['encoding_profile'],
+                            threads=threads,
+                            premixed_audio=True
+                        )
+                    else:
+                        ffmpeg_cmd = self.build_ffmpeg_command(
+                            audio_file=local[first['audio_url']],
+                            video_files=video_files,
+                            image_files=image_files,
+                            image_infos=image_infos,
+                            output_file=output_files[0],
+                            total_duration=durations[0],
+                            video_volume_reduction=first['video_volume_reduction'],
+                            normalized_video=first['normalize_broll'],
+                            video_infos=video_infos,
+                            encoding_profile=first['encoding_profile'],
+                            threads=threads,
+                            premixed_audio=audio_tracks[0]
+                        )
+                
+                logger.info(f"Rendering {len(members)} output(s) in one FFmpeg run")
+                logger.info(f"Command: {' '.join(ffmpeg_cmd)}")
+                
+                with metrics.stage('encode'):
+                    returncode, stderr = self.run_ffmpeg(ffmpeg_cmd, metrics)
+        if returncode != 0:
+            logger.error(f"FFmpeg failed: {stderr}")
+            raise Exception(f"FFmpeg processing failed: {stderr}")
+        
+        results = []
+        for job, output_file, duration in zip(members, output_files, durations):
+            media_info = {
+                'audio': probed.get(job['audio_url']),
+                **{f'video_{i}': probed.get(url) for i, url in enumerate(job['video_urls'])},
+                **{f'image_{i}': probed.get(url) for i, url in enumerate(job['image_urls'])},
+            }
+            try:
+                result = self.deliver_output(output_file, job['config'], duration, media_info,
+                                             metrics, job['encoding_profile'])
+                result['render_path'] = render_path
+            except Exception as e:
+                logger.error(f"Batch delivery failed: {str(e)}")
+                result = {
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }
+            results.append(result)
+        return results
+    
+    def output_path(self, directory=None, output_format='mp4'):
+        """
+        Unique output filename in directory (default: the temp directory)
+        
+        For 'hls' a segment directory is created and its playlist path returned.
+        """
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        name = f'coach_joe_video_{timestamp}_{uuid.uuid4().hex[:8]}'
+        if output_format == 'hls':
+            segment_dir = os.path.join(directory or self.temp_dir, name)
+            os.makedirs(segment_dir)
+            return os.path.join(segment_dir, 'playlist.m3u8')
+        return os.path.join(directory or self.temp_dir, f'{name}.mp4')
+    
+    def deliver_output(self, output_file, config, total_duration, media_info, metrics, encoding_profile,
+                       streamed=None):
+        """
+        Upload a rendered video and build the success response
+        
+        streamed is the SegmentUploader summary of an HLS output, whose
+        segments are already in storage.
+        """
+        if streamed:
+            return self.deliver_stream(output_file, total_duration, media_info, metrics,
+                                       encoding_profile, streamed)
+        
+        # Upload to Supabase (base64 video data is a legacy opt-in; response_mode
+        # 'file' returns the kept file instead)
+        keep_file = config.get('response_mode', 'inline') == 'file'
+        include_video_data = config.get('include_video_data', False) and not keep_file
+        upload_mode = config.get('upload_mode', UPLOAD_MODE)
+        with metrics.stage('upload'):
+            upload_result = self.upload_to_supabase(output_file, include_video_data, upload_mode)
+        if isinstance(upload_result, dict) and upload_result.get('error'):
+            # The output is deleted with the workspace, so there is nothing to return
+            raise Exception(f"Upload failed: {upload_result['error']}")
+        if isinstance(upload_result, dict) and upload_result.get('uploaded'):
+            metrics.bytes_uploaded += upload_result.get('file_size', 0)
+        
+        if isinstance(upload_result, dict):
+            final_url = upload_result.get('video_url')
+            video_data = upload_result.get('video_data')
+            upload_ready = upload_result.get('upload_ready', False)
+            uploaded = upload_result.get('uploaded', False)
+        else:
+            final_url = upload_result
+            video_data = None
+            upload_ready = False
+            uploaded = False
+        if not uploaded and not video_data and not keep_file:
+            # Nothing can upload the output later: it is deleted with the workspace
+            logger.warning("Output was neither uploaded nor returned (upload_mode 'none' without "
+                           "include_video_data or response_mode 'file'); it is discarded")
+            final_url = None
+            upload_ready = False
+        
+        return {
+            'success': True,
+            'video_url': final_url,
+            'video_data': video_data,
+            'video_file': self.keep_output(output_file) if keep_file else None,
+            'upload_ready': upload_ready,
+            'uploaded': uploaded,
+            'duration': total_duration,
+            'processing_time': datetime.now().isoformat(),
+            'file_size': os.path.getsize(output_file),
+            'inputs': media_info,
+            'metrics': metrics.to_dict(),
+            'specs': {
+                'resolution': '720x1280',
+                'fps': 30,
+                'format': 'mp4',
+                'audio_codec': 'aac',
+                'video_codec': 'libx264',
+                'encoding_profile': encoding_profile
+            }
+        }
+    
+    def deliver_stream(self, playlist, total_duration, media_info, metrics, encoding_profile, streamed):
+        """Build the success response for an HLS output uploaded during the encode"""
+        if streamed['error']:
+            # The playlist in storage is incomplete and the segments are
+            # deleted with the workspace, so there is nothing to return
+            raise Exception(f"Segment upload failed: {streamed['error']}")
+        object_path = f"{SUPABASE_VIDEO_BUCKET}/{os.path.basename(os.path.dirname(playlist))}/playlist.m3u8"
+        if streamed['uploaded']:
+            metrics.bytes_uploaded += streamed['bytes']
+        else:
+            logger.warning("HLS output was not uploaded (upload_mode 'none'); its segments are discarded")
+        
+        return {
+            'success': True,
+            'video_url': f"{SUPABASE_STORAGE_URL}/object/public/{object_path}" if streamed['uploaded'] else None,
+            'video_data': None,
+            'video_file': None,
+            'upload_ready': streamed['uploaded'],
+            'uploaded': streamed['uploaded'],
+            'duration': total_duration,
+            'processing_time': datetime.now().isoformat(),
+            'file_size': streamed['bytes'],
+            'inputs': media_info,
+            'stream': {
+                'segments': streamed['segments'],
+                'segment_seconds': HLS_SEGMENT_SECONDS,
+                'first_segment_seconds': streamed['first_segment_seconds']
+            },
+            'metrics': metrics.to_dict(),
+            'specs': {
+                'resolution': '720x1280',
+                'fps': 30,
+                'format': 'hls',
+                'audio_codec': 'aac',
+                'video_codec': 'libx264',
+                'encoding_profile': encoding_profile
             }
+        }
+    
+    def input_args(self, source, options=None):
+        """FFmpeg input arguments (with optional input options) for a local path or a remote URL"""
+        args = list(options or [])
+        if source.startswith(('http://', 'https://')):
+            # Survive dropped connections while reading a remote input
+            args.extend(['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5'])
+        return args + ['-i', source]
     
     def build_ffmpeg_command(self, audio_file, video_files, image_files, output_file, 
-                           total_duration, video_volume_reduction):
-        """Build complex FFmpeg command for Coach Joe video processing"""
+                           total_duration, video_volume_reduction, normalized_video=False,
+                           video_infos=None, encoding_profile=DEFAULT_ENCODING_PROFILE, threads=ENCODER_THREADS,
+                           image_infos=None, output_format='mp4', premixed_audio=None, loudness=None, duck=False):
+        """
+        Build complex FFmpeg command for Coach Joe video processing
+        
+        All video_files are sequenced across the timeline and every image in
+        image_files gets its own overlay window (see timeline_filters).
+        When normalized_video is set the clips are already 720x1280/30fps/
+        yuv420p intermediates and are used without scaling. video_infos holds
+        the probe result of each clip; it lets the graph skip scaling of
+        vertical clips and mixing of silent ones; image_infos tells stills from
+        animated overlays. encoding_profile names an
+        entry of ENCODING_PROFILES (or is a profile dict with the same keys).
+        With output_format 'hls' output_file is the playlist of a CMAF
+        segment directory. premixed_audio is a finished AAC track (see
+        premix_audio) that is stream-copied instead of mixing in the graph;
+        otherwise loudness and duck apply as in audio_mix_filters. Without
+        audio_file and premixed_audio the output is video-only.
+        """
+        if isinstance(encoding_profile, dict):
+            profile = encoding_profile
+        else:
+            profile = get_encoding_profile(encoding_profile)
         
         # Calculate video volume (90% reduction = 10% volume)
         video_volume = (100 - video_volume_reduction) / 100
@@ -192,130 +3141,672 @@ class CoachJoeVideoProcessor:
         cmd = ['ffmpeg', '-y']  # -y to overwrite output
         
         # Add inputs
-        cmd.extend(['-i', audio_file])  # Input 0: Audio
-        
-        if video_files:
-            cmd.extend(['-i', video_files[0]])  # Input 1: Main video
-        
-        if image_files:
-            cmd.extend(['-i', image_files[0]])  # Input 2: First image
+        audio_source = premixed_audio or audio_file
+        if audio_source:
+            cmd.extend(self.input_args(audio_source))  # Input 0: Audio
         
         # Build filter complex
         filter_parts = []
         
-        # Video processing
+        # Video processing (adds clip and image inputs 1..N)
         if video_files:
-            # Scale and crop video to 9:16 aspect ratio
-            filter_parts.append(
-                "[1:v]scale=720:1280:force_original_aspect_ratio=increase,"
-                "crop=720:1280,setsar=1[bg_video]"
+            video_output, bg_audio = self.timeline_filters(
+                cmd, filter_parts, video_files, video_infos, image_files,
+                total_duration, normalized_video, image_infos, audio=not premixed_audio and bool(audio_file)
             )
-            
-            # Add image overlay if available
-            if image_files:
-                filter_parts.append(
-                    "[2:v]scale=200:200[overlay_img]"
-                )
-                filter_parts.append(
-                    "[bg_video][overlay_img]overlay=W-w-20:20:enable='between(t,3,6)'[final_video]"
-                )
-                video_output = "[final_video]"
-            else:
-                video_output = "[bg_video]"
         else:
             # No video input - create colored background
             filter_parts.append(
                 f"color=black:size=720x1280:duration={total_duration}[final_video]"
             )
             video_output = "[final_video]"
+            bg_audio = None
         
-        # Audio processing
-        if video_files:
-            # Mix audio: original voice + reduced video audio
-            filter_parts.append(f"[1:a]volume={video_volume}[bg_audio]")
-            filter_parts.append(
-                "[0:a][bg_audio]amix=inputs=2:duration=first:dropout_transition=0[final_audio]"
-            )
-            audio_output = "[final_audio]"
+        # Audio processing: voice + reduced video audio, unless premixed
+        if not audio_source:
+            audio_output = None
+        elif premixed_audio:
+            audio_output = "0:a"
         else:
-            # Only voice audio
-            audio_output = "[0:a]"
+            if bg_audio:
+                # The mix ends with the voiceover; draining the rest of the
+                # clip audio keeps the timeline concat producing video
+                filter_parts.append(f"{bg_audio}asplit=2[bg_mix][bg_drain]")
+                filter_parts.append("[bg_drain]anullsink")
+                bg_audio = "[bg_mix]"
+            audio_output = self.map_label(
+                self.audio_mix_filters(filter_parts, "[0:a]", bg_audio, video_volume, loudness, duck)
+            )
         
         # Combine filter parts
         if filter_parts:
             cmd.extend(['-filter_complex', ';'.join(filter_parts)])
         
-        # Map outputs
-        cmd.extend(['-map', video_output])
-        cmd.extend(['-map', audio_output])
+        # Map outputs (input streams are mapped without brackets)
+        cmd.extend(['-map', self.map_label(video_output)])
+        cmd.extend(['-map', audio_output] if audio_output else ['-an'])
         
         # Output settings
+        cmd.extend(['-t', str(total_duration)])  # Duration
+        cmd.extend(self.encoder_args(profile, threads, copy_audio=bool(premixed_audio)))
         cmd.extend([
-            '-t', str(total_duration),  # Duration
-            '-c:v', 'libx264',         # Video codec
-            '-preset', 'fast',         # Encoding speed
-            '-crf', '23',              # Quality (lower = better)
-            '-c:a', 'aac',             # Audio codec
-            '-b:a', '128k',            # Audio bitrate
             '-r', '30',                # Frame rate
             '-pix_fmt', 'yuv420p',     # Pixel format (compatibility)
-            '-movflags', '+faststart', # Web optimization
+        ])
+        cmd.extend(self.container_args(output_format, output_file))
+        
+        return cmd
+    
+    def container_args(self, output_format, output_file):
+        """Muxer arguments: a faststart MP4, or CMAF segments with an HLS playlist"""
+        if output_format == 'hls':
+            segment_dir = os.path.dirname(output_file)
+            return [
+                # A keyframe at every segment boundary
+                '-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})',
+                '-f', 'hls',
+                '-hls_time', str(HLS_SEGMENT_SECONDS),
+                '-hls_playlist_type', 'event',
+                '-hls_segment_type', 'fmp4',
+                '-hls_fmp4_init_filename', 'init.mp4',
+                '-hls_segment_filename', os.path.join(segment_dir, 'segment_%05d.m4s'),
+                '-hls_flags', 'independent_segments+temp_file',
+                output_file
+            ]
+        return ['-movflags', '+faststart', output_file]  # Web optimization
+    
+    def map_label(self, label):
+        """-map argument for a filter label or a bracketed input stream like [1:v]"""
+        if label.startswith('[') and ':' in label:
+            return label.strip('[]') + ':0'
+        return label
+    
+    def is_overlay_sized(self, info):
+        """True when a probed overlay image needs no scaling"""
+        return bool(info) and info.get('width') == OVERLAY_SIZE and info.get('height') == OVERLAY_SIZE
+    
+    def is_vertical(self, info):
+        """True when a probed clip is already 720x1280 with square pixels"""
+        return bool(info) and (
+            info.get('width') == 720 and info.get('height') == 1280
+            and info.get('sample_aspect_ratio') in (None, '1:1', '0:1', 'N/A')
+        )
+    
+    def timeline_filters(self, cmd, filter_parts, video_files, video_infos, image_files,
+                         timeline_duration, normalized_video, image_infos=None,
+                         window=None, video=True, audio=True):
+        """
+        Add clip and image inputs to cmd and the background graph to filter_parts
+        
+        Clips are laid end to end (sequence_clips). Each clip is one input,
+        bounded with input-side -ss/-t (and looped with -stream_loop when it
+        is shown more than once), so FFmpeg decodes each clip once and never
+        past the frames the output shows. Images are overlaid in their schedule_overlays windows and
+        are only decoded for the length of their window.
+        
+        Args:
+            window (tuple): Only build this (start, end) slice of the timeline
+            video (bool): Build the background video (with overlays)
+            audio (bool): Build the background audio
+        
+        Returns:
+            tuple: (video label or None, background audio label or None)
+        """
+        video_infos = video_infos or [None] * len(video_files)
+        window_start, window_end = window or (0, timeline_duration)
+        clip_durations = [info.get('duration') if info else None for info in video_infos]
+        segments = self.slice_timeline(
+            self.sequence_clips(timeline_duration, clip_durations), window_start, window_end
+        )
+        
+        # One input per clip, read from its first position in this slice; a
+        # clip that is shown again (or outlasts its length) is looped by the
+        # demuxer and split between its segments in the graph
+        reads = {}
+        for n, segment in enumerate(segments):
+            read = reads.setdefault(segment['clip'], {'start': segment['source_start'], 'segments': []})
+            read['end'] = segment['source_start'] + segment['duration']
+            read['segments'].append(n)
+        for clip, read in reads.items():
+            clip_duration = clip_durations[clip]
+            start = read['start'] % clip_duration if clip_duration else read['start']
+            options = ['-t', f"{round(read['end'] - read['start'], 3):g}"]
+            if start > 0.001:
+                options = ['-ss', f"{round(start, 3):g}"] + options
+            if not clip_duration or read['end'] > clip_duration + 0.001:
+                options = ['-stream_loop', '-1'] + options
+            read['index'] = cmd.count('-i')
+            cmd.extend(self.input_args(video_files[clip], options))
+        
+        # Only mix background audio when a clip actually has an audio stream
+        has_audio = [info is None or info.get('has_audio') for info in video_infos]
+        mix_audio = audio and any(has_audio[segment['clip']] for segment in segments)
+        bg_video = None
+        bg_audio = None
+        
+        if len(segments) == 1:
+            info = video_infos[segments[0]['clip']]
+            index = reads[segments[0]['clip']]['index']
+            if not video:
+                pass
+            elif normalized_video or self.is_vertical(info):
+                # Already 720x1280
+                bg_video = f"[{index}:v]"
+            else:
+                # Scale and crop video to 9:16 aspect ratio
+                filter_parts.append(
+                    f"[{index}:v]scale=720:1280:force_original_aspect_ratio=increase,"
+                    "crop=720:1280,setsar=1[bg_video]"
+                )
+                bg_video = "[bg_video]"
+            if mix_audio:
+                bg_audio = f"[{index}:a]"
+        else:
+            # Conform each clip to 720x1280/30fps once and give every segment
+            # its own branch of it
+            branches = {}
+            for clip, read in reads.items():
+                index = read['index']
+                count = len(read['segments'])
+                labels = [f"[clip{clip}v{j}]" for j in range(count)]
+                if video:
+                    chain = []
+                    if not (normalized_video or self.is_vertical(video_infos[clip])):
+                        chain.append("scale=720:1280:force_original_aspect_ratio=increase,crop=720:1280")
+                    chain.append("setsar=1,fps=30,format=yuv420p")
+                    if count > 1:
+                        chain.append(f"split={count}")
+                    filter_parts.append(f"[{index}:v]{','.join(chain)}{''.join(labels)}")
+                if mix_audio and has_audio[clip]:
+                    chain = "aresample=48000,aformat=channel_layouts=stereo"
+                    if count > 1:
+                        chain += f",asplit={count}"
+                    filter_parts.append(f"[{index}:a]{chain}{''.join(f'[clip{clip}a{j}]' for j in range(count))}")
+                for j, n in enumerate(read['segments']):
+                    branches[n] = (j, segments[n]['source_start'] - read['start'])
+            
+            # Cut each segment from its branch at an exact length, then concat
+            concat_inputs = []
+            for n, segment in enumerate(segments):
+                clip = segment['clip']
+                duration = segment['duration']
+                j, offset = branches[n]
+                trim = f"start={round(offset, 3):g}:duration={duration}"
+                if video:
+                    filter_parts.append(
+                        f"[clip{clip}v{j}]trim={trim},setpts=PTS-STARTPTS,"
+                        f"tpad=stop_mode=clone:stop_duration={duration},trim=duration={duration}[seg{n}v]"
+                    )
+                    concat_inputs.append(f"[seg{n}v]")
+                
+                if not mix_audio:
+                    continue
+                if has_audio[clip]:
+                    filter_parts.append(
+                        f"[clip{clip}a{j}]atrim={trim},asetpts=PTS-STARTPTS,"
+                        f"apad,atrim=duration={duration}[seg{n}a]"
+                    )
+                else:
+                    # Silence keeps the concat audio in step with the video
+                    filter_parts.append(
+                        f"anullsrc=r=48000:cl=stereo,atrim=duration={duration}[seg{n}a]"
+                    )
+                concat_inputs.append(f"[seg{n}a]")
+            
+            outputs = ("[bg_video]" if video else "") + ("[bg_concat_audio]" if mix_audio else "")
+            filter_parts.append(
+                f"{''.join(concat_inputs)}concat=n={len(segments)}:v={int(video)}:a={int(mix_audio)}{outputs}"
+            )
+            bg_video = "[bg_video]" if video else None
+            bg_audio = "[bg_concat_audio]" if mix_audio else None
+        
+        if not video:
+            return bg_video, bg_audio
+        
+        # Overlay each image in its own window (shifted into the slice)
+        image_infos = image_infos or [None] * len(image_files)
+        overlays = []
+        for image_file, info, (start, end) in zip(
+            image_files, image_infos, self.schedule_overlays(timeline_duration, len(image_files))
+        ):
+            start, end = max(start, window_start) - window_start, min(end, window_end) - window_start
+            if end > start:
+                overlays.append((image_file, info, start, end))
+        
+        for n, (image_file, info, start, end) in enumerate(overlays):
+            index = cmd.count('-i')
+            cmd.extend(self.input_args(image_file, self.overlay_input_options(info, end - start)))
+            output = "[final_video]" if n == len(overlays) - 1 else f"[overlaid{n}]"
+            # Shift the overlay stream to its window; once it ends the main video passes through
+            scale = "" if self.is_overlay_sized(info) else f"scale={OVERLAY_SIZE}:{OVERLAY_SIZE},"
+            filter_parts.append(
+                f"[{index}:v]{scale}setpts=PTS-STARTPTS+{start:g}/TB[overlay_img{n}]"
+            )
+            filter_parts.append(
+                f"{bg_video}[overlay_img{n}]overlay=W-w-20:20:eof_action=pass:"
+                f"enable='between(t,{start:g},{end:g})'{output}"
+            )
+            bg_video = output
+        
+        return bg_video, bg_audio
+    
+    def slice_timeline(self, segments, window_start, window_end):
+        """
+        Cut a sequence_clips plan down to the (window_start, window_end) slice
+        
+        Returns:
+            list: Segments overlapping the slice, with source_start moved to
+                the first frame inside it
+        """
+        sliced = []
+        position = 0
+        for segment in segments:
+            start = max(position, window_start)
+            end = min(position + segment['duration'], window_end)
+            if end - start > 0.001:
+                source_start = segment['source_start'] + start - position
+                sliced.append({
+                    **segment,
+                    'source_start': round(source_start, 3),
+                    'duration': round(end - start, 3)
+                })
+            position += segment['duration']
+        return sliced
+    
+    def overlay_input_options(self, info, window):
+        """Input options that decode an overlay only for its window length"""
+        if info and info.get('video_codec') in ANIMATED_IMAGE_CODECS:
+            # Animated overlays loop for the whole window
+            return ['-stream_loop', '-1', '-t', f'{window:g}']
+        # Stills (and unprobed images, which are treated as stills) become a
+        # 30fps stream exactly as long as the window; a single frame would hit
+        # EOF at once and overlay's eof_action=pass would drop it
+        return ['-loop', '1', '-framerate', '30', '-t', f'{window:g}']
+    
+    def build_batch_ffmpeg_command(self, audio_files, video_files, image_files, output_files,
+                                   durations, video_volume_reduction, normalized_video=False,
+                                   video_infos=None, encoding_profile=DEFAULT_ENCODING_PROFILE,
+                                   threads=ENCODER_THREADS, image_infos=None, premixed_audio=False):
+        """
+        Build one FFmpeg command that renders several outputs sharing the
+        same clips and overlays but each with its own voiceover
+        
+        The timeline is laid out for the longest output, decoded, scaled and
+        overlaid once and split to every output; each output is cut to its
+        own duration. With premixed_audio the audio_files are finished AAC
+        tracks that are stream-copied.
+        """
+        if isinstance(encoding_profile, dict):
+            profile = encoding_profile
+        else:
+            profile = get_encoding_profile(encoding_profile)
+        
+        video_volume = (100 - video_volume_reduction) / 100
+        count = len(output_files)
+        
+        cmd = ['ffmpeg', '-y']
+        filter_parts = []
+        
+        # Shared clip and image inputs first, then one voiceover per output
+        video_output, bg_audio = self.timeline_filters(
+            cmd, filter_parts, video_files, video_infos, image_files,
+            max(durations), normalized_video, image_infos, audio=not premixed_audio
+        )
+        first_audio = cmd.count('-i')
+        for audio_file in audio_files:
+            cmd.extend(self.input_args(audio_file))
+        
+        filter_parts.append(
+            f"{video_output}split={count}" + ''.join(f"[v{i}]" for i in range(count))
+        )
+        
+        if bg_audio:
+            filter_parts.append(
+                f"{bg_audio}volume={video_volume},asplit={count}" + ''.join(f"[bg{i}]" for i in range(count))
+            )
+            for i in range(count):
+                filter_parts.append(
+                    f"[{first_audio + i}:a][bg{i}]amix=inputs=2:duration=first:dropout_transition=0[a{i}]"
+                )
+        
+        cmd.extend(['-filter_complex', ';'.join(filter_parts)])
+        
+        for i, (output_file, duration) in enumerate(zip(output_files, durations)):
+            cmd.extend(['-map', f"[v{i}]"])
+            cmd.extend(['-map', f"[a{i}]" if bg_audio else f"{first_audio + i}:a"])
+            cmd.extend(['-t', str(duration)])
+            cmd.extend(self.encoder_args(profile, threads, copy_audio=premixed_audio))
+            cmd.extend([
+                '-r', '30',
+                '-pix_fmt', 'yuv420p',
+                '-movflags', '+faststart',
+                output_file
+            ])
+        
+        return cmd
+    
+    def build_segment_command(self, video_files, video_infos, image_files, image_infos, output_file,
+                              total_duration, window, normalized_video, profile, threads=ENCODER_THREADS):
+        """
+        Build a video-only FFmpeg command for one (start, end) slice of the timeline
+        
+        Keyframes are forced every SEGMENT_GOP_SECONDS so slices that start on
+        a GOP boundary concatenate into a stream with a regular GOP.
+        """
+        start, end = window
+        cmd = ['ffmpeg', '-y']
+        filter_parts = []
+        video_output, _ = self.timeline_filters(
+            cmd, filter_parts, video_files, video_infos, image_files,
+            total_duration, normalized_video, image_infos, window=window, audio=False
+        )
+        if filter_parts:
+            cmd.extend(['-filter_complex', ';'.join(filter_parts)])
+        
+        gop = str(SEGMENT_GOP_SECONDS * 30)
+        cmd.extend(['-map', self.map_label(video_output), '-an'])
+        cmd.extend(['-t', str(round(end - start, 3))])
+        cmd.extend(self.encoder_args(profile, threads))
+        cmd.extend([
+            '-g', gop, '-keyint_min', gop, '-sc_threshold', '0',
+            '-r', '30',
+            '-pix_fmt', 'yuv420p',
             output_file
         ])
+        return cmd
+    
+    def build_audio_mix_command(self, audio_file, video_files, video_infos, output_file,
+                                total_duration, video_volume_reduction, profile, loudness=None, duck=False,
+                                video_source=None):
+        """
+        Build an audio-only FFmpeg command mixing the voiceover with the clip audio
+        
+        Args:
+            loudness: measure_loudness() result (see audio_mix_filters)
+            duck (bool): Compress the clip audio whenever the voiceover speaks
+            video_source (str): Also stream-copy this video (looped) into an
+                MP4 output; the only clip's own input is reused when it is the
+                source, so each input is read once
+        """
+        video_volume = (100 - video_volume_reduction) / 100
+        
+        cmd = ['ffmpeg', '-y']
+        cmd.extend(self.input_args(audio_file))
+        filter_parts = []
+        bg_audio = None
+        if video_files:
+            _, bg_audio = self.timeline_filters(
+                cmd, filter_parts, video_files, video_infos, [],
+                total_duration, False, video=False
+            )
+        audio_output = self.audio_mix_filters(filter_parts, "[0:a]", bg_audio, video_volume, loudness, duck)
+        
+        if video_source and len(video_files) == 1 and video_files[0] == video_source:
+            video_map = '1:v:0'
+        elif video_source:
+            video_map = f"{cmd.count('-i')}:v:0"
+            cmd.extend(self.input_args(video_source, ['-stream_loop', '-1']))
+        
+        if filter_parts:
+            cmd.extend(['-filter_complex', ';'.join(filter_parts)])
+        cmd.extend(['-map', self.map_label(audio_output)])
+        if video_source:
+            cmd.extend(['-map', video_map, '-c:v', 'copy'])
+        cmd.extend([
+            '-t', str(total_duration),
+            '-c:a', 'aac',
+            '-b:a', profile['audio_bitrate'],
+        ])
+        if video_source:
+            cmd.extend(self.container_args('mp4', output_file))
+        else:
+            cmd.append(output_file)
+        return cmd
+    
+    def audio_mix_filters(self, filter_parts, voice, bg_audio, video_volume, loudness=None, duck=False):
+        """
+        Add the voiceover and clip audio mix to filter_parts
+        
+        Args:
+            voice (str): Voiceover label, e.g. [0:a]
+            bg_audio (str): Clip audio label from timeline_filters, or None
+            loudness: measure_loudness() result for a linear second loudnorm
+                pass, or 'dynamic' for single-pass loudnorm when the voiceover
+                is not measured ahead (streamed inputs)
+            duck (bool): Compress the clip audio whenever the voiceover speaks
+        
+        Returns:
+            str: Label of the final audio
+        """
+        if loudness:
+            options = f"I={LOUDNESS_TARGET:g}:TP={LOUDNESS_TRUE_PEAK:g}:LRA={LOUDNESS_RANGE:g}"
+            if loudness != 'dynamic':
+                options += (
+                    f":measured_I={loudness['input_i']}:measured_TP={loudness['input_tp']}:"
+                    f"measured_LRA={loudness['input_lra']}:measured_thresh={loudness['input_thresh']}:"
+                    f"offset={loudness['target_offset']}:linear=true"
+                )
+            filter_parts.append(
+                f"{voice}loudnorm={options},aformat=sample_rates=48000:channel_layouts=stereo[voice]"
+            )
+            voice = "[voice]"
+        
+        if not bg_audio:
+            return voice
         
+        filter_parts.append(
+            f"{bg_audio}volume={video_volume},aformat=sample_rates=48000:channel_layouts=stereo[bg_audio]"
+        )
+        background = "[bg_audio]"
+        if duck:
+            # The voiceover keys a compressor on the clip audio
+            filter_parts.append(f"{voice}asplit=2[voice_mix][voice_key]")
+            filter_parts.append(f"[bg_audio][voice_key]{DUCKING_FILTER}[ducked]")
+            voice, background = "[voice_mix]", "[ducked]"
+        if loudness:
+            # Keep the voice at its normalized level and the mix under the peak target
+            filter_parts.append(
+                f"{voice}{background}amix=inputs=2:duration=first:dropout_transition=0:normalize=0,"
+                f"alimiter=limit={10 ** (LOUDNESS_TRUE_PEAK / 20):.3f}:level=disabled[final_audio]"
+            )
+        else:
+            filter_parts.append(
+                f"{voice}{background}amix=inputs=2:duration=first:dropout_transition=0[final_audio]"
+            )
+        return "[final_audio]"
+    
+    def build_copy_command(self, video_source, audio_track, output_file, total_duration, loop=True):
+        """
+        Build an FFmpeg command muxing video_source and a premixed audio track
+        without re-encoding either
+        
+        With loop the demuxer repeats video_source until total_duration, so a
+        short clip (or the black segment) loops seamlessly from its first
+        keyframe; a full-length video track is muxed as is.
+        """
+        cmd = ['ffmpeg', '-y']
+        cmd.extend(self.input_args(video_source, ['-stream_loop', '-1'] if loop else None))
+        cmd.extend(self.input_args(audio_track))
+        cmd.extend([
+            '-map', '0:v:0',
+            '-map', '1:a:0',
+            '-c', 'copy',
+            '-t', str(total_duration),
+        ])
+        cmd.extend(self.container_args('mp4', output_file))
         return cmd
     
-    def upload_to_supabase(self, file_path, include_video_data=True):
-        """Upload processed video to Supabase storage"""
+    def encoder_args(self, profile, threads=ENCODER_THREADS, copy_audio=False):
+        """Video/audio codec arguments for an encoding profile (copy_audio keeps a premixed AAC track)"""
+        args = [
+            '-c:v', 'libx264',                  # Video codec
+            '-preset', profile['preset'],       # Encoding speed
+            '-crf', str(profile['crf']),        # Quality (lower = better)
+        ]
+        if profile.get('tune'):
+            args.extend(['-tune', profile['tune']])
+        if profile.get('x264_params'):
+            args.extend(['-x264-params', profile['x264_params']])
+        if threads:
+            args.extend(['-threads', str(threads)])
+        if copy_audio:
+            args.extend(['-c:a', 'copy'])
+            return args
+        args.extend([
+            '-c:a', 'aac',                      # Audio codec
+            '-b:a', profile['audio_bitrate'],   # Audio bitrate
+        ])
+        return args
+    
+    def upload_to_supabase(self, file_path, include_video_data=False, upload_mode=UPLOAD_MODE):
+        """
+        Upload processed video to Supabase storage
+        
+        Args:
+            file_path (str): Rendered video
+            include_video_data (bool): Legacy opt-in to return the video as base64
+            upload_mode (str): 'stream' streams the file to the storage bucket,
+                'none' only reports the target URL for an external uploader
+        """
         try:
-            # Read the processed video file
-            with open(file_path, 'rb') as f:
-                video_data = f.read()
-            
             filename = os.path.basename(file_path)
+            file_size = os.path.getsize(file_path)
             
-            supabase_url = f"https://wbrlglamhecvkcbifzls.supabase.co/storage/v1/object/public/coach-joe-videos/{filename}"
+            supabase_url = f"{SUPABASE_STORAGE_URL}/object/public/{SUPABASE_VIDEO_BUCKET}/{filename}"
             
             logger.info(f"Video processed successfully: {filename}")
-            logger.info(f"File size: {len(video_data)} bytes")
+            logger.info(f"File size: {file_size} bytes")
             logger.info(f"Target Supabase URL: {supabase_url}")
             
             result = {
                 "video_url": supabase_url,
                 "filename": filename,
-                "file_size": len(video_data),
-                "upload_ready": True
+                "file_size": file_size,
+                "upload_ready": True,
+                "uploaded": False
             }
             
-            # Only include video data if requested (for production use)
+            if upload_mode == 'stream':
+                self.stream_upload(file_path, f"{SUPABASE_VIDEO_BUCKET}/{filename}")
+                result["uploaded"] = True
+            
+            # Only include video data if explicitly requested (legacy N8N upload flow)
             if include_video_data:
-                # For RunPod deployment, we'll return the file data as base64
-                # so it can be uploaded by the N8N workflow
-                video_base64 = base64.b64encode(video_data).decode('utf-8')
-                result["video_data"] = video_base64
+                result["video_data"] = self.encode_video_data(file_path)
                 logger.info("Video data included in response (base64 encoded)")
             else:
-                logger.info("Video data excluded from response (testing mode)")
+                logger.info("Video data excluded from response")
             
             return result
             
         except Exception as e:
             logger.error(f"Upload preparation failed: {str(e)}")
             return {
-                "video_url": file_path,
+                "video_url": None,
                 "error": str(e),
                 "upload_ready": False
             }
     
+    def stream_upload(self, file_path, object_path, content_type='video/mp4'):
+        """Stream a file to Supabase storage without reading it into memory"""
+        upload_url = f"{SUPABASE_STORAGE_URL}/object/{object_path}"
+        headers = {
+            'Content-Type': content_type,
+            'x-upsert': 'true'
+        }
+        if SUPABASE_SERVICE_KEY:
+            headers['Authorization'] = f"Bearer {SUPABASE_SERVICE_KEY}"
+            headers['apikey'] = SUPABASE_SERVICE_KEY
+        
+        logger.info(f"Uploading {file_path} to {upload_url}")
+        
+        # requests streams file objects in blocks with a known Content-Length
+        with open(file_path, 'rb') as f:
+            response = self.session.post(upload_url, data=f, headers=headers, timeout=UPLOAD_TIMEOUT)
+        response.raise_for_status()
+        
+        logger.info(f"Upload completed: {object_path}")
+        return upload_url
+    
+    def encode_video_data(self, file_path, chunk_size=3 * 256 * 1024):
+        """Base64-encode a file in chunks so the raw bytes are never held in full"""
+        # chunk_size is a multiple of 3 so encoded chunks concatenate without padding
+        parts = []
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                parts.append(base64.b64encode(chunk).decode('ascii'))
+        return ''.join(parts)
+    
+    def keep_output(self, output_file):
+        """
+        Keep a rendered output past its workspace for response_mode 'file'
+        
+        Kept files live under the worker directory and are deleted by
+        release_response_files() or after RESPONSE_FILE_TTL seconds.
+        """
+        directory = os.path.join(self.temp_dir, 'responses')
+        os.makedirs(directory, exist_ok=True)
+        cutoff = time.time() - RESPONSE_FILE_TTL
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+        
+        kept = os.path.join(directory, os.path.basename(output_file))
+        try:
+            os.link(output_file, kept)
+        except OSError:
+            # Scratch on tmpfs is another filesystem
+            shutil.copyfile(output_file, kept)
+        return kept
+    
+    def create_workspace(self):
+        """Create an isolated scratch directory for one job"""
+        return tempfile.mkdtemp(prefix='job_', dir=self.temp_dir)
+    
+    def release_workspace(self, workspace):
+        """Delete a job's scratch directories and everything in them"""
+        try:
+            self.scratch.release(workspace)
+            shutil.rmtree(workspace)
+            logger.info(f"Job workspace cleaned up: {workspace}")
+        except Exception as e:
+            logger.error(f"Workspace cleanup failed: {str(e)}")
+    
     def cleanup(self):
-        """Clean up temporary files"""
+        """Clean up all temporary files and close the HTTP session (worker shutdown)"""
         try:
-            import shutil
+            self.session.close()
+            self.scratch.cleanup()
             shutil.rmtree(self.temp_dir)
             logger.info("Temporary files cleaned up")
         except Exception as e:
             logger.error(f"Cleanup failed: {str(e)}")
 
+# Long-lived processor reused by every job in this worker
+_shared_processor = None
+_shared_processor_lock = threading.Lock()
+
+def get_processor():
+    """
+    Return the worker's shared processor, creating it on first use
+    
+    The HTTP session pool, asset/probe caches and FFmpeg capability detection
+    stay warm across jobs; each job still runs in its own workspace.
+    """
+    global _shared_processor
+    with _shared_processor_lock:
+        if _shared_processor is None:
+            # Reclaim space left by crashed workers (once per process) before taking our own
+            for root in (TEMP_DIR, TMPFS_DIR):
+                clean_orphaned_worker_dirs(root)
+            _shared_processor = CoachJoeVideoProcessor()
+            _shared_processor.ffmpeg_capabilities()
+        return _shared_processor
+
 # API endpoint function for cloud deployment
 def handler(event, context=None):
     """
@@ -329,17 +3820,35 @@ def handler(event, context=None):
         "video_volume_reduction": 90,
         "output_duration_extra": 1
     }
+    
+    or a batch sharing downloads between renders:
+    {
+        "configs": [{...}, {...}],
+        "max_concurrency": 2
+    }
+    
+    body is always a JSON string, as Lambda and Cloud Functions require;
+    streamed bodies are left to the HTTP server (see runpod_handler).
     """
-    processor = CoachJoeVideoProcessor()
+    processor = get_processor()
+    responses = []
     
     try:
-        # Process the video
-        result = processor.process_video(event)
+        # Jobs asking for video_data render to a kept file, which is encoded
+        # straight into the body instead of through a base64 string in result
+        event, pick = prepare_streamed_response(event)
+        
+        # Process the video (or a batch of videos under "configs")
+        if 'configs' in event:
+            result = processor.process_batch(event['configs'], event.get('max_concurrency'))
+        else:
+            result = processor.process_video(event)
+        responses = pick(result)
         
         # Return response
         return {
             'statusCode': 200,
-            'body': json.dumps(result),
+            'body': ''.join(iter_response_json(result, responses)),
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
@@ -359,9 +3868,8 @@ def handler(event, context=None):
                 'Access-Control-Allow-Origin': '*'
             }
         }
-    
     finally:
-        processor.cleanup()
+        release_response_files(responses)
 
 # Example usage
 if __name__ == "__main__":
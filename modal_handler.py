@@ -10,6 +10,11 @@ from datetime import datetime
 # Create Modal app
 app = modal.App("coach-joe-ffmpeg")
 
+# Function timeout; jobs get a slightly shorter deadline so a stuck encode
+# is stopped and reported instead of holding a concurrent-input slot
+FUNCTION_TIMEOUT = 300
+JOB_DEADLINE = FUNCTION_TIMEOUT - 20
+
 # Define the image with FFmpeg and Python dependencies
 image = (
     modal.Image.debian_slim()
@@ -22,7 +27,7 @@ image = (
     image=image,
     cpu=4,
     memory=8192,
-    timeout=300,  # 5 minutes
+    timeout=FUNCTION_TIMEOUT,  # 5 minutes
     allow_concurrent_inputs=10
 )
 def process_coach_joe_video(config):
@@ -44,15 +49,14 @@ def process_coach_joe_video(config):
     import sys
     sys.path.append("/app")
     
-    from coach_joe_ffmpeg_processor import CoachJoeVideoProcessor
+    from coach_joe_ffmpeg_processor import get_processor
     
-    processor = CoachJoeVideoProcessor()
+    # The processor (HTTP pool, caches) stays warm for the container's lifetime;
+    # each job cleans up its own workspace
+    processor = get_processor()
     
-    try:
-        result = processor.process_video(config)
-        return result
-    finally:
-        processor.cleanup()
+    result = processor.process_video({'timeout': JOB_DEADLINE, **config})
+    return result
 
 # Web endpoint for HTTP requests
 @app.function(
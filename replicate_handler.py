@@ -4,12 +4,12 @@ Replicate.com Handler for Coach Joe FFmpeg Processor
 """
 
 import cog
-from coach_joe_ffmpeg_processor import CoachJoeVideoProcessor
+from coach_joe_ffmpeg_processor import get_processor
 
 class Predictor(cog.Predictor):
     def setup(self):
         """Load the model into memory to make running multiple predictions efficient"""
-        self.processor = CoachJoeVideoProcessor()
+        self.processor = get_processor()
     
     def predict(
         self,
@@ -37,8 +37,8 @@ class Predictor(cog.Predictor):
             "output_duration_extra": output_duration_extra
         }
         
-        try:
-            result = self.processor.process_video(config)
-            return result
-        finally:
-            self.processor.cleanup() 
+        # Each prediction runs in its own workspace, so the processor (and its
+        # caches) stays usable for the next prediction
+        result = self.processor.process_video(config)
+        return result
+
@@ -4,19 +4,157 @@ RunPod Serverless Handler for Coach Joe FFmpeg Processor
 """
 
 import runpod
+import os
 import json
 import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from coach_joe_ffmpeg_processor import CoachJoeVideoProcessor
+from coach_joe_ffmpeg_processor import (
+    get_processor, redact_payloads, prepare_streamed_response, stream_response_json, iter_response_json,
+    release_response_files
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def handler(event):
+# Expose job metrics at /metrics in Prometheus text format
+PROMETHEUS_METRICS = os.getenv('PROMETHEUS_METRICS', 'false').lower() == 'true'
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class PrometheusMetrics:
+    """Minimal in-process Prometheus registry fed from job results"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.render_paths = {}
+        self.stage_buckets = {}
+        self.stage_sums = {}
+        self.stage_counts = {}
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        self.download_retries = 0
+        self.encode_speed = 0.0
+        self.encode_fps = 0.0
+    
+    def observe_job(self, result):
+        metrics = result.get('metrics') or {}
+        status = 'success' if result.get('success') else 'failure'
+        with self.lock:
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+            if result.get('render_path'):
+                path = result['render_path']
+                self.render_paths[path] = self.render_paths.get(path, 0) + 1
+            for stage, seconds in metrics.get('stages', {}).items():
+                buckets = self.stage_buckets.setdefault(stage, [0] * len(STAGE_BUCKETS))
+                for i, bound in enumerate(STAGE_BUCKETS):
+                    if seconds <= bound:
+                        buckets[i] += 1
+                self.stage_sums[stage] = self.stage_sums.get(stage, 0) + seconds
+                self.stage_counts[stage] = self.stage_counts.get(stage, 0) + 1
+            self.bytes_downloaded += metrics.get('bytes_downloaded', 0)
+            self.bytes_uploaded += metrics.get('bytes_uploaded', 0)
+            self.download_retries += sum(a.get('retries', 0) for a in metrics.get('assets', {}).values())
+            encode = metrics.get('encode', {})
+            self.encode_speed = encode.get('speed') or self.encode_speed
+            self.encode_fps = encode.get('fps') or self.encode_fps
+    
+    def render(self, encoder=None, scratch=None):
+        with self.lock:
+            lines = [
+                '# HELP coach_joe_jobs_total Processed jobs by outcome',
+                '# TYPE coach_joe_jobs_total counter',
+            ]
+            for status, count in self.jobs.items():
+                lines.append(f'coach_joe_jobs_total{{status="{status}"}} {count}')
+            
+            lines += [
+                '# HELP coach_joe_render_path_total Rendered jobs by render path',
+                '# TYPE coach_joe_render_path_total counter',
+            ]
+            for path, count in self.render_paths.items():
+                lines.append(f'coach_joe_render_path_total{{path="{path}"}} {count}')
+            
+            lines += [
+                '# HELP coach_joe_stage_seconds Time spent per processing stage',
+                '# TYPE coach_joe_stage_seconds histogram',
+            ]
+            for stage, buckets in self.stage_buckets.items():
+                for bound, count in zip(STAGE_BUCKETS, buckets):
+                    lines.append(f'coach_joe_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'coach_joe_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {self.stage_counts[stage]}')
+                lines.append(f'coach_joe_stage_seconds_sum{{stage="{stage}"}} {self.stage_sums[stage]:.3f}')
+                lines.append(f'coach_joe_stage_seconds_count{{stage="{stage}"}} {self.stage_counts[stage]}')
+            
+            lines += [
+                '# HELP coach_joe_bytes_downloaded_total Bytes fetched from asset storage',
+                '# TYPE coach_joe_bytes_downloaded_total counter',
+                f'coach_joe_bytes_downloaded_total {self.bytes_downloaded}',
+                '# HELP coach_joe_bytes_uploaded_total Bytes uploaded to output storage',
+                '# TYPE coach_joe_bytes_uploaded_total counter',
+                f'coach_joe_bytes_uploaded_total {self.bytes_uploaded}',
+                '# HELP coach_joe_download_retries_total Asset download attempts that were retried',
+                '# TYPE coach_joe_download_retries_total counter',
+                f'coach_joe_download_retries_total {self.download_retries}',
+                '# HELP coach_joe_encode_speed Last encode speed as a multiple of realtime',
+                '# TYPE coach_joe_encode_speed gauge',
+                f'coach_joe_encode_speed {self.encode_speed}',
+                '# HELP coach_joe_encode_fps Last encode frames per second',
+                '# TYPE coach_joe_encode_fps gauge',
+                f'coach_joe_encode_fps {self.encode_fps}',
+            ]
+            
+            if encoder:
+                lines += [
+                    '# HELP coach_joe_encode_queue_depth Encodes waiting for CPU/memory budget',
+                    '# TYPE coach_joe_encode_queue_depth gauge',
+                    f"coach_joe_encode_queue_depth {encoder['queued']}",
+                    '# HELP coach_joe_encode_running Encodes currently running',
+                    '# TYPE coach_joe_encode_running gauge',
+                    f"coach_joe_encode_running {encoder['running']}",
+                    '# HELP coach_joe_encode_cpus_in_use Encoder threads reserved by running encodes',
+                    '# TYPE coach_joe_encode_cpus_in_use gauge',
+                    f"coach_joe_encode_cpus_in_use {encoder['cpus_in_use']}",
+                    '# HELP coach_joe_encode_wait_seconds Time encodes waited for admission',
+                    '# TYPE coach_joe_encode_wait_seconds summary',
+                    f"coach_joe_encode_wait_seconds_sum {encoder['wait_seconds_total']:.3f}",
+                    f"coach_joe_encode_wait_seconds_count {encoder['admitted_total']}",
+                ]
+            
+            if scratch:
+                lines += [
+                    '# HELP coach_joe_scratch_in_use_bytes Scratch space reserved by running jobs',
+                    '# TYPE coach_joe_scratch_in_use_bytes gauge',
+                    f"coach_joe_scratch_in_use_bytes{{location=\"tmpfs\"}} {scratch['tmpfs_in_use_bytes']}",
+                    f"coach_joe_scratch_in_use_bytes{{location=\"disk\"}} {scratch['disk_in_use_bytes']}",
+                    '# HELP coach_joe_scratch_queue_depth Jobs waiting for scratch space',
+                    '# TYPE coach_joe_scratch_queue_depth gauge',
+                    f"coach_joe_scratch_queue_depth {scratch['queued']}",
+                    '# HELP coach_joe_scratch_rejected_total Jobs rejected for exceeding the scratch limit',
+                    '# TYPE coach_joe_scratch_rejected_total counter',
+                    f"coach_joe_scratch_rejected_total {scratch['rejected_total']}",
+                ]
+            return '\n'.join(lines) + '\n'
+
+prometheus_metrics = PrometheusMetrics()
+
+# Background job queue for the Flask /jobs API
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', str(os.cpu_count() or 1)))
+JOB_BACKLOG_LIMIT = int(os.getenv('JOB_BACKLOG_LIMIT', '20'))
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '3600'))  # seconds to keep finished jobs
+JOB_RESULT_LIMIT = int(os.getenv('JOB_RESULT_LIMIT', '100'))  # most finished jobs kept
+
+def handler(event, on_progress=None, cancel_event=None):
     """
     RunPod serverless handler for video processing
     
+    on_progress and cancel_event are passed through to the processor
+    (used by the /jobs queue for live progress and cancellation).
+    
     Expected input format:
     {
         "audio_url": "https://...",
@@ -25,10 +163,16 @@ def handler(event):
         "video_volume_reduction": 90,
         "output_duration_extra": 1
     }
+    
+    Batch format (shared downloads, one FFmpeg run per shared background):
+    {
+        "configs": [{"audio_url": "https://...", ...}, ...],
+        "max_concurrency": 2
+    }
     """
     
     logger.info("Starting RunPod FFmpeg processing...")
-    logger.info(f"Event: {json.dumps(event, indent=2)}")
+    logger.info(f"Event: {json.dumps(redact_payloads(event), indent=2)}")
     
     # Handle health check requests
     if event.get('input', {}).get('health_check'):
@@ -40,19 +184,29 @@ def handler(event):
             'timestamp': datetime.now().isoformat()
         }
     
-    processor = CoachJoeVideoProcessor()
+    # Shared warm processor; each job cleans up its own workspace
+    processor = get_processor()
     
     try:
         # Validate required input
         input_data = event.get('input', {})
-        if not input_data.get('audio_url'):
-            raise ValueError("audio_url is required")
+        if 'configs' in input_data:
+            # Batch of videos sharing downloads and, where possible, FFmpeg runs
+            result = processor.process_batch(input_data['configs'], input_data.get('max_concurrency'),
+                                             on_progress=on_progress, cancel_event=cancel_event)
+        else:
+            if not input_data.get('audio_url'):
+                raise ValueError("audio_url is required")
+            
+            # Process the video
+            result = processor.process_video(input_data, on_progress=on_progress, cancel_event=cancel_event)
         
-        # Process the video
-        result = processor.process_video(input_data)
+        if PROMETHEUS_METRICS:
+            prometheus_metrics.observe_job(result)
         
         logger.info("Processing completed successfully")
-        logger.info(f"Result: {json.dumps(result, indent=2)}")
+        # Inline video_data would otherwise be logged in full
+        logger.info(f"Result: {json.dumps(redact_payloads(result), indent=2)}")
         
         return result
         
@@ -63,41 +217,223 @@ def handler(event):
             'error': str(e),
             'timestamp': datetime.now().isoformat()
         }
+
+class JobQueue:
+    """
+    Runs handler() on a bounded worker pool and tracks job status
+    
+    At most `workers` jobs encode at once; up to `backlog_limit` more wait in
+    the queue. submit() returns None when the backlog is full. Running jobs
+    report FFmpeg progress in their status, and cancel() stops a queued job
+    before it starts or a running one mid-encode.
+    
+    Finished jobs are kept for `result_ttl` seconds, at most `result_limit`
+    of them. Jobs asking for video_data keep their output as a file
+    (listed under 'embed') that is encoded into each status response, so
+    no base64 video is held in memory.
+    """
+    
+    def __init__(self, workers=JOB_WORKERS, backlog_limit=JOB_BACKLOG_LIMIT, result_ttl=JOB_RESULT_TTL,
+                 result_limit=JOB_RESULT_LIMIT):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='coach-joe-job')
+        self.workers = workers
+        self.backlog_limit = backlog_limit
+        self.result_ttl = result_ttl
+        self.result_limit = result_limit
+        self.jobs = {}
+        self.cancel_events = {}
+        self.lock = threading.Lock()
+    
+    def submit(self, input_data):
+        with self.lock:
+            self._expire()
+            if self._count('queued') >= self.backlog_limit:
+                return None
+            job_id = uuid.uuid4().hex
+            job = {
+                'job_id': job_id,
+                'status': 'queued',
+                'submitted_at': datetime.now().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+                'progress': None,
+                'result': None
+            }
+            self.jobs[job_id] = job
+            self.cancel_events[job_id] = threading.Event()
+            accepted = dict(job)
+        self.executor.submit(self._run, job_id, input_data)
+        return accepted
+    
+    def get(self, job_id):
+        with self.lock:
+            self._expire()
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            job = dict(job)
+            if job['status'] == 'queued':
+                queued = [j for j in self.jobs.values() if j['status'] == 'queued']
+                job['queue_position'] = sorted(queued, key=lambda j: j['submitted_at']).index(self.jobs[job_id]) + 1
+            return job
+    
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns its status, or None if unknown"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            if job['status'] == 'queued':
+                job.update(status='cancelled', finished_at=datetime.now().isoformat(), finished=time.time())
+            elif job['status'] == 'running':
+                job['status'] = 'cancelling'
+            else:
+                return job['status']
+            self.cancel_events[job_id].set()
+            return job['status']
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'queued': self._count('queued'),
+                'running': self._count('running') + self._count('cancelling'),
+                'backlog_limit': self.backlog_limit
+            }
     
-    finally:
-        # Clean up temporary files
-        processor.cleanup()
+    def _run(self, job_id, input_data):
+        with self.lock:
+            cancel_event = self.cancel_events[job_id]
+            if cancel_event.is_set():
+                return  # Cancelled while queued
+            self.jobs[job_id].update(status='running', started_at=datetime.now().isoformat())
+        
+        def on_progress(progress):
+            self._update(job_id, progress=progress)
+        
+        embed = []
+        try:
+            input_data, pick = prepare_streamed_response(input_data)
+            result = handler({"input": input_data}, on_progress=on_progress, cancel_event=cancel_event)
+            embed = pick(result)
+        except Exception as e:
+            result = {'success': False, 'error': str(e), 'timestamp': datetime.now().isoformat()}
+        if cancel_event.is_set():
+            status = 'cancelled'
+        else:
+            status = 'completed' if result.get('success') else 'failed'
+        with self.lock:
+            self.jobs[job_id].update(
+                status=status,
+                finished_at=datetime.now().isoformat(),
+                finished=time.time(),
+                result=result,
+                embed=embed
+            )
+            self._expire()
+    
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+    
+    def _count(self, status):
+        return sum(1 for job in self.jobs.values() if job['status'] == status)
+    
+    def _expire(self):
+        """Forget finished jobs older than the result TTL, and the oldest beyond the result limit"""
+        cutoff = time.time() - self.result_ttl
+        finished = sorted((job['finished'], job_id) for job_id, job in self.jobs.items() if 'finished' in job)
+        expired = [job_id for stamp, job_id in finished if stamp < cutoff]
+        kept = len(finished) - len(expired)
+        expired.extend(job_id for _, job_id in finished[len(expired):][:max(0, kept - self.result_limit)])
+        for job_id in expired:
+            release_response_files(self.jobs.pop(job_id).get('embed') or [])
+            del self.cancel_events[job_id]
 
 # Health check endpoint for container
 def health_check():
     """Simple health check"""
     return {"status": "healthy", "service": "coach-joe-ffmpeg"}
 
+def create_app():
+    """Flask app for local testing and self-hosted deployments"""
+    from flask import Flask, Response, request, jsonify, url_for
+    
+    app = Flask(__name__)
+    job_queue = JobQueue()
+    
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({**health_check(), 'jobs': job_queue.stats(), 'encoder': get_processor().scheduler.stats(),
+                        'scratch': get_processor().scratch.stats()})
+    
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if not PROMETHEUS_METRICS:
+            return jsonify({"error": "Metrics are disabled (set PROMETHEUS_METRICS=true)"}), 404
+        return prometheus_metrics.render(get_processor().scheduler.stats(), get_processor().scratch.stats()), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+    
+    @app.route('/process', methods=['POST'])
+    def process():
+        try:
+            # video_data is streamed from the kept output file into the
+            # response body rather than built as one string
+            data, pick = prepare_streamed_response(request.json)
+            result = handler({"input": data})
+            responses = pick(result)
+            if not responses:
+                return jsonify(result)
+            
+            return Response(stream_response_json(result, responses), mimetype='application/json')
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+    
+    @app.route('/jobs', methods=['POST'])
+    def submit_job():
+        data = request.get_json(silent=True)
+        if not data or not (data.get('audio_url') or data.get('configs')):
+            return jsonify({"success": False, "error": "audio_url (or configs for a batch) is required"}), 400
+        
+        job = job_queue.submit(data)
+        if job is None:
+            return jsonify({"success": False, "error": "Job backlog is full, retry later"}), 429, {'Retry-After': '30'}
+        
+        job['status_url'] = url_for('get_job', job_id=job['job_id'])
+        return jsonify(job), 202
+    
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+        job.pop('finished', None)
+        # A kept output is encoded into the body as it is sent (until the
+        # worker removes it after RESPONSE_FILE_TTL)
+        embed = [response for response in job.pop('embed', None) or [] if os.path.exists(response['video_file'])]
+        if not embed:
+            return jsonify(job)
+        return Response(iter_response_json(job, embed), mimetype='application/json')
+    
+    @app.route('/jobs/<job_id>', methods=['DELETE'])
+    def cancel_job(job_id):
+        status = job_queue.cancel(job_id)
+        if status is None:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+        if status not in ('cancelled', 'cancelling'):
+            return jsonify({"success": False, "error": f"Job already {status}", "status": status}), 409
+        return jsonify({"success": True, "job_id": job_id, "status": status}), 202
+    
+    app.job_queue = job_queue
+    return app
+
 if __name__ == "__main__":
     # Check if running in RunPod environment
-    import os
     if os.getenv("RUNPOD_ENDPOINT_ID"):
         logger.info("Starting RunPod serverless handler...")
         runpod.serverless.start({"handler": handler})
     else:
         # Run as Flask app for local testing
-        from flask import Flask, request, jsonify
-        
-        app = Flask(__name__)
-        
-        @app.route('/health', methods=['GET'])
-        def health():
-            return jsonify(health_check())
-        
-        @app.route('/process', methods=['POST'])
-        def process():
-            try:
-                data = request.json
-                event = {"input": data}
-                result = handler(event)
-                return jsonify(result)
-            except Exception as e:
-                return jsonify({"success": False, "error": str(e)}), 500
+        app = create_app()
         
         logger.info("Starting Flask app for local testing...")
-        app.run(host='0.0.0.0', port=8080, debug=True) 
+        app.run(host='0.0.0.0', port=8080, debug=True)
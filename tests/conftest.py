@@ -0,0 +1,51 @@
+"""
+Shared fixtures: an isolated scratch/cache root, synthetic media served over
+HTTP by the benchmark stand-in, and a processor that uses both
+"""
+
+import os
+import sys
+import tempfile
+
+# Module-level settings are read at import, so point every cache and scratch
+# directory at a throwaway root before the processor module is loaded
+TEST_ROOT = tempfile.mkdtemp(prefix='coach_joe_tests_')
+for name in ('TEMP_DIR', 'TMPFS_DIR', 'ASSET_CACHE_DIR', 'NORMALIZED_CACHE_DIR', 'RENDER_CACHE_DIR'):
+    os.environ[name] = os.path.join(TEST_ROOT, name.lower())
+    os.makedirs(os.environ[name], exist_ok=True)
+os.environ['UPLOAD_MODE'] = 'none'
+os.environ.pop('SUPABASE_SERVICE_KEY', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from benchmarks.fixtures import generate_fixtures
+from benchmarks.server import FixtureServer
+from coach_joe_ffmpeg_processor import CoachJoeVideoProcessor
+
+
+@pytest.fixture(scope='session')
+def media_dir():
+    directory = os.path.join(TEST_ROOT, 'media')
+    generate_fixtures(directory, duration=3)
+    return directory
+
+
+@pytest.fixture(scope='session')
+def fixture_server(media_dir):
+    server = FixtureServer(media_dir).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope='session')
+def media_url(fixture_server, media_dir):
+    """URL of a file in the media directory"""
+    return lambda name: fixture_server.url(os.path.join(media_dir, name))
+
+
+@pytest.fixture
+def processor():
+    processor = CoachJoeVideoProcessor()
+    yield processor
+    processor.cleanup()
@@ -0,0 +1,24 @@
+"""
+Batch configs: options a batch cannot honor are rejected, not ignored
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize('option', [
+    {'output_format': 'hls'},
+    {'stream_inputs': True},
+    {'timeout': 30},
+    {'cpu_limit': 10},
+])
+def test_unsupported_member_options_fail_the_batch(processor, media_url, option):
+    configs = [
+        {'audio_url': media_url('voice.mp3'), 'video_urls': [media_url('broll.mp4')]},
+        {'audio_url': media_url('voice.mp3'), 'video_urls': [media_url('broll.mp4')], **option},
+    ]
+
+    result = processor.process_batch(configs)
+
+    assert not result['success']
+    assert result['error'].startswith('configs[1]: ' + next(iter(option)))
+    assert 'download' not in result['metrics']['stages']
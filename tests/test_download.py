@@ -0,0 +1,92 @@
+"""
+Resumable downloads against the benchmark storage stand-in
+"""
+
+import hashlib
+import io
+import os
+
+import pytest
+import requests
+
+import coach_joe_ffmpeg_processor
+from coach_joe_ffmpeg_processor import download_stream
+
+
+class DroppingSession(requests.Session):
+    """Cuts the first transfer off after `cut` bytes, calling on_drop before the retry"""
+
+    def __init__(self, cut, on_drop=None):
+        super().__init__()
+        self.cut = cut
+        self.on_drop = on_drop
+        self.requests = []
+        self.validators = []
+
+    def get(self, url, **kwargs):
+        self.requests.append(dict(kwargs.get('headers') or {}))
+        response = super().get(url, **kwargs)
+        self.validators.append(response.headers.get('Last-Modified'))
+        if len(self.requests) == 1:
+            chunks = response.iter_content
+
+            def iter_content(chunk_size=1):
+                yield next(chunks(chunk_size=self.cut))
+                if self.on_drop:
+                    self.on_drop()
+                raise requests.exceptions.ChunkedEncodingError('connection dropped')
+            response.iter_content = iter_content
+        return response
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(coach_joe_ffmpeg_processor, 'DOWNLOAD_BACKOFF', 0)
+
+
+@pytest.fixture
+def served_file(media_dir):
+    path = os.path.join(media_dir, 'download.bin')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(256 * 1024))
+    yield path
+    os.remove(path)
+
+
+def test_dropped_transfer_resumes_with_a_guarded_range(served_file, fixture_server):
+    session = DroppingSession(cut=100_000)
+    f = io.BytesIO()
+    stats = {}
+
+    response, digest, size = download_stream(session, fixture_server.url(served_file), f, stats=stats)
+
+    with open(served_file, 'rb') as original:
+        content = original.read()
+    assert f.getvalue() == content
+    assert (digest, size) == (hashlib.sha256(content).hexdigest(), len(content))
+    assert response.status_code == 206
+    assert stats == {'retries': 1, 'resumed_bytes': 100_000}
+    assert session.requests[1]['Range'] == 'bytes=100000-'
+    assert session.requests[1]['If-Range'] == session.validators[0]
+
+
+def test_object_changed_before_resume_is_downloaded_again(served_file, fixture_server):
+    replacement = os.urandom(200 * 1024)
+
+    def replace():
+        with open(served_file, 'wb') as f:
+            f.write(replacement)
+        stat = os.stat(served_file)
+        os.utime(served_file, (stat.st_atime, stat.st_mtime + 10))
+
+    session = DroppingSession(cut=100_000, on_drop=replace)
+    f = io.BytesIO()
+    stats = {}
+
+    response, digest, size = download_stream(session, fixture_server.url(served_file), f, stats=stats)
+
+    assert 'If-Range' in session.requests[1]
+    assert response.status_code == 200
+    assert f.getvalue() == replacement
+    assert (digest, size) == (hashlib.sha256(replacement).hexdigest(), len(replacement))
+    assert stats['resumed_bytes'] == 0
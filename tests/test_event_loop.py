@@ -0,0 +1,44 @@
+"""FFmpeg steps must work when the caller already runs an event loop (RunPod's run_job does)"""
+
+import asyncio
+import json
+
+import pytest
+
+
+def job(media_url):
+    return {
+        'audio_url': media_url('voice.mp3'),
+        'video_urls': [media_url('broll.mp4')],
+        'upload_mode': 'none',
+        'response_mode': 'file',
+        'bypass_render_cache': True,
+    }
+
+
+def test_run_ffmpeg_inside_running_loop(processor):
+    async def main():
+        return processor.run_ffmpeg(['ffmpeg', '-f', 'lavfi', '-i', 'anullsrc', '-t', '0.1', '-f', 'null', '-'])
+    
+    returncode, _ = asyncio.run(main())
+    assert returncode == 0
+
+
+def test_process_video_inside_running_loop(processor, media_url):
+    async def main():
+        return processor.process_video(job(media_url))
+    
+    result = asyncio.run(main())
+    assert result['success'], result.get('error')
+
+
+def test_runpod_handler_inside_running_loop(media_url):
+    pytest.importorskip('runpod')
+    import runpod_handler
+    
+    async def run_job():
+        # runpod.serverless calls the sync handler from its own loop
+        return runpod_handler.handler({'input': job(media_url)})
+    
+    result = asyncio.run(run_job())
+    assert result['success'], json.dumps(result.get('error'))
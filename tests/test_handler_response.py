@@ -0,0 +1,32 @@
+"""
+Cloud function handler responses are plain JSON strings
+"""
+
+import base64
+import json
+import os
+
+import coach_joe_ffmpeg_processor
+from coach_joe_ffmpeg_processor import handler
+
+
+def test_embedded_video_body_is_a_string_and_file_is_released(media_url, monkeypatch):
+    released = []
+    release = coach_joe_ffmpeg_processor.release_response_files
+    monkeypatch.setattr(coach_joe_ffmpeg_processor, 'release_response_files',
+                        lambda responses: released.extend(r['video_file'] for r in responses) or release(responses))
+
+    response = handler({
+        'audio_url': media_url('voice.mp3'),
+        'video_urls': [media_url('broll.mp4')],
+        'upload_mode': 'none',
+        'include_video_data': True,
+        'bypass_render_cache': True,
+    })
+
+    assert response['statusCode'] == 200
+    assert isinstance(response['body'], str)
+    result = json.loads(response['body'])
+    assert base64.b64decode(result['video_data'])[4:8] == b'ftyp'
+    assert result.get('video_file') is None
+    assert released and not any(os.path.exists(path) for path in released)
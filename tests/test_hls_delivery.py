@@ -0,0 +1,26 @@
+"""
+HLS outputs are only reported as delivered when every upload succeeded
+"""
+
+import pytest
+
+from coach_joe_ffmpeg_processor import JobMetrics
+
+
+def streamed(error=None):
+    return {'uploaded': error is None, 'bytes': 1000, 'segments': 3, 'first_segment_seconds': 0.5, 'error': error}
+
+
+def test_failed_segment_upload_fails_the_job(processor):
+    with pytest.raises(Exception, match='Segment upload failed: 503'):
+        processor.deliver_stream('/scratch/job/playlist.m3u8', 6.0, {}, JobMetrics(), 'standard',
+                                 streamed('503 Server Error'))
+
+
+def test_uploaded_stream_reports_the_playlist(processor):
+    metrics = JobMetrics()
+    result = processor.deliver_stream('/scratch/job/playlist.m3u8', 6.0, {}, metrics, 'standard', streamed())
+
+    assert result['success'] and result['upload_ready'] and result['uploaded']
+    assert result['video_url'].endswith('/job/playlist.m3u8')
+    assert metrics.bytes_uploaded == 1000
@@ -0,0 +1,28 @@
+"""
+Per-job controls on FFmpeg processes
+"""
+
+import threading
+
+from coach_joe_ffmpeg_processor import JobMetrics, JobTimeout
+
+# Encodes far longer than any test should take
+ENDLESS = ['ffmpeg', '-f', 'lavfi', '-i', 'testsrc2=size=1280x720', '-t', '3600', '-c:v', 'libx264', '-f', 'null', '-']
+
+
+def test_cpu_limit_stops_ffmpeg_started_from_a_worker_thread(processor):
+    outcome = {}
+
+    def run():
+        try:
+            processor.run_ffmpeg(ENDLESS, JobMetrics(cpu_limit=1, timeout=60))
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join(60)
+
+    assert not thread.is_alive()
+    assert isinstance(outcome.get('error'), JobTimeout)
+    assert 'CPU limit' in str(outcome['error'])
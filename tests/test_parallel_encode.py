@@ -0,0 +1,39 @@
+"""
+Segment-parallel encodes: the audio premix never waits for a slice slot
+"""
+
+import os
+import threading
+import time
+
+from coach_joe_ffmpeg_processor import JobMetrics
+
+
+def test_premix_runs_beside_every_slice(processor, media_dir, tmp_path, monkeypatch):
+    lock = threading.Lock()
+    running = {'now': 0, 'peak': 0}
+
+    def busy():
+        with lock:
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+        time.sleep(0.3)
+        with lock:
+            running['now'] -= 1
+
+    monkeypatch.setattr(processor, 'run_ffmpeg', lambda cmd, metrics=None, report_progress=True: busy() or (0, ''))
+
+    def premix():
+        busy()
+        return str(tmp_path / 'audio.m4a')
+
+    video = os.path.join(media_dir, 'broll.mp4')
+    metrics = JobMetrics()
+    processor.encode_parallel(
+        os.path.join(media_dir, 'voice.mp3'), [video], [processor.probe_media(video)], [], [],
+        str(tmp_path / 'out.mp4'), 8.0, 90, False, 'standard', str(tmp_path), metrics, workers=2, premix=premix
+    )
+
+    assert metrics.encode['parallel']['segments'] == 2
+    assert metrics.encode['parallel']['workers'] == 2
+    assert running['peak'] == 3
@@ -0,0 +1,56 @@
+"""
+In-memory probe/hash caches: remote sources are never served stale and
+every cache stays bounded
+"""
+
+import os
+import shutil
+import subprocess
+
+from coach_joe_ffmpeg_processor import MemoCache
+
+
+def write_tone(path, duration):
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+                    '-c:a', 'libmp3lame', '-b:a', '64k', path], check=True)
+
+
+def test_memo_cache_evicts_least_recently_used():
+    cache = MemoCache(max_entries=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1  # 'b' is now the oldest
+    cache['c'] = 3
+
+    assert len(cache) == 2
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.get('b', 'missing') == 'missing'
+
+
+def test_remote_probe_sees_new_content_at_same_url(processor, media_dir, media_url):
+    name = 'swapped.mp3'
+    path = os.path.join(media_dir, name)
+    write_tone(path, 2)
+    try:
+        assert abs(processor.probe_media(media_url(name))['duration'] - 2) < 0.2
+
+        write_tone(path + '.new.mp3', 5)
+        os.replace(path + '.new.mp3', path)
+        assert abs(processor.probe_media(media_url(name))['duration'] - 5) < 0.2
+    finally:
+        os.remove(path)
+
+
+def test_local_probes_are_memoized_and_bounded(processor, media_dir, tmp_path):
+    processor.probe_cache = MemoCache(max_entries=1)
+    first = str(tmp_path / 'first.mp3')
+    shutil.copy(os.path.join(media_dir, 'voice.mp3'), first)
+    second = str(tmp_path / 'second.mp4')
+    shutil.copy(os.path.join(media_dir, 'broll.mp4'), second)
+
+    info = processor.probe_media(first)
+    assert processor.probe_media(first) is info
+    processor.probe_media(second)
+    assert len(processor.probe_cache) == 1
+    assert processor.content_hash(first) not in processor.probe_cache
@@ -0,0 +1,84 @@
+"""
+Encode admission control: thread shares, budget checks and FIFO waiting
+"""
+
+import threading
+import time
+
+import pytest
+
+from coach_joe_ffmpeg_processor import EncodeScheduler, JobCancelled, JobMetrics
+
+
+@pytest.fixture
+def scheduler():
+    return EncodeScheduler(cpu_budget=8, memory_budget_mb=2000, memory_per_encode_mb=600, min_threads=2)
+
+
+def test_fixed_thread_count_is_capped_at_the_budget(scheduler):
+    assert scheduler.threads_for(4) == 4
+    assert scheduler.threads_for(32) == 8
+
+
+def test_lone_encode_gets_the_whole_budget(scheduler):
+    assert scheduler.threads_for(None) == 8
+
+
+def test_share_splits_the_budget_over_running_and_queued_encodes(scheduler):
+    scheduler.running, scheduler.cpus_in_use = 1, 4
+    scheduler.waiting.append(object())
+    assert scheduler.threads_for(None) == 4
+
+    # Only what is still free, but never below min_threads
+    scheduler.cpus_in_use = 7
+    assert scheduler.threads_for(None) == 2
+
+
+def test_lone_encode_always_fits(scheduler):
+    scheduler.memory_budget_mb = 100
+    assert scheduler.fits(64)
+
+
+def test_fits_checks_cpus_and_memory(scheduler):
+    scheduler.running, scheduler.cpus_in_use, scheduler.memory_in_use_mb = 1, 4, 600
+    assert scheduler.fits(4)
+    assert not scheduler.fits(5)
+
+    scheduler.memory_in_use_mb = 1500
+    assert not scheduler.fits(1)
+
+
+def test_encode_that_does_not_fit_waits_for_a_release(scheduler):
+    admitted = []
+    release = threading.Event()
+
+    def first():
+        with scheduler.reserve(cpus=6) as threads:
+            admitted.append(('first', threads))
+            release.wait(5)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    while not admitted:
+        time.sleep(0.01)
+
+    threading.Timer(0.3, release.set).start()
+    started = time.perf_counter()
+    with scheduler.reserve(cpus=4) as threads:
+        admitted.append(('second', threads))
+        assert scheduler.running == 1
+    thread.join()
+
+    assert admitted == [('first', 6), ('second', 4)]
+    assert time.perf_counter() - started >= 0.25
+    assert scheduler.stats()['admitted_total'] == 2
+
+
+def test_cancelled_job_leaves_the_queue(scheduler):
+    cancel = threading.Event()
+    with scheduler.reserve(cpus=8):
+        threading.Timer(0.2, cancel.set).start()
+        with pytest.raises(JobCancelled):
+            with scheduler.reserve(JobMetrics(cancel_event=cancel), cpus=8):
+                pass
+        assert not scheduler.waiting
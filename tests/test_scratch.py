@@ -0,0 +1,74 @@
+"""
+Scratch space accounting: inputs are charged to disk, counted once, and
+reserved before anything is downloaded
+"""
+
+import os
+
+import pytest
+
+from coach_joe_ffmpeg_processor import ScratchSpace
+
+
+@pytest.fixture
+def scratch(tmp_path):
+    disk, tmpfs = tmp_path / 'disk', tmp_path / 'tmpfs'
+    disk.mkdir()
+    tmpfs.mkdir()
+    space = ScratchSpace(str(disk), str(tmpfs), budget_bytes=10_000, tmpfs_budget_bytes=100,
+                         job_max_bytes=5_000, tmpfs_job_max_bytes=100)
+    space.free_space = {str(disk): 10_000, str(tmpfs): 1_000}
+    space.free_bytes = lambda path: space.free_space[path]
+    yield space
+    space.cleanup()
+
+
+def test_inputs_are_charged_to_disk_even_when_scratch_is_on_tmpfs(scratch):
+    directory = scratch.allocate('job', 50, input_bytes=3_000)
+
+    assert directory.startswith(scratch.tmpfs_parent)
+    assert scratch.in_use == {'tmpfs': 50, 'disk': 3_000}
+    scratch.release('job')
+    assert scratch.in_use == {'tmpfs': 0, 'disk': 0}
+
+
+def test_large_inputs_do_not_need_room_on_tmpfs(scratch):
+    scratch.free_space[scratch.tmpfs_parent] = 60
+
+    assert scratch.place(50, input_bytes=3_000) == 'tmpfs'
+    assert scratch.place(50, input_bytes=20_000) is None
+
+
+def test_downloaded_inputs_are_not_counted_twice(scratch):
+    scratch.reserve_inputs('first', 4_000)
+    assert scratch.place(0, input_bytes=4_000) == 'disk'
+    assert scratch.place(0, input_bytes=7_000) is None
+
+    # The download lands: disk_usage now reports the inputs as used
+    scratch.free_space[scratch.disk_root] -= 4_000
+    assert scratch.place(0, input_bytes=6_000) is None
+    scratch.settle_inputs('first')
+    assert scratch.place(0, input_bytes=6_000) == 'disk'
+
+    scratch.release('first')
+    assert scratch.inputs_written == 0
+
+
+def test_job_over_the_limit_is_rejected_before_downloading(processor, media_url):
+    processor.scratch.job_max_bytes = 1024
+    asset_dir = os.path.join(processor.asset_cache.cache_dir, 'objects') if processor.asset_cache else None
+    cached = set(os.listdir(asset_dir)) if asset_dir else set()
+
+    result = processor.process_video({
+        'audio_url': media_url('voice.mp3'),
+        'video_urls': [media_url('broll.mp4')],
+        'upload_mode': 'none',
+        'response_mode': 'file',
+        'bypass_render_cache': True,
+    })
+
+    assert not result['success']
+    assert 'scratch space' in result['error']
+    assert 'download' not in result['metrics']['stages']
+    if asset_dir:
+        assert set(os.listdir(asset_dir)) == cached
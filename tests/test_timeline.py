@@ -0,0 +1,101 @@
+"""
+Timeline planning: clip sequencing, slicing for parallel encodes and the
+inputs the background graph reads
+"""
+
+import pytest
+
+from coach_joe_ffmpeg_processor import MIN_CLIP_SECONDS
+
+HORIZONTAL = {'duration': 2.0, 'width': 1920, 'height': 1080, 'has_audio': True}
+VERTICAL = {'duration': 10.0, 'width': 720, 'height': 1280, 'has_audio': False}
+
+
+def total(segments):
+    return round(sum(segment['duration'] for segment in segments), 3)
+
+
+def test_single_clip_covers_the_timeline(processor):
+    assert processor.sequence_clips(9.5, [3.0]) == [{'clip': 0, 'source_start': 0, 'duration': 9.5}]
+
+
+def test_clips_shorter_than_the_audio_repeat_and_continue_where_they_stopped(processor):
+    segments = processor.sequence_clips(20, [2.0, 3.0])
+
+    assert total(segments) == 20
+    assert [segment['clip'] for segment in segments] == [0, 1] * 4
+    assert all(segment['duration'] >= MIN_CLIP_SECONDS for segment in segments[:-1])
+    # source_start runs on through the looped clip instead of restarting at 0
+    played = {0: 0, 1: 0}
+    for segment in segments:
+        assert segment['source_start'] == played[segment['clip']]
+        played[segment['clip']] += segment['duration']
+
+
+def test_short_clip_gets_at_least_the_minimum_share(processor):
+    segments = processor.sequence_clips(9, [0.5, 10.0])
+
+    assert segments[0] == {'clip': 0, 'source_start': 0, 'duration': MIN_CLIP_SECONDS}
+    assert total(segments) == 9
+
+
+def test_sub_frame_clips_are_skipped(processor):
+    assert processor.sequence_clips(9, [0.01, 5.0]) == [{'clip': 1, 'source_start': 0, 'duration': 9}]
+    assert processor.sequence_clips(9, [0.01, 0.02]) == []
+
+
+def test_unknown_clip_lengths_are_played(processor):
+    segments = processor.sequence_clips(9, [None, None])
+
+    assert [segment['clip'] for segment in segments] == [0, 1]
+    assert total(segments) == 9
+
+
+@pytest.mark.parametrize('windows', [
+    [(0, 6), (6, 12), (12, 20)],  # on segment boundaries
+    [(0, 5), (5, 11), (11, 20)],  # cutting through segments
+    [(0, 4.001), (4.001, 20)],  # just past a boundary
+])
+def test_slices_partition_the_timeline(processor, windows):
+    segments = processor.sequence_clips(20, [2.0, 3.0, None])
+    slices = [processor.slice_timeline(segments, start, end) for start, end in windows]
+
+    for (start, end), sliced in zip(windows, slices):
+        assert total(sliced) == pytest.approx(end - start, abs=0.002)
+        assert all(segment['duration'] > 0.001 for segment in sliced)
+    assert total([segment for sliced in slices for segment in sliced]) == 20
+
+
+def test_slice_moves_source_start_to_the_window(processor):
+    segments = processor.sequence_clips(9, [4.0, 10.0])
+
+    assert processor.slice_timeline(segments, 3, 6) == [
+        {'clip': 0, 'source_start': 3.0, 'duration': 1.0},
+        {'clip': 1, 'source_start': 0.0, 'duration': 2.0},
+    ]
+    assert processor.slice_timeline(segments, 9, 12) == []
+
+
+def test_slice_reads_one_bounded_input_from_the_window(processor):
+    cmd, filter_parts = ['ffmpeg'], []
+    labels = processor.timeline_filters(cmd, filter_parts, ['a.mp4', 'b.mp4'], [HORIZONTAL, VERTICAL], [],
+                                        12, False, window=(4, 8))
+
+    # Only the vertical clip plays in 4-8 s: seeked, bounded, used unscaled, and silent
+    assert cmd == ['ffmpeg', '-ss', '2', '-t', '4', '-i', 'b.mp4']
+    assert labels == ('[0:v]', None)
+    assert filter_parts == []
+
+
+def test_each_clip_is_one_input_looped_only_past_its_length(processor):
+    cmd, filter_parts = ['ffmpeg'], []
+    processor.timeline_filters(cmd, filter_parts, ['a.mp4', 'b.mp4'], [HORIZONTAL, VERTICAL], [], 12, False)
+    assert cmd == ['ffmpeg', '-t', '2', '-i', 'a.mp4', '-t', '10', '-i', 'b.mp4']
+
+    # 30 s of timeline shows a.mp4 for 6 s and b.mp4 for 24 s in alternating segments
+    cmd, filter_parts = ['ffmpeg'], []
+    processor.timeline_filters(cmd, filter_parts, ['a.mp4', 'b.mp4'], [HORIZONTAL, VERTICAL], [], 30, False)
+    assert cmd == ['ffmpeg', '-stream_loop', '-1', '-t', '6', '-i', 'a.mp4',
+                   '-stream_loop', '-1', '-t', '24', '-i', 'b.mp4']
+    assert any(part.startswith('[0:v]scale=720:1280') for part in filter_parts)
+    assert not any(part.startswith('[1:v]scale') for part in filter_parts)
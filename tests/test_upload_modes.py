@@ -0,0 +1,36 @@
+"""
+upload_mode 'none' only reports an upload target when the caller gets the output
+"""
+
+import os
+
+from coach_joe_ffmpeg_processor import JobMetrics
+
+
+def job(media_url, **options):
+    return {'audio_url': media_url('voice.mp3'), 'upload_mode': 'none', **options}
+
+
+def test_discarded_output_is_not_reported_as_upload_ready(processor, media_url):
+    result = processor.process_video(job(media_url))
+
+    assert result['success']
+    assert result['upload_ready'] is False and result['uploaded'] is False
+    assert result['video_url'] is None
+
+
+def test_kept_output_keeps_the_upload_target(processor, media_url):
+    result = processor.process_video(job(media_url, response_mode='file'))
+
+    try:
+        assert result['upload_ready'] is True and result['uploaded'] is False
+        assert result['video_url'].endswith(os.path.basename(result['video_file']))
+    finally:
+        os.remove(result['video_file'])
+
+
+def test_hls_output_that_was_not_uploaded_has_no_url(processor):
+    streamed = {'uploaded': False, 'bytes': 1000, 'segments': 3, 'first_segment_seconds': None, 'error': None}
+    result = processor.deliver_stream('/scratch/job/playlist.m3u8', 6.0, {}, JobMetrics(), 'standard', streamed)
+
+    assert result['upload_ready'] is False and result['video_url'] is None